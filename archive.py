@@ -0,0 +1,156 @@
+# archive.py
+import os
+import logging
+from datetime import timedelta
+from config import Config
+from database import get_connection
+from utils import user_now
+from backup import snapshot_lock
+
+logger = logging.getLogger(__name__)
+
+# Таблица -> (условие отбора устаревших строк, индексы в архиве)
+ARCHIVE_RULES = {
+    "tasks": (
+        "status='completed' AND day_iso < ?",
+        ["CREATE INDEX IF NOT EXISTS archive.idx_tasks_user_day ON tasks (user_id, day_iso)",
+         "CREATE INDEX IF NOT EXISTS archive.idx_tasks_chat_day ON tasks (chat_id, day_iso)"],
+    ),
+    "reminders": (
+        "sent=1 AND scheduled_iso < ?",
+        ["CREATE INDEX IF NOT EXISTS archive.idx_reminders_user ON reminders (user_id, scheduled_iso)",
+         "CREATE INDEX IF NOT EXISTS archive.idx_reminders_chat_time ON reminders (chat_id, scheduled_iso)"],
+    ),
+}
+
+def archive_cutoff_iso():
+    """Дата, старше которой завершённые записи переносятся в архив"""
+    return (user_now().date() - timedelta(days=Config.ARCHIVE_RETENTION_DAYS)).isoformat()
+
+def get_archive_connection():
+    """Соединение с основной базой и подключённым архивом"""
+    con = get_connection()
+    con.execute("ATTACH DATABASE ? AS archive", (Config.ARCHIVE_DB_PATH,))
+    return con
+
+def _sync_archive_schema(con, table):
+    """Создаёт архивную таблицу или добавляет в неё недостающие столбцы"""
+    main_cols = [(row[1], row[2]) for row in con.execute(f"PRAGMA main.table_info({table})")]
+    archive_cols = {row[1] for row in con.execute(f"PRAGMA archive.table_info({table})")}
+
+    if not archive_cols:
+        columns = ", ".join(
+            "id INTEGER PRIMARY KEY" if name == "id" else f"{name} {col_type}"
+            for name, col_type in main_cols
+        )
+        con.execute(f"CREATE TABLE archive.{table} ({columns})")
+    else:
+        for name, col_type in main_cols:
+            if name not in archive_cols:
+                con.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {col_type}")
+                if name == "chat_id":
+                    # Архивировано до появления групп — всё личное
+                    con.execute(f"UPDATE archive.{table} SET chat_id = user_id")
+
+    for sql in ARCHIVE_RULES[table][1]:
+        con.execute(sql)
+    con.commit()
+    return [name for name, _ in main_cols]
+
+def _move_chunk(con, table, columns, where, cutoff_iso):
+    """Переносит одну порцию строк в архив"""
+    ids = [row[0] for row in con.execute(
+        f"SELECT id FROM main.{table} WHERE {where} ORDER BY id LIMIT ?",
+        (cutoff_iso, Config.ARCHIVE_CHUNK_SIZE)
+    )]
+    if not ids:
+        return 0
+
+    placeholders = ",".join("?" * len(ids))
+    column_list = ", ".join(columns)
+    # В WAL транзакция по двум файлам не атомарна, поэтому сначала фиксируется копия
+    # в архиве, затем удаление: при сбое между ними строка останется в обеих базах и
+    # будет перенесена повторно (INSERT OR REPLACE), но не потеряется
+    with con:
+        con.execute(
+            f"INSERT OR REPLACE INTO archive.{table} ({column_list}) "
+            f"SELECT {column_list} FROM main.{table} WHERE id IN ({placeholders})",
+            ids
+        )
+    with con:
+        con.execute(f"DELETE FROM main.{table} WHERE id IN ({placeholders})", ids)
+    return len(ids)
+
+def archive_old_rows():
+    """Переносит завершённые задачи и отправленные напоминания в архивную базу"""
+    cutoff_iso = archive_cutoff_iso()
+    logger.info("Running archival for rows older than %s", cutoff_iso)
+    report = {"cutoff": cutoff_iso}
+
+    try:
+        con = get_archive_connection()
+        try:
+            con.execute("PRAGMA archive.journal_mode=WAL")
+            # Не переносим строки, пока backup.py снимает копии основной базы и архива
+            with snapshot_lock:
+                for table, (where, _) in ARCHIVE_RULES.items():
+                    columns = _sync_archive_schema(con, table)
+                    moved = 0
+                    while True:
+                        count = _move_chunk(con, table, columns, where, cutoff_iso)
+                        if not count:
+                            break
+                        moved += count
+                    report[table] = moved
+
+            con.commit()
+            # Возвращаем освободившиеся страницы файловой системе. Через execute прагма
+            # выполняет один шаг и освобождает одну страницу; executescript — до конца
+            page_size = con.execute("PRAGMA main.page_size").fetchone()[0]
+            free_before = con.execute("PRAGMA main.freelist_count").fetchone()[0]
+            con.executescript("PRAGMA main.incremental_vacuum;")
+            free_after = con.execute("PRAGMA main.freelist_count").fetchone()[0]
+            report["reclaimed_bytes"] = (free_before - free_after) * page_size
+            # В WAL файл базы укорачивается при контрольной точке; TRUNCATE заодно
+            # обнуляет журнал, выросший за время переноса
+            con.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+        finally:
+            con.close()
+    except Exception as e:
+        logger.error("Error in archival: %s", e, exc_info=True)
+        return None
+
+    logger.info(
+        "Archived %d tasks and %d reminders, reclaimed %d bytes",
+        report["tasks"], report["reminders"], report["reclaimed_bytes"]
+    )
+    return report
+
+def fetch_tasks_for_day(chat_id, day_iso):
+    """Задачи чата за день; для старых дат читает и из архива"""
+    if day_iso < archive_cutoff_iso() and os.path.exists(Config.ARCHIVE_DB_PATH):
+        con = get_archive_connection()
+        try:
+            archive_cols = {row[1] for row in con.execute("PRAGMA archive.table_info(tasks)")}
+            if archive_cols:
+                # Архив без chat_id ещё не синхронизирован после появления групп: в нём только личные задачи
+                archive_key = "chat_id" if "chat_id" in archive_cols else "user_id"
+                return con.execute(f"""
+                    SELECT description, status FROM (
+                        SELECT id, description, status FROM main.tasks WHERE chat_id=? AND day_iso=?
+                        UNION ALL
+                        SELECT id, description, status FROM archive.tasks WHERE {archive_key}=? AND day_iso=?
+                    ) ORDER BY id
+                """, (chat_id, day_iso, chat_id, day_iso)).fetchall()
+        finally:
+            con.close()
+
+    with get_connection() as con:
+        cur = con.cursor()
+        cur.execute("""
+            SELECT description, status
+            FROM tasks
+            WHERE chat_id=? AND day_iso=?
+            ORDER BY id
+        """, (chat_id, day_iso))
+        return cur.fetchall()
@@ -0,0 +1,181 @@
+# backup.py
+import os
+import sys
+import gzip
+import time
+import shutil
+import sqlite3
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Префикс снимка -> схема в соединении с основной базой и подключённым архивом.
+# Порядок важен: перенос в архив (archive.py) сначала фиксирует строку в архиве и
+# только потом удаляет её из основной базы, поэтому при снимке основной базы
+# раньше архива перенесённая в этот момент строка может оказаться в обоих
+# снимках (в архиве её перезапишет INSERT OR REPLACE), но не пропадёт из обоих
+BACKUP_SCHEMAS = {
+    "scheduler": "main",
+    "archive": "archive",
+}
+
+# Пока снимаются копии, archive_old_rows этого процесса строки не переносит
+snapshot_lock = threading.Lock()
+
+def _integrity_ok(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        con.close()
+
+def _copy_schemas(copies):
+    """Копирует схемы {схема: временный файл} одного соединения в одной транзакции чтения.
+
+    Базы работают в режиме WAL: транзакция чтения видит один момент времени и не
+    блокирует запись, поэтому обработчики не ждут копирования, а копия не
+    начинается заново из-за каждой записи. Шаги с паузами ограничивают нагрузку на диск.
+    """
+    con = sqlite3.connect(Config.DB_PATH, timeout=15, isolation_level=None)
+    try:
+        if "archive" in copies:
+            con.execute("ATTACH DATABASE ? AS archive", (Config.ARCHIVE_DB_PATH,))
+        con.execute("BEGIN")
+        try:
+            # Снимок каждой базы фиксируется при первом чтении из неё
+            for schema in copies:
+                con.execute(f"SELECT COUNT(*) FROM {schema}.sqlite_master").fetchone()
+            for schema, path in copies.items():
+                dst = sqlite3.connect(path)
+                try:
+                    con.backup(dst, pages=Config.BACKUP_PAGES_PER_STEP, name=schema,
+                               sleep=Config.BACKUP_STEP_SLEEP)
+                finally:
+                    dst.close()
+        finally:
+            con.execute("ROLLBACK")
+    finally:
+        con.close()
+
+def _compress(tmp_path, prefix, stamp):
+    """Проверяет копию и сжимает её в каталог резервных копий"""
+    if not _integrity_ok(tmp_path):
+        raise RuntimeError(f"Integrity check failed for {prefix} snapshot")
+    target = os.path.join(Config.BACKUP_DIR, f"{prefix}-{stamp}.db.gz")
+    with open(tmp_path, "rb") as f_in, gzip.open(target, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    return target
+
+def rotate_backups(prefix):
+    """Оставляет только последние Config.BACKUP_KEEP снимков"""
+    snapshots = list_backups(prefix)
+    if Config.BACKUP_KEEP <= 0:
+        return
+    for path in snapshots[:-Config.BACKUP_KEEP]:
+        os.remove(path)
+        logger.info("Removed old backup %s", path)
+
+def list_backups(prefix=None):
+    if not os.path.isdir(Config.BACKUP_DIR):
+        return []
+    names = sorted(
+        name for name in os.listdir(Config.BACKUP_DIR)
+        if name.endswith(".db.gz") and (prefix is None or name.startswith(f"{prefix}-"))
+    )
+    return [os.path.join(Config.BACKUP_DIR, name) for name in names]
+
+def create_backups():
+    """Делает согласованные снимки основной базы и архива без остановки бота"""
+    if not os.path.exists(Config.DB_PATH):
+        return {}
+    os.makedirs(Config.BACKUP_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    # Схема -> временный файл копии
+    copies = {}
+    for schema in BACKUP_SCHEMAS.values():
+        if schema == "archive" and not os.path.exists(Config.ARCHIVE_DB_PATH):
+            continue
+        fd, copies[schema] = tempfile.mkstemp(suffix=".db", dir=Config.BACKUP_DIR)
+        os.close(fd)
+    results = {}
+    started = time.perf_counter()
+    try:
+        with snapshot_lock:
+            _copy_schemas(copies)
+        copied = time.perf_counter() - started
+        for prefix, schema in BACKUP_SCHEMAS.items():
+            if schema in copies:
+                compress_started = time.perf_counter()
+                target = _compress(copies[schema], prefix, stamp)
+                results[prefix] = (target, copied + time.perf_counter() - compress_started)
+                rotate_backups(prefix)
+    except Exception as e:
+        logger.error("Backup failed: %s", e, exc_info=True)
+        return results
+    finally:
+        for path in copies.values():
+            os.remove(path)
+
+    for prefix, (target, duration) in results.items():
+        logger.info("Backup of %s written to %s in %.2fs", prefix, target, duration)
+    return results
+
+async def run_backup_job():
+    """Плановое резервное копирование в отдельном потоке, чтобы не блокировать цикл событий"""
+    return await asyncio.to_thread(create_backups)
+
+def restore_backup(snapshot_path, target_path=None):
+    """Восстанавливает базу из снимка. Бот на время восстановления должен быть остановлен"""
+    target_path = target_path or Config.DB_PATH
+    fd, tmp_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        with gzip.open(snapshot_path, "rb") as f_in, open(tmp_path, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+
+        if not _integrity_ok(tmp_path):
+            raise RuntimeError(f"Snapshot {snapshot_path} is corrupted")
+
+        src = sqlite3.connect(tmp_path)
+        dst = sqlite3.connect(target_path)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    finally:
+        os.remove(tmp_path)
+    logger.info("Restored %s from %s", target_path, snapshot_path)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Резервные копии базы Scheduler Bot")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("create", help="сделать снимок сейчас")
+    sub.add_parser("list", help="показать доступные снимки")
+    restore = sub.add_parser("restore", help="восстановить базу из снимка (бот должен быть остановлен)")
+    restore.add_argument("snapshot")
+    restore.add_argument("--target", help="путь к восстанавливаемой базе (по умолчанию основная)")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        create_backups()
+    elif args.command == "list":
+        for path in list_backups():
+            print(path)
+    elif args.command == "restore":
+        try:
+            restore_backup(args.snapshot, args.target)
+        except Exception as e:
+            logger.error("Restore failed: %s", e)
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,13 @@
 """
 Основной файл бота
 """
+import time
+# Отсчёт запуска до импорта зависимостей, чтобы видеть и время импортов
+PROCESS_STARTED = time.perf_counter()
+
+import argparse
 import asyncio
+import json
 import logging
 import signal
 from telegram.ext import (
@@ -10,29 +16,52 @@ from telegram.ext import (
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
+    TypeHandler,
     filters
 )
+from telegram import Update
+from apscheduler.jobstores.base import JobLookupError
 from config import Config
+from logging_setup import setup_logging
 import handlers
-from database import init_db
+from database import init_db, get_connection, set_meta, pop_meta
 from utils import ensure_profile_image
 from scheduler import SchedulerManager
+from sharding import ShardCoordinator
+from leader import LeaderElector
+from archive import archive_old_rows
+from backup import run_backup_job
+import stats
+import charts
+import broadcast
+import digest
+import delivery
+import clock
+import metrics
+import writer
+import recorder
+import watchdog
+import transport
+import throttle
+import groups
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.FileHandler(Config.LOG_PATH),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# Фоновый поток записи логов (start_logging). Не при импорте: процессы графиков
+# (spawn) заново импортируют этот модуль как __mp_main__ и открыли бы свой файл лога
+log_listener = None
+
 # Глобальная переменная для хранения объекта приложения
 app_instance = None
 scheduler_manager = None
 
+def start_logging():
+    """Настраивает логирование: запись в файл выполняется фоновым потоком"""
+    global log_listener
+    log_listener = setup_logging()
+    # Периодические heartbeat-задачи иначе пишут в лог каждые несколько секунд
+    logging.getLogger("apscheduler.executors.default").setLevel(logging.WARNING)
+
 async def send_maintenance_notification():
     """Отправляет уведомление о технических работах"""
     try:
@@ -59,41 +88,202 @@ async def send_shutdown_notification():
     except Exception as e:
         logger.error(f"Failed to send shutdown notification: {e}")
 
+async def send_startup_notification(app):
+    """Отправляет уведомление о запуске бота"""
+    if Config.ADMIN_ID == 0:
+        logger.warning("ADMIN_ID is not set, skipping startup notification")
+        return
+    try:
+        await app.bot.send_message(
+            chat_id=Config.ADMIN_ID,
+            text="🤖 Бот успешно запущен и готов к работе! ✅"
+        )
+    except Exception as e:
+        logger.error(f"Failed to send startup notification: {e}")
+
 def register_handlers(app):
     """Регистрация всех обработчиков"""
-    app.add_handler(CommandHandler("start", handlers.start_cmd))
-    app.add_handler(CommandHandler("stats", handlers.stats_cmd))
+    # Запись обновлений для replay.py (если включена) — раньше всех остальных обработчиков
+    if recorder.start(keep_texts=handlers.TEXT_ROUTES):
+        app.add_handler(TypeHandler(Update, recorder.record_update), group=-100)
     
-    app.add_handler(CallbackQueryHandler(handlers.open_calendar_cb, pattern=r"^open_calendar:"))
-    app.add_handler(CallbackQueryHandler(handlers.day_selection_cb, pattern=r"^daysel:"))
-    app.add_handler(CallbackQueryHandler(handlers.chmonth_cb, pattern=r"^chmonth:"))
-    app.add_handler(CallbackQueryHandler(handlers.hoursel_cb, pattern=r"^hoursel:"))
-    app.add_handler(CallbackQueryHandler(handlers.minute_select_cb, pattern=r"^minutesel:"))
-    app.add_handler(CallbackQueryHandler(handlers.lead_select_cb, pattern=r"^lead:"))
-    app.add_handler(CallbackQueryHandler(handlers.confirm_reminder_cb, pattern=r"^confirm_reminder$"))
+    # Ограничение частоты и сброс нагрузки до всех остальных обработчиков
+    throttle.install(
+        handlers.callback_router,
+        low_priority_texts=handlers.LOW_PRIORITY_TEXTS,
+        low_priority_actions=handlers.LOW_PRIORITY_ACTIONS,
+    )
+    app.add_handler(TypeHandler(Update, throttle.guard), group=-50)
     
-    app.add_handler(CallbackQueryHandler(handlers.today_tasks_cb, pattern=r"^today_tasks$"))
-    app.add_handler(CallbackQueryHandler(handlers.add_task_cb, pattern=r"^add_task$"))
-    app.add_handler(CallbackQueryHandler(handlers.toggle_task_cb, pattern=r"^toggle_task:"))
+    # Участники групп для упоминаний в общих напоминаниях (groups.py)
+    app.add_handler(TypeHandler(Update, groups.track_members), group=-10)
     
-    # Универсальный обработчик для неизвестных callback
-    app.add_handler(CallbackQueryHandler(handlers.unknown_cb))
+    # Учёт активных пользователей выполняется до основных обработчиков
+    app.add_handler(TypeHandler(Update, stats.track_activity), group=-1)
+    
+    app.add_handler(CommandHandler("start", handlers.start_cmd))
+    app.add_handler(CommandHandler("stats", handlers.stats_cmd))
+    app.add_handler(CommandHandler("history", handlers.history_cmd))
+    app.add_handler(CommandHandler("broadcast", handlers.broadcast_cmd))
+    app.add_handler(CommandHandler("digest", handlers.digest_cmd))
+    app.add_handler(CommandHandler("task", handlers.task_cmd))
+    app.add_handler(CommandHandler("remind", handlers.remind_cmd))
+    # Выгрузка строится в потоке и загружается файлом: не задерживаем остальные обновления
+    app.add_handler(CommandHandler("export", handlers.export_cmd, block=False))
+    app.add_handler(CommandHandler("lag", handlers.lag_cmd))
+    # Замер длится секунды: не задерживаем им остальные обновления
+    app.add_handler(CommandHandler("profile", handlers.profile_cmd, block=False))
+    
+    # Все кнопки разбирает один маршрутизатор (см. callbacks.py)
+    app.add_handler(CallbackQueryHandler(handlers.callback_router))
     
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.text_message_handler))
 
-async def main():
+# Единичные задачи, которые выполняет только ведущий экземпляр
+SYSTEM_JOB_IDS = ("system_rollover", "system_archive", "system_backup", "system_digest")
+
+def add_system_jobs(manager):
+    """Планирование системных задач"""
+    manager.scheduler.add_job(
+        manager.rollover_pending_tasks,
+        trigger="cron",
+        hour=0,
+        minute=0,
+        timezone=Config.TZ,
+        id="system_rollover",
+        replace_existing=True
+    )
+    manager.scheduler.add_job(
+        run_backup_job,
+        trigger="cron",
+        hour=4,
+        minute=0,
+        timezone=Config.TZ,
+        id="system_backup",
+        replace_existing=True
+    )
+    # Сводки проверяются каждый час; час 0 идёт сразу после ночного переноса задач
+    manager.scheduler.add_job(
+        digest.send_due,
+        trigger="cron",
+        minute=1,
+        timezone=Config.TZ,
+        args=[manager.app.bot],
+        id="system_digest",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    manager.scheduler.add_job(
+        archive_old_rows,
+        trigger="cron",
+        hour=3,
+        minute=30,
+        timezone=Config.TZ,
+        id="system_archive",
+        replace_existing=True
+    )
+
+def remove_system_jobs(manager):
+    for job_id in SYSTEM_JOB_IDS:
+        try:
+            manager.scheduler.remove_job(job_id)
+        except JobLookupError:
+            pass
+
+async def on_leader_elected():
+    add_system_jobs(scheduler_manager)
+    if not scheduler_manager.coordinator:
+        # Загрузка существующих напоминаний идёт в фоне, ближайшие первыми
+        scheduler_manager.load_in_background(catch_up=True)
+
+async def on_leader_demoted():
+    remove_system_jobs(scheduler_manager)
+    if not scheduler_manager.coordinator:
+        scheduler_manager.unschedule_all()
+
+async def leader_heartbeat():
+    """Продлевает аренду ведущего; без шардов ведущий подхватывает и новые напоминания"""
+    elector = scheduler_manager.elector
+    await elector.tick()
+    if elector.is_leader:
+        if not scheduler_manager.coordinator:
+            await scheduler_manager.schedule_new_reminders()
+        # Рассылки, брошенные остановленным или упавшим экземпляром
+        await broadcast.resume_broadcasts(app_instance.bot)
+
+# Отметка штатной остановки своя у каждого экземпляра: с шардами и ведомыми
+# процессами штатная остановка одного не должна отменять сверку у упавшего
+CLEAN_SHUTDOWN_KEY = "clean_shutdown:{}"
+
+def reconcile_after_crash(started_at):
+    """Сверка после аварийной остановки этого экземпляра: его незавершённые отправки и счётчики.
+
+    Освобождаются только захваты с тем же INSTANCE_ID, сделанные до started_at, —
+    отправки живых экземпляров и начатые уже этим процессом не трогаются.
+    Аренды прежнего процесса с тем же INSTANCE_ID продлеваются этим же владельцем
+    или истекают сами.
+    """
+    started = time.perf_counter()
+    released = delivery.release_orphaned_claims(Config.INSTANCE_ID, started_at)
+    stats.recount_counters()
+    logger.info(
+        f"Startup reconciliation done in {time.perf_counter() - started:.2f}s, "
+        f"released {released} orphaned deliveries"
+    )
+
+def build_application():
+    # Отдельные соединения для исходящих вызовов и для getUpdates (см. transport.py)
+    builder = (
+        ApplicationBuilder()
+        .token(Config.TOKEN)
+        .request(transport.build_request())
+        .get_updates_request(transport.build_updates_request())
+    )
+    if Config.BOT_API_BASE_URL:
+        builder = builder.base_url(Config.BOT_API_BASE_URL)
+    return builder.build()
+
+async def run_background_startup(worker, started_at):
+    """Работа при запуске, которая не нужна для приёма первых обновлений"""
+    timer = metrics.PhaseTimer("startup")
+    try:
+        # После штатной остановки состояние доставки сохранено, сверка не нужна
+        marker = pop_meta(CLEAN_SHUTDOWN_KEY.format(Config.INSTANCE_ID))
+        if marker:
+            logger.info(f"Clean shutdown marker found ({marker}), skipping reconciliation")
+        else:
+            with timer.phase("reconcile"):
+                await asyncio.to_thread(reconcile_after_crash, started_at)
+        if not worker:
+            with timer.phase("profile_image"):
+                await asyncio.to_thread(ensure_profile_image)
+    except Exception as e:
+        logger.error(f"Background startup failed: {e}", exc_info=True)
+    if timer.phases:
+        logger.info(f"Background startup: {timer.report()}")
+
+async def main(worker=False):
+    """worker=True запускает только доставку напоминаний своих шардов, без приёма обновлений"""
     global app_instance, scheduler_manager
+    # Захваты отправок с этим INSTANCE_ID до этого момента принадлежат прежнему процессу
+    started_at = clock.timestamp()
     
-    # Инициализация базы данных и изображения профиля
-    init_db()
-    ensure_profile_image()
+    # Фазы запуска попадают в лог и в метрики /stats (startup.*)
+    timer = metrics.PhaseTimer("startup")
+    timer.record("imports", time.perf_counter() - PROCESS_STARTED)
+    
+    # Инициализация базы данных
+    with timer.phase("init_db"):
+        init_db()
     
     # Создание приложения
-    app = ApplicationBuilder().token(Config.TOKEN).build()
+    app = build_application()
     app_instance = app
     
     # Регистрация обработчиков
-    register_handlers(app)
+    if not worker:
+        register_handlers(app)
     
     # Инициализация планировщика
     scheduler_manager = SchedulerManager(app)
@@ -102,81 +292,140 @@ async def main():
     # Запуск планировщика
     await scheduler_manager.start_scheduler()
     
-    # Планирование системных задач
-    scheduler_manager.scheduler.add_job(
-        scheduler_manager.rollover_pending_tasks,
-        trigger="cron",
-        hour=0,
-        minute=0,
-        timezone=Config.TZ
-    )
+    # Групповая запись задач
+    writer.start()
     
-    # Загрузка существующих напоминаний
-    await scheduler_manager.schedule_existing_reminders()
+    # Контроль задержки цикла событий
+    watchdog.start()
     
-    logger.info("Bot starting...")
-    await app.initialize()
-    await app.start()
+    # Сверку и картинку профиля выполняем в фоне
+    background = asyncio.create_task(run_background_startup(worker, started_at))
     
-    # Уведомление о запуске (только если ADMIN_ID валиден)
-    if Config.ADMIN_ID != 0:
-        try:
-            await app.bot.send_message(
-                chat_id=Config.ADMIN_ID,
-                text="🤖 Бот успешно запущен и готов к работе! ✅"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send startup notification: {e}")
-    else:
-        logger.warning("ADMIN_ID is not set, skipping startup notification")
+    if Config.SHARD_COUNT > 0:
+        # Напоминания распределяются между процессами по шардам user_id
+        scheduler_manager.coordinator = ShardCoordinator(
+            scheduler_manager, Config.INSTANCE_ID, Config.SHARD_COUNT
+        )
+        with timer.phase("shards"):
+            await scheduler_manager.coordinator.heartbeat()
+        scheduler_manager.scheduler.add_job(
+            scheduler_manager.coordinator.heartbeat,
+            trigger="interval",
+            seconds=Config.SHARD_HEARTBEAT_SECONDS,
+            max_instances=1,
+            coalesce=True
+        )
+    elif worker:
+        raise SystemExit("Worker mode requires SCHEDULER_BOT_SHARD_COUNT > 0")
     
-    # Настройка обработки сигналов для корректного завершения
+    # Системные задачи и (без шардов) загрузку напоминаний выполняет только ведущий экземпляр
+    if not worker:
+        scheduler_manager.elector = LeaderElector(
+            Config.INSTANCE_ID, on_leader_elected, on_leader_demoted
+        )
+        with timer.phase("leader"):
+            await leader_heartbeat()
+        scheduler_manager.scheduler.add_job(
+            leader_heartbeat,
+            trigger="interval",
+            seconds=Config.LEADER_HEARTBEAT_SECONDS,
+            max_instances=1,
+            coalesce=True
+        )
+    
+    # Сигнал только будит основной цикл: остановка выполняется в нём же, без отмены задач на полпути.
+    # Обработчики ставим до подключения к Telegram, чтобы сигнал во время запуска не убивал процесс
+    stop_event = asyncio.Event()
     loop = asyncio.get_running_loop()
     for signame in ('SIGINT', 'SIGTERM'):
-        loop.add_signal_handler(
-            getattr(signal, signame),
-            lambda: asyncio.create_task(shutdown(app))
-        )
+        loop.add_signal_handler(getattr(signal, signame), stop_event.set)
     
-    await app.updater.start_polling()
+    logger.info("Worker starting..." if worker else "Bot starting...")
+    with timer.phase("telegram"):
+        await app.initialize()
+        await app.start()
     
-    try:
-        # Бесконечный цикл работы бота
-        while True:
-            await asyncio.sleep(3600)
-    except (KeyboardInterrupt, SystemExit):
-        logger.info("Shutdown signal received...")
-        await shutdown(app)
+    if not worker:
+        with timer.phase("polling"):
+            await app.updater.start_polling()
+    
+    timer.record("total", time.perf_counter() - PROCESS_STARTED)
+    logger.info(f"Startup phases: {timer.report()}")
+    
+    # Уведомление о запуске (только основной процесс и только если ADMIN_ID валиден)
+    if not worker:
+        await send_startup_notification(app)
+    
+    await stop_event.wait()
+    background.cancel()
+    logger.info("Shutdown signal received...")
+    await shutdown(app)
 
 async def shutdown(app):
-    """Корректное завершение работы бота"""
+    """Корректное завершение работы бота.
+
+    Порядок: прекращаем приём обновлений, дожидаемся начатых отправок (не дольше
+    Config.SHUTDOWN_DRAIN_SECONDS), сохраняем позицию рассылок, дописываем
+    групповую запись задач, освобождаем аренды
+    и отмечаем штатную остановку, чтобы следующий запуск пропустил сверку.
+    """
     logger.info("Shutting down...")
+    clean = False
     try:
         # Отправляем уведомление об остановке (только если ADMIN_ID валиден)
-        if Config.ADMIN_ID != 0:
+        if Config.ADMIN_ID != 0 and app.updater.running:
             await send_shutdown_notification()
         
-        # Останавливаем компоненты
-        await app.updater.stop()
+        # Новые обновления больше не принимаем
+        if app.updater.running:
+            await app.updater.stop()
+        
+        # Бот ещё нужен начатым отправкам, поэтому приложение останавливаем после них
+        if scheduler_manager:
+            clean = await scheduler_manager.drain(Config.SHUTDOWN_DRAIN_SECONDS)
+        await broadcast.stop_all()
+        
         await app.stop()
         await app.shutdown()
         
-        # Останавливаем планировщик
+        # Обработчики завершены: дописываем накопленные изменения задач
+        clean = await writer.stop() and clean
+        
+        # Останавливаем планировщик и отдаём шарды другим процессам
         if scheduler_manager:
-            scheduler_manager.scheduler.shutdown()
+            scheduler_manager.scheduler.shutdown(wait=False)
+            if scheduler_manager.coordinator:
+                scheduler_manager.coordinator.release_all()
+            if scheduler_manager.elector:
+                scheduler_manager.elector.release()
+        
+        charts.shutdown_executor()
+        
+        # Отметку с id, который не повторится при следующем запуске, никто не прочтёт
+        if clean and Config.INSTANCE_ID_STABLE:
+            set_meta(CLEAN_SHUTDOWN_KEY.format(Config.INSTANCE_ID), json.dumps({"instance": Config.INSTANCE_ID, "at": time.time()}))
     except Exception as e:
         logger.error(f"Error during shutdown: {e}", exc_info=True)
     finally:
-        # Завершаем все асинхронные задачи
+        # Оставшиеся фоновые задачи (не основная) больше никому не нужны
         tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
-        logger.info("Bot shutdown complete")
+        logger.info("Bot shutdown complete" if clean else "Bot shutdown complete (deliveries checkpointed)")
+        watchdog.stop()
+        recorder.stop()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduler Bot")
+    parser.add_argument(
+        "--worker", action="store_true",
+        help="только доставка напоминаний своих шардов (нужен SCHEDULER_BOT_SHARD_COUNT)"
+    )
+    args = parser.parse_args()
+    start_logging()
     try:
-        asyncio.run(main())
+        asyncio.run(main(worker=args.worker))
     except Exception as e:
         logger.exception("Fatal error in main")
         try:
@@ -184,4 +433,8 @@ if __name__ == "__main__":
             if Config.ADMIN_ID != 0:
                 asyncio.run(send_shutdown_notification())
         except:
-            pass
\ No newline at end of file
+            pass
+    finally:
+        # Записи уходят в файл фоновым потоком; дожидаемся их перед выходом.
+        # Останавливается только здесь: повторный QueueListener.stop() падает
+        log_listener.stop()
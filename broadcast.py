@@ -0,0 +1,248 @@
+# broadcast.py
+import time
+import asyncio
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from telegram.error import RetryAfter
+from config import Config
+from database import get_connection
+from ratelimit import TokenBucket
+import clock
+import delivery
+import leases
+import metrics
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Рассылки, выполняющиеся в этом процессе: id -> asyncio.Task
+_running = {}
+
+def lease_name(broadcast_id):
+    return f"broadcast:{broadcast_id}"
+
+def create_broadcast(text, progress_chat_id, progress_message_id):
+    total = storage.current().count_users()
+    with get_connection() as con:
+        cur = con.execute("""
+            INSERT INTO broadcasts (text, total, progress_chat_id, progress_message_id, created_iso)
+            VALUES (?, ?, ?, ?, ?)
+        """, (text, total, progress_chat_id, progress_message_id,
+              datetime.now(ZoneInfo(Config.TZ)).isoformat()))
+        con.commit()
+        return cur.lastrowid
+
+def fetch_recipients(after_user_id, limit):
+    """Следующая страница получателей: [(user_id, чат недоступен)]"""
+    return storage.current().users_page(after_user_id, limit)
+
+def _load(broadcast_id):
+    with get_connection() as con:
+        return con.execute("""
+            SELECT text, status, last_user_id, total, sent, failed, progress_chat_id, progress_message_id
+            FROM broadcasts WHERE id=?
+        """, (broadcast_id,)).fetchone()
+
+def _acquire(broadcast_id):
+    with get_connection() as con:
+        acquired = leases.try_acquire(
+            con, lease_name(broadcast_id), Config.INSTANCE_ID, Config.BROADCAST_LEASE_TTL
+        )
+        con.commit()
+        return acquired
+
+def _checkpoint(broadcast_id, last_user_id, sent, failed):
+    """Сохраняет позицию и продлевает аренду. False — рассылку остановили или аренду забрали"""
+    with get_connection() as con:
+        cur = con.execute("""
+            UPDATE broadcasts SET last_user_id=?, sent=?, failed=?
+            WHERE id=? AND status='running'
+        """, (last_user_id, sent, failed, broadcast_id))
+        alive = cur.rowcount == 1 and leases.try_acquire(
+            con, lease_name(broadcast_id), Config.INSTANCE_ID, Config.BROADCAST_LEASE_TTL
+        )
+        con.commit()
+        return alive
+
+def _finish(broadcast_id, status):
+    with get_connection() as con:
+        con.execute(
+            "UPDATE broadcasts SET status=?, finished_iso=? WHERE id=? AND status='running'",
+            (status, datetime.now(ZoneInfo(Config.TZ)).isoformat(), broadcast_id)
+        )
+        leases.release(con, lease_name(broadcast_id), Config.INSTANCE_ID)
+        con.commit()
+
+def cancel_running():
+    """Останавливает все идущие рассылки; исполнители заметят это на следующей странице"""
+    with get_connection() as con:
+        cur = con.execute(
+            "UPDATE broadcasts SET status='cancelled', finished_iso=? WHERE status='running'",
+            (datetime.now(ZoneInfo(Config.TZ)).isoformat(),)
+        )
+        con.commit()
+        return cur.rowcount
+
+def recent_broadcasts(limit=5):
+    with get_connection() as con:
+        return con.execute("""
+            SELECT id, status, sent, failed, total, created_iso FROM broadcasts
+            ORDER BY id DESC LIMIT ?
+        """, (limit,)).fetchall()
+
+def format_progress(broadcast_id, status, sent, failed, total, rate):
+    done = sent + failed
+    title = {
+        "running": "📣 Рассылка",
+        "done": "✅ Рассылка завершена",
+        "cancelled": "⏹ Рассылка остановлена",
+    }.get(status, "📣 Рассылка")
+    lines = [
+        f"{title} #{broadcast_id}",
+        f"Обработано: {done} из {total}",
+        f"Доставлено: {sent}, ошибок: {failed}",
+        f"Скорость: {rate:.1f} сообщ./с",
+    ]
+    if status == "running" and rate > 0 and total > done:
+        lines.append(f"Осталось примерно: {int((total - done) / rate)} с")
+    return "\n".join(lines)
+
+async def send_paced(bot, bucket, semaphore, user_id, text, metric="broadcast"):
+    """Отправляет сообщение одному получателю в общем темпе bucket. True — доставлено"""
+    for attempt in range(3):
+        await bucket.acquire()
+        async with semaphore:
+            try:
+                await bot.send_message(chat_id=user_id, text=text)
+                metrics.inc(f"{metric}.sent")
+                return True
+            except RetryAfter as e:
+                # Ограничение общее для бота: останавливаем всю рассылку на указанное время
+                metrics.inc(f"{metric}.retry_after")
+                bucket.pause(float(e.retry_after))
+                continue
+            except Exception as e:
+                outcome, _ = delivery.classify(e)
+                if outcome == delivery.DEAD_CHAT:
+                    await asyncio.to_thread(
+                        delivery.add_dead_letter, user_id, f"{type(e).__name__}: {e}", None
+                    )
+                    break
+                if outcome == delivery.DEAD_REMINDER:
+                    break
+                logger.warning("Paced send (%s) to %s failed (attempt %d): %s", metric, user_id, attempt + 1, e)
+        await asyncio.sleep(2 ** attempt)
+    metrics.inc(f"{metric}.failed")
+    return False
+
+async def _update_progress(bot, chat_id, message_id, text):
+    if not chat_id or not message_id:
+        return
+    try:
+        await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text)
+    except Exception as e:
+        # "message is not modified" и подобные ошибки на рассылку не влияют
+        logger.debug("Broadcast progress update failed: %s", e)
+
+async def run_broadcast(bot, broadcast_id):
+    """Выполняет рассылку с позиции last_user_id, соблюдая Config.BROADCAST_RATE"""
+    if not await asyncio.to_thread(_acquire, broadcast_id):
+        logger.info("Broadcast %s is running in another process", broadcast_id)
+        return
+    text, status, after, total, sent, failed, chat_id, message_id = await asyncio.to_thread(_load, broadcast_id)
+    if status != "running":
+        return
+    logger.info("Broadcast %s started from user_id > %s", broadcast_id, after)
+
+    bucket = TokenBucket(Config.BROADCAST_RATE, capacity=Config.BROADCAST_CONCURRENCY)
+    semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+    started = time.monotonic()
+    done_at_start = sent + failed
+    last_progress = 0.0
+    rate = 0.0
+
+    while True:
+        page = await asyncio.to_thread(fetch_recipients, after, Config.BROADCAST_PAGE_SIZE)
+        if not page:
+            status = "done"
+            break
+
+        results = await asyncio.gather(*(
+            send_paced(bot, bucket, semaphore, user_id, text)
+            for user_id, unreachable in page if not unreachable
+        ))
+        sent += sum(results)
+        # Недоступные чаты не вызываем, но учитываем в прогрессе
+        failed += len(page) - sum(results)
+        after = page[-1][0]
+
+        # Позиция сохраняется после каждой страницы: при перезапуске повторно
+        # получат сообщение не больше Config.BROADCAST_PAGE_SIZE пользователей
+        if not await asyncio.to_thread(_checkpoint, broadcast_id, after, sent, failed):
+            status = "cancelled"
+            break
+
+        elapsed = time.monotonic() - started
+        rate = (sent + failed - done_at_start) / elapsed if elapsed else 0.0
+        metrics.set_gauge("broadcast.rate", rate)
+        if elapsed - last_progress >= Config.BROADCAST_PROGRESS_SECONDS:
+            last_progress = elapsed
+            await _update_progress(
+                bot, chat_id, message_id,
+                format_progress(broadcast_id, "running", sent, failed, total, rate)
+            )
+
+    await asyncio.to_thread(_finish, broadcast_id, status)
+    logger.info("Broadcast %s %s: sent %d, failed %d", broadcast_id, status, sent, failed)
+    await _update_progress(
+        bot, chat_id, message_id,
+        format_progress(broadcast_id, status, sent, failed, max(total, sent + failed), rate)
+    )
+
+def start(bot, broadcast_id):
+    if broadcast_id in _running:
+        return _running[broadcast_id]
+    task = asyncio.create_task(run_broadcast(bot, broadcast_id))
+    _running[broadcast_id] = task
+    task.add_done_callback(lambda _: _running.pop(broadcast_id, None))
+    return task
+
+def _orphaned():
+    """Незавершённые рассылки, аренду которых никто не продлевает"""
+    now = clock.timestamp()
+    with get_connection() as con:
+        rows = con.execute("""
+            SELECT b.id FROM broadcasts b
+            WHERE b.status='running' AND NOT EXISTS (
+                SELECT 1 FROM leases l
+                WHERE l.name = 'broadcast:' || b.id AND l.expires_at > ?
+            )
+        """, (now,)).fetchall()
+    return [row[0] for row in rows]
+
+async def resume_broadcasts(bot):
+    """Продолжает рассылки, прерванные остановкой или падением процесса"""
+    try:
+        for broadcast_id in await asyncio.to_thread(_orphaned):
+            if broadcast_id not in _running:
+                logger.info("Resuming broadcast %s", broadcast_id)
+                start(bot, broadcast_id)
+    except Exception as e:
+        logger.error("Failed to resume broadcasts: %s", e)
+
+async def stop_all():
+    """Прерывает рассылки процесса при остановке; позиция уже сохранена постранично"""
+    tasks = list(_running.items())
+    for _, task in tasks:
+        task.cancel()
+    await asyncio.gather(*(task for _, task in tasks), return_exceptions=True)
+    if tasks:
+        # Освобождаем аренды, чтобы ведущий продолжил рассылки без ожидания
+        await asyncio.to_thread(_release, [broadcast_id for broadcast_id, _ in tasks])
+
+def _release(broadcast_ids):
+    with get_connection() as con:
+        for broadcast_id in broadcast_ids:
+            leases.release(con, lease_name(broadcast_id), Config.INSTANCE_ID)
+        con.commit()
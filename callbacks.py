@@ -0,0 +1,164 @@
+# callbacks.py
+"""
+Компактное кодирование callback_data.
+
+Полезная нагрузка: байт версии схемы, байт действия и аргументы, упакованные struct
+по формату действия; результат кодируется urlsafe base64 без выравнивания.
+Например, выбор дня занимает 10 символов вместо 28 в текстовом "daysel:view_tasks:2026:10:16".
+
+Смена формата аргументов любого действия требует увеличить SCHEMA_VERSION:
+кнопки старой версии в уже отправленных сообщениях распознаются как устаревшие.
+
+Замер скорости разбора: python callbacks.py
+"""
+import base64
+import struct
+import binascii
+
+SCHEMA_VERSION = 1
+
+# Действия
+NOOP = 0
+MENU = 1
+OPEN_CALENDAR = 2
+DAY_SELECT = 3
+CHANGE_MONTH = 4
+HOUR_SELECT = 5
+MINUTE_SELECT = 6
+LEAD_SELECT = 7
+CONFIRM_REMINDER = 8
+TODAY_TASKS = 9
+ADD_TASK = 10
+TOGGLE_TASK = 11
+
+# Формат аргументов каждого действия (struct, little-endian)
+ARG_FORMATS = {
+    NOOP: "",
+    MENU: "",
+    OPEN_CALENDAR: "B",      # режим
+    DAY_SELECT: "BHBB",      # режим, год, месяц, день
+    CHANGE_MONTH: "BHb",     # режим, год (0 — текущий месяц), месяц (может выйти за 1..12)
+    HOUR_SELECT: "B",
+    MINUTE_SELECT: "B",
+    LEAD_SELECT: "B",
+    CONFIRM_REMINDER: "",
+    TODAY_TASKS: "",
+    ADD_TASK: "",
+    TOGGLE_TASK: "I",        # id задачи
+}
+_STRUCTS = {action: struct.Struct("<" + fmt) for action, fmt in ARG_FORMATS.items()}
+
+# Режимы календаря хранятся индексом
+MODES = ("view", "create_reminder", "view_tasks")
+_MODE_INDEX = {mode: index for index, mode in enumerate(MODES)}
+
+class CallbackError(ValueError):
+    """Повреждённые или устаревшие данные кнопки"""
+
+def encode(action, *args):
+    packed = bytes((SCHEMA_VERSION, action)) + _STRUCTS[action].pack(*args)
+    return base64.urlsafe_b64encode(packed).rstrip(b"=").decode("ascii")
+
+def decode(data):
+    """Возвращает (действие, аргументы) или бросает CallbackError"""
+    try:
+        raw = base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise CallbackError(f"not base64: {data!r}") from e
+    if len(raw) < 2:
+        raise CallbackError(f"too short: {data!r}")
+    if raw[0] != SCHEMA_VERSION:
+        raise CallbackError(f"schema version {raw[0]}, expected {SCHEMA_VERSION}")
+    action = raw[1]
+    layout = _STRUCTS.get(action)
+    if layout is None:
+        raise CallbackError(f"unknown action {action}")
+    try:
+        return action, layout.unpack(raw[2:])
+    except struct.error as e:
+        raise CallbackError(f"bad arguments for action {action}") from e
+
+def mode_index(mode):
+    return _MODE_INDEX[mode]
+
+def mode_name(index):
+    try:
+        return MODES[index]
+    except IndexError:
+        raise CallbackError(f"unknown mode {index}")
+
+# Готовые кнопки, используемые в нескольких клавиатурах
+def noop():
+    return encode(NOOP)
+
+def menu():
+    return encode(MENU)
+
+def open_calendar(mode):
+    return encode(OPEN_CALENDAR, mode_index(mode))
+
+def day_select(mode, year, month, day):
+    return encode(DAY_SELECT, mode_index(mode), year, month, day)
+
+def change_month(mode, year, month):
+    return encode(CHANGE_MONTH, mode_index(mode), year, month)
+
+def change_month_today(mode):
+    return encode(CHANGE_MONTH, mode_index(mode), 0, 0)
+
+def hour_select(hour):
+    return encode(HOUR_SELECT, hour)
+
+def minute_select(minute):
+    return encode(MINUTE_SELECT, minute)
+
+def lead_select(minutes):
+    return encode(LEAD_SELECT, minutes)
+
+def confirm_reminder():
+    return encode(CONFIRM_REMINDER)
+
+def today_tasks():
+    return encode(TODAY_TASKS)
+
+def add_task():
+    return encode(ADD_TASK)
+
+def toggle_task(task_id):
+    return encode(TOGGLE_TASK, task_id)
+
+def _benchmark():
+    """Сравнивает разбор кнопки с прежней цепочкой регулярных выражений"""
+    import re
+    import timeit
+
+    legacy_patterns = [re.compile(p) for p in (
+        r"^open_calendar:", r"^daysel:", r"^chmonth:", r"^hoursel:", r"^minutesel:", r"^lead:",
+        r"^confirm_reminder$", r"^today_tasks$", r"^add_task$", r"^toggle_task:",
+    )]
+    routes = {action: None for action in ARG_FORMATS}
+
+    def legacy(data):
+        for index, pattern in enumerate(legacy_patterns):
+            if pattern.match(data):
+                return index, data.split(":")
+        return None
+
+    def compact(data):
+        action, args = decode(data)
+        return routes[action], args
+
+    samples = [
+        ("day", "daysel:view_tasks:2026:10:16", day_select("view_tasks", 2026, 10, 16)),
+        ("toggle", "toggle_task:123456", toggle_task(123456)),
+        ("unknown", "menu", menu()),
+    ]
+    number = 200_000
+    for name, old, new in samples:
+        old_ns = timeit.timeit(lambda: legacy(old), number=number) / number * 1e9
+        new_ns = timeit.timeit(lambda: compact(new), number=number) / number * 1e9
+        print(f"{name:8} regex {old_ns:7.0f} ns  ({len(old):2} chars)   "
+              f"compact {new_ns:7.0f} ns  ({len(new):2} chars)")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,169 @@
+# charts.py
+import io
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from config import Config
+from database import get_connection
+from utils import user_now
+
+logger = logging.getLogger(__name__)
+
+WIDTH, HEIGHT = 800, 420
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 50, 20, 50, 50
+COMPLETED_COLOR = (76, 175, 80)
+PENDING_COLOR = (229, 57, 53)
+
+_executor = None
+
+def render_history_chart(points):
+    """Рисует столбчатую диаграмму [(подпись дня, выполнено, не выполнено)] и возвращает PNG.
+
+    Выполняется в отдельном процессе, поэтому Pillow импортируется здесь.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    img = Image.new("RGB", (WIDTH, HEIGHT), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", 14)
+    except Exception:
+        font = ImageFont.load_default()
+
+    plot_w = WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+    plot_h = HEIGHT - MARGIN_TOP - MARGIN_BOTTOM
+    max_value = max([c + p for _, c, p in points] + [1])
+
+    draw.text((MARGIN_LEFT, 15), "Выполнено / не выполнено по дням", fill=(0, 0, 0), font=font)
+    draw.line((MARGIN_LEFT, MARGIN_TOP, MARGIN_LEFT, MARGIN_TOP + plot_h), fill=(120, 120, 120))
+    draw.line((MARGIN_LEFT, MARGIN_TOP + plot_h, WIDTH - MARGIN_RIGHT, MARGIN_TOP + plot_h), fill=(120, 120, 120))
+    draw.text((10, MARGIN_TOP - 7), str(max_value), fill=(80, 80, 80), font=font)
+
+    slot = plot_w / max(len(points), 1)
+    bar_w = slot * 0.6
+    for i, (label, completed, pending) in enumerate(points):
+        x0 = MARGIN_LEFT + i * slot + (slot - bar_w) / 2
+        base = MARGIN_TOP + plot_h
+        done_h = plot_h * completed / max_value
+        pending_h = plot_h * pending / max_value
+        if completed:
+            draw.rectangle((x0, base - done_h, x0 + bar_w, base), fill=COMPLETED_COLOR)
+        if pending:
+            draw.rectangle((x0, base - done_h - pending_h, x0 + bar_w, base - done_h), fill=PENDING_COLOR)
+        draw.text((x0, base + 8), label, fill=(80, 80, 80), font=font)
+
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+class ChartCache:
+    """LRU-кэш графиков с вытеснением по суммарному размеру PNG и числу записей.
+
+    Запись, от которой остался только file_id, байтов не занимает, поэтому
+    без ограничения числа записей такие записи не вытеснялись бы никогда.
+    """
+
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, png):
+        self._drop(key)
+        self._entries[key] = {"png": png, "file_id": None}
+        self.total_bytes += len(png)
+        while len(self._entries) > 1 and (
+            self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+        ):
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def set_file_id(self, key, file_id):
+        """После загрузки в Telegram хранить байты больше не нужно"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        if entry["png"] is not None:
+            self.total_bytes -= len(entry["png"])
+            entry["png"] = None
+        entry["file_id"] = file_id
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry and entry["png"] is not None:
+            self.total_bytes -= len(entry["png"])
+
+chart_cache = ChartCache(Config.CHART_CACHE_MAX_BYTES, Config.CHART_CACHE_MAX_ENTRIES)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, чтобы дочерние процессы не наследовали потоки планировщика
+        _executor = ProcessPoolExecutor(
+            max_workers=Config.CHART_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def _load_points(user_id, days):
+    today = user_now().date()
+    since = today - timedelta(days=days - 1)
+    with get_connection() as con:
+        row = con.execute("SELECT version FROM user_versions WHERE user_id=?", (user_id,)).fetchone()
+        version = row[0] if row else 0
+        daily = {
+            day_iso: (completed, rolled)
+            for day_iso, completed, rolled in con.execute(
+                "SELECT day_iso, completed, rolled_over FROM task_daily "
+                "WHERE user_id=? AND day_iso BETWEEN ? AND ?",
+                (user_id, since.isoformat(), today.isoformat())
+            )
+        }
+        # Сегодняшние невыполненные задачи ещё не перенесены, считаем их напрямую
+        pending_today = con.execute(
+            "SELECT COUNT(*) FROM tasks WHERE user_id=? AND day_iso=? AND status='pending'",
+            (user_id, today.isoformat())
+        ).fetchone()[0]
+
+    points = []
+    for offset in range(days - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        completed, pending = daily.get(day.isoformat(), (0, 0))
+        if day == today:
+            pending += pending_today
+        points.append((day.strftime("%d.%m"), completed, pending))
+    return version, points
+
+def today_key():
+    """Подписи дней сдвигаются в полночь, поэтому дата тоже входит в ключ"""
+    return user_now().date().isoformat()
+
+async def get_history_chart(user_id, days=None):
+    """Возвращает (ключ кэша, запись) с PNG или уже загруженным file_id"""
+    days = days or Config.CHART_DAYS
+    version, points = _load_points(user_id, days)
+    key = (user_id, days, version, today_key())
+
+    entry = chart_cache.get(key)
+    if entry is None:
+        loop = asyncio.get_running_loop()
+        png = await loop.run_in_executor(_get_executor(), render_history_chart, points)
+        chart_cache.put(key, png)
+        entry = chart_cache.get(key)
+    return key, entry
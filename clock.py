@@ -0,0 +1,56 @@
+# clock.py
+"""
+Источник текущего времени для планировщика, доставки и обработчиков.
+
+По умолчанию время системное. simulation.py подменяет его виртуальным
+(install), чтобы прогонять недели напоминаний и ночные переносы за секунды.
+"""
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config import Config
+
+class SystemClock:
+    def now(self):
+        return datetime.now(ZoneInfo(Config.TZ))
+
+    def timestamp(self):
+        return time.time()
+
+class VirtualClock:
+    """Время, которое идёт только при вызове advance/advance_to"""
+
+    def __init__(self, start):
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=ZoneInfo(Config.TZ))
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def timestamp(self):
+        return self._now.timestamp()
+
+    def advance(self, seconds):
+        self._now += timedelta(seconds=seconds)
+
+    def advance_to(self, moment):
+        """Переводит часы вперёд; назад время не идёт"""
+        if moment > self._now:
+            self._now = moment
+
+_clock = SystemClock()
+
+def install(clock):
+    """Подменяет источник времени; возвращает прежний"""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+def now():
+    """Текущее время в часовом поясе Config.TZ"""
+    return _clock.now()
+
+def timestamp():
+    """Текущее время в секундах эпохи (для сравнения со значениями в базе)"""
+    return _clock.timestamp()
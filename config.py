@@ -1,5 +1,6 @@
 # config.py
 import os
+import socket
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения из .env файла
@@ -9,10 +10,115 @@ class Config:
     TOKEN = os.getenv("SCHEDULER_BOT_TOKEN", "")
     ADMIN_ID = int(os.getenv("SCHEDULER_BOT_ADMIN_ID", "0"))
     BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    DB_PATH = os.path.join(BASE_DIR, "scheduler.db")
-    LOG_PATH = os.path.join(BASE_DIR, "bot.log")
+    DB_PATH = os.getenv("SCHEDULER_BOT_DB_PATH", os.path.join(BASE_DIR, "scheduler.db"))
+    LOG_PATH = os.getenv("SCHEDULER_BOT_LOG_PATH", os.path.join(BASE_DIR, "bot.log"))
     PROFILE_PNG = os.path.join(BASE_DIR, "logo.png")
     TZ = "Europe/Moscow"
     
+    # Архивирование старых данных
+    ARCHIVE_DB_PATH = os.getenv("SCHEDULER_BOT_ARCHIVE_DB_PATH", os.path.join(BASE_DIR, "scheduler_archive.db"))
+    ARCHIVE_RETENTION_DAYS = int(os.getenv("SCHEDULER_BOT_ARCHIVE_RETENTION_DAYS", "90"))
+    ARCHIVE_CHUNK_SIZE = int(os.getenv("SCHEDULER_BOT_ARCHIVE_CHUNK_SIZE", "500"))
+    
+    # Резервное копирование
+    BACKUP_DIR = os.getenv("SCHEDULER_BOT_BACKUP_DIR", os.path.join(BASE_DIR, "backups"))
+    BACKUP_KEEP = int(os.getenv("SCHEDULER_BOT_BACKUP_KEEP", "7"))
+    BACKUP_PAGES_PER_STEP = int(os.getenv("SCHEDULER_BOT_BACKUP_PAGES_PER_STEP", "256"))
+    BACKUP_STEP_SLEEP = float(os.getenv("SCHEDULER_BOT_BACKUP_STEP_SLEEP", "0.05"))
+    
+    # Статистика
+    STATS_HISTORY_DAYS = int(os.getenv("SCHEDULER_BOT_STATS_HISTORY_DAYS", "7"))
+    
+    # Графики истории
+    CHART_DAYS = int(os.getenv("SCHEDULER_BOT_CHART_DAYS", "14"))
+    CHART_CACHE_MAX_BYTES = int(os.getenv("SCHEDULER_BOT_CHART_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    CHART_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULER_BOT_CHART_CACHE_MAX_ENTRIES", "10000"))
+    CHART_WORKERS = int(os.getenv("SCHEDULER_BOT_CHART_WORKERS", "2"))
+    
+    # Логирование
+    LOG_MAX_BYTES = int(os.getenv("SCHEDULER_BOT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv("SCHEDULER_BOT_LOG_BACKUP_COUNT", "5"))
+    LOG_ROTATE_WHEN = os.getenv("SCHEDULER_BOT_LOG_ROTATE_WHEN", "")  # например "midnight"
+    LOG_JSON = os.getenv("SCHEDULER_BOT_LOG_JSON", "0") == "1"
+    LOG_SAMPLE_RATE = int(os.getenv("SCHEDULER_BOT_LOG_SAMPLE_RATE", "10"))
+    
+    # Несколько процессов доставки: 0 — все напоминания обслуживает один процесс
+    SHARD_COUNT = int(os.getenv("SCHEDULER_BOT_SHARD_COUNT", "0"))
+    SHARD_LEASE_TTL = float(os.getenv("SCHEDULER_BOT_SHARD_LEASE_TTL", "15"))
+    SHARD_HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_BOT_SHARD_HEARTBEAT_SECONDS", "5"))
+    LEADER_LEASE_TTL = float(os.getenv("SCHEDULER_BOT_LEADER_LEASE_TTL", "10"))
+    LEADER_HEARTBEAT_SECONDS = float(os.getenv("SCHEDULER_BOT_LEADER_HEARTBEAT_SECONDS", "3"))
+    DELIVERY_GRACE_SECONDS = int(os.getenv("SCHEDULER_BOT_DELIVERY_GRACE_SECONDS", "300"))
+    
+    # Повторная доставка: экспоненциальная задержка между попытками и их предел
+    DELIVERY_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_BOT_DELIVERY_MAX_ATTEMPTS", "6"))
+    DELIVERY_RETRY_BASE_SECONDS = float(os.getenv("SCHEDULER_BOT_DELIVERY_RETRY_BASE_SECONDS", "5"))
+    DELIVERY_RETRY_MAX_SECONDS = float(os.getenv("SCHEDULER_BOT_DELIVERY_RETRY_MAX_SECONDS", "600"))
+    # Через сколько секунд незавершённую отправку (процесс упал) можно захватить заново
+    DELIVERY_INFLIGHT_TIMEOUT = float(os.getenv("SCHEDULER_BOT_DELIVERY_INFLIGHT_TIMEOUT", "60"))
+    
+    # Рассылка /broadcast: Telegram допускает около 30 сообщений в секунду в разные чаты
+    BROADCAST_RATE = float(os.getenv("SCHEDULER_BOT_BROADCAST_RATE", "25"))
+    BROADCAST_CONCURRENCY = int(os.getenv("SCHEDULER_BOT_BROADCAST_CONCURRENCY", "8"))
+    BROADCAST_PAGE_SIZE = int(os.getenv("SCHEDULER_BOT_BROADCAST_PAGE_SIZE", "100"))
+    BROADCAST_PROGRESS_SECONDS = float(os.getenv("SCHEDULER_BOT_BROADCAST_PROGRESS_SECONDS", "5"))
+    BROADCAST_LEASE_TTL = float(os.getenv("SCHEDULER_BOT_BROADCAST_LEASE_TTL", "60"))
+    
+    # Утренняя сводка /digest: темп отправки и размер страницы подписчиков
+    DIGEST_RATE = float(os.getenv("SCHEDULER_BOT_DIGEST_RATE", "20"))
+    DIGEST_PAGE_SIZE = int(os.getenv("SCHEDULER_BOT_DIGEST_PAGE_SIZE", "500"))
+    
+    # Сколько секунд при остановке ждать завершения начатых отправок
+    SHUTDOWN_DRAIN_SECONDS = float(os.getenv("SCHEDULER_BOT_SHUTDOWN_DRAIN_SECONDS", "10"))
+    # Размер порции при фоновой загрузке напоминаний после запуска
+    REMINDER_LOAD_CHUNK = int(os.getenv("SCHEDULER_BOT_REMINDER_LOAD_CHUNK", "500"))
+    # Групповая запись задач: окно сбора изменений в одну транзакцию и её предельный размер
+    WRITE_COALESCE_MS = float(os.getenv("SCHEDULER_BOT_WRITE_COALESCE_MS", "5"))
+    WRITE_MAX_BATCH = int(os.getenv("SCHEDULER_BOT_WRITE_MAX_BATCH", "256"))
+    # Запись обезличенных обновлений для replay.py (пусто — не записывать)
+    RECORD_UPDATES_PATH = os.getenv("SCHEDULER_BOT_RECORD_UPDATES_PATH", "")
+    # Соль хэширования id; постоянная соль сохраняет пользователей одними и теми же между запусками
+    RECORD_SALT = os.getenv("SCHEDULER_BOT_RECORD_SALT", "")
+    # Сколько отправленных ботом сообщений помнить для выбора способа правки
+    MESSAGE_CACHE_SIZE = int(os.getenv("SCHEDULER_BOT_MESSAGE_CACHE_SIZE", "4096"))
+    # Контроль цикла событий: период замера задержки и порог, после которого снимается стек
+    LOOP_LAG_INTERVAL_MS = float(os.getenv("SCHEDULER_BOT_LOOP_LAG_INTERVAL_MS", "100"))
+    LOOP_STALL_MS = float(os.getenv("SCHEDULER_BOT_LOOP_STALL_MS", "500"))
+    # Предельная длительность /profile
+    PROFILE_MAX_SECONDS = int(os.getenv("SCHEDULER_BOT_PROFILE_MAX_SECONDS", "60"))
+    # Ограничение частоты на пользователя: обновлений в секунду и допустимый всплеск
+    USER_RATE = float(os.getenv("SCHEDULER_BOT_USER_RATE", "3"))
+    USER_BURST = int(os.getenv("SCHEDULER_BOT_USER_BURST", "10"))
+    USER_BUCKETS_MAX = int(os.getenv("SCHEDULER_BOT_USER_BUCKETS_MAX", "10000"))
+    # Окно, в котором из серии переключений месяца рисуется только последнее
+    DEBOUNCE_MS = float(os.getenv("SCHEDULER_BOT_DEBOUNCE_MS", "300"))
+    # Перегрузка: столько необработанных обновлений в очереди или такая задержка цикла
+    SHED_QUEUE_DEPTH = int(os.getenv("SCHEDULER_BOT_SHED_QUEUE_DEPTH", "100"))
+    SHED_LAG_MS = float(os.getenv("SCHEDULER_BOT_SHED_LAG_MS", "250"))
+    # Выгрузка /export: размер страницы чтения и число строк, с которого файл сжимается gzip
+    EXPORT_PAGE_SIZE = int(os.getenv("SCHEDULER_BOT_EXPORT_PAGE_SIZE", "1000"))
+    EXPORT_GZIP_ROWS = int(os.getenv("SCHEDULER_BOT_EXPORT_GZIP_ROWS", "5000"))
+    # Сколько участников групп помнить в памяти, чтобы не писать в базу на каждое сообщение
+    GROUP_MEMBERS_CACHE = int(os.getenv("SCHEDULER_BOT_GROUP_MEMBERS_CACHE", "50000"))
+    # Постоянный id процесса (например, имя сервиса) нужен для сверки после сбоя: перезапуск
+    # находит свою отметку штатной остановки и освобождает отправки, прерванные падением.
+    # По умолчанию id новый у каждого запуска, и прерванные отправки ждут тайм-аута захвата
+    INSTANCE_ID_STABLE = bool(os.getenv("SCHEDULER_BOT_INSTANCE_ID"))
+    INSTANCE_ID = os.getenv("SCHEDULER_BOT_INSTANCE_ID", f"{socket.gethostname()}:{os.getpid()}")
+    
+    # Адрес Bot API; для локальной проверки можно указать fake_api.py
+    BOT_API_BASE_URL = os.getenv("SCHEDULER_BOT_API_BASE_URL", "")
+    # Соединения с Bot API для исходящих вызовов (transport.py); getUpdates идёт отдельным соединением
+    API_POOL_SIZE = int(os.getenv("SCHEDULER_BOT_API_POOL_SIZE", "32"))
+    API_KEEPALIVE_CONNECTIONS = int(os.getenv("SCHEDULER_BOT_API_KEEPALIVE_CONNECTIONS", "32"))
+    API_KEEPALIVE_EXPIRY = float(os.getenv("SCHEDULER_BOT_API_KEEPALIVE_EXPIRY", "60"))
+    API_CONNECT_TIMEOUT = float(os.getenv("SCHEDULER_BOT_API_CONNECT_TIMEOUT", "5"))
+    API_READ_TIMEOUT = float(os.getenv("SCHEDULER_BOT_API_READ_TIMEOUT", "10"))
+    API_WRITE_TIMEOUT = float(os.getenv("SCHEDULER_BOT_API_WRITE_TIMEOUT", "10"))
+    # Сколько ждать свободного соединения из пула
+    API_POOL_TIMEOUT = float(os.getenv("SCHEDULER_BOT_API_POOL_TIMEOUT", "5"))
+    # "1.1" или "2" (для HTTP/2 нужен пакет httpx[http2])
+    API_HTTP_VERSION = os.getenv("SCHEDULER_BOT_API_HTTP_VERSION", "1.1")
+    
     # Конфигурация безопасности
     SQL_PARAM_STYLE = "named"
\ No newline at end of file
@@ -2,13 +2,27 @@
 import sqlite3
 import logging
 from config import Config
+from leases import init_leases_schema
 
 logger = logging.getLogger(__name__)
 
 def init_db():
     con = sqlite3.connect(Config.DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES|sqlite3.PARSE_COLNAMES)
     cur = con.cursor()
-    
+
+    # Инкрементальная очистка нужна, чтобы архивирование возвращало место на диске.
+    # Для уже существующей базы режим вступает в силу только после VACUUM.
+    cur.execute("PRAGMA auto_vacuum")
+    if cur.fetchone()[0] != 2:
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        con.commit()
+        cur.execute("VACUUM")
+        logger.info("Switched database to incremental auto_vacuum")
+
+    # WAL: чтение не блокирует запись, и резервная копия (backup.py) снимается в
+    # одной транзакции чтения, не останавливая обработчики. Режим хранится в файле
+    cur.execute("PRAGMA journal_mode=WAL")
+
     # Создание таблицы напоминаний с использованием параметризованных запросов
     cur.execute("""
         CREATE TABLE IF NOT EXISTS reminders (
@@ -40,10 +54,317 @@ def init_db():
     except sqlite3.OperationalError:
         # Поле уже существует
         pass
-    
+
+    try:
+        cur.execute("ALTER TABLE tasks ADD COLUMN rollover_count INTEGER NOT NULL DEFAULT 0")
+    except sqlite3.OperationalError:
+        # Поле уже существует
+        pass
+
+    # Закрепление отправки за процессом в режиме шардов
+    for column in ("claimed_by TEXT", "claimed_at REAL"):
+        try:
+            cur.execute(f"ALTER TABLE reminders ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            # Поле уже существует
+            pass
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders (sent, id)")
+    # Загрузка при запуске идёт по времени события, ближайшие напоминания первыми
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders (sent, scheduled_iso, id)")
+
+    init_stats_schema(cur)
+    init_history_schema(cur)
+    init_delivery_schema(cur)
+    init_broadcast_schema(cur)
+    init_digest_schema(cur)
+    init_leases_schema(cur)
+    init_export_schema(cur)
+    init_groups_schema(cur)
+
+    # Служебные отметки, например о штатной остановке
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+
     con.commit(); con.close()
     logger.info("Database initialized")
 
+def init_stats_schema(cur):
+    """Таблицы и триггеры счётчиков статистики, чтобы /stats не сканировал таблицы"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            day_iso TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day_iso, metric)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS stats_active_users (
+            day_iso TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day_iso, user_id)
+        ) WITHOUT ROWID
+    """)
+
+    # Первичное заполнение счётчиков для базы, созданной до их появления
+    cur.execute("SELECT COUNT(*) FROM stats_counters")
+    if cur.fetchone()[0] == 0:
+        cur.execute("""
+            INSERT INTO stats_counters (name, value)
+            SELECT 'reminders_total', COUNT(*) FROM reminders
+            UNION ALL SELECT 'reminders_active', COUNT(*) FROM reminders WHERE sent=0
+            UNION ALL SELECT 'tasks_total', COUNT(*) FROM tasks
+        """)
+        cur.execute("""
+            INSERT OR REPLACE INTO stats_daily (day_iso, metric, value)
+            SELECT substr(completed_iso, 1, 10), 'tasks_completed', COUNT(*)
+            FROM tasks WHERE status='completed' AND completed_iso IS NOT NULL
+            GROUP BY substr(completed_iso, 1, 10)
+        """)
+        logger.info("Stats counters seeded")
+
+    # Отправленные напоминания считаются по дню события: время хранится в Config.TZ,
+    # а упреждение не превышает часа
+    triggers = {
+        "trg_stats_reminder_insert": """
+            AFTER INSERT ON reminders BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'reminders_total';
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'reminders_active' AND NEW.sent = 0;
+            END
+        """,
+        "trg_stats_reminder_sent": """
+            AFTER UPDATE OF sent ON reminders WHEN OLD.sent = 0 AND NEW.sent = 1 BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'reminders_active';
+                INSERT INTO stats_daily (day_iso, metric, value)
+                VALUES (substr(NEW.scheduled_iso, 1, 10), 'reminders_sent', 1)
+                ON CONFLICT (day_iso, metric) DO UPDATE SET value = value + 1;
+            END
+        """,
+        "trg_stats_reminder_delete": """
+            AFTER DELETE ON reminders WHEN OLD.sent = 0 BEGIN
+                UPDATE stats_counters SET value = value - 1 WHERE name = 'reminders_active';
+            END
+        """,
+        "trg_stats_task_insert": """
+            AFTER INSERT ON tasks BEGIN
+                UPDATE stats_counters SET value = value + 1 WHERE name = 'tasks_total';
+                INSERT INTO stats_daily (day_iso, metric, value)
+                VALUES (substr(NEW.created_iso, 1, 10), 'tasks_created', 1)
+                ON CONFLICT (day_iso, metric) DO UPDATE SET value = value + 1;
+            END
+        """,
+        "trg_stats_task_completed": """
+            AFTER UPDATE OF status ON tasks
+            WHEN NEW.status = 'completed' AND OLD.status <> 'completed' BEGIN
+                INSERT INTO stats_daily (day_iso, metric, value)
+                VALUES (substr(NEW.completed_iso, 1, 10), 'tasks_completed', 1)
+                ON CONFLICT (day_iso, metric) DO UPDATE SET value = value + 1;
+            END
+        """,
+        "trg_stats_task_reopened": """
+            AFTER UPDATE OF status ON tasks
+            WHEN OLD.status = 'completed' AND NEW.status <> 'completed' BEGIN
+                UPDATE stats_daily SET value = value - 1
+                WHERE day_iso = substr(OLD.completed_iso, 1, 10) AND metric = 'tasks_completed';
+            END
+        """,
+    }
+    for name, body in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+def init_delivery_schema(cur):
+    """Колонки состояния доставки, таблица недоступных чатов и счётчик потерянных напоминаний"""
+    columns = (
+        "delivery_state TEXT NOT NULL DEFAULT 'pending'",
+        "attempts INTEGER NOT NULL DEFAULT 0",
+        "next_attempt_at REAL",
+        "last_error TEXT",
+        "idempotency_key TEXT",
+    )
+    for column in columns:
+        try:
+            cur.execute(f"ALTER TABLE reminders ADD COLUMN {column}")
+            if column.startswith("delivery_state"):
+                # Напоминания, отправленные до появления состояний
+                cur.execute("UPDATE reminders SET delivery_state='sent' WHERE sent=1")
+        except sqlite3.OperationalError:
+            # Поле уже существует
+            pass
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            chat_id INTEGER PRIMARY KEY,
+            reason TEXT NOT NULL,
+            failed_iso TEXT NOT NULL,
+            reminder_id INTEGER
+        )
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_state ON reminders (user_id, delivery_state)"
+    )
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_stats_reminder_dead
+        AFTER UPDATE OF delivery_state ON reminders
+        WHEN NEW.delivery_state = 'dead' AND OLD.delivery_state <> 'dead' AND NEW.sent = 0 BEGIN
+            UPDATE stats_counters SET value = value - 1 WHERE name = 'reminders_active';
+            INSERT INTO stats_daily (day_iso, metric, value)
+            VALUES (substr(NEW.scheduled_iso, 1, 10), 'reminders_dead', 1)
+            ON CONFLICT (day_iso, metric) DO UPDATE SET value = value + 1;
+        END
+    """)
+
+def init_broadcast_schema(cur):
+    """Рассылки администратора; last_user_id позволяет продолжить прерванную рассылку"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER,
+            created_iso TEXT NOT NULL,
+            finished_iso TEXT
+        )
+    """)
+
+def init_digest_schema(cur):
+    """Подписки на утреннюю сводку; last_sent_day защищает от повторной отправки за день"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS digest_subscriptions (
+            user_id INTEGER PRIMARY KEY,
+            hour INTEGER NOT NULL DEFAULT 0,
+            last_sent_day TEXT NOT NULL DEFAULT ''
+        )
+    """)
+    # Напоминания пользователя на день выбираются по диапазону времени
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_time ON reminders (user_id, scheduled_iso)"
+    )
+
+def init_groups_schema(cur):
+    """Списки чатов: задачи и напоминания принадлежат чату, в группе их видят все участники"""
+    for table in ("tasks", "reminders"):
+        try:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN chat_id INTEGER")
+        except sqlite3.OperationalError:
+            # Поле уже существует
+            pass
+        # Всё созданное до групп — личное: id личного чата совпадает с id пользователя
+        cur.execute(f"UPDATE {table} SET chat_id = user_id WHERE chat_id IS NULL")
+        # То же для вставок без chat_id (замеры, симуляция, старый код)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_personal_chat
+            AFTER INSERT ON {table} WHEN NEW.chat_id IS NULL
+            BEGIN UPDATE {table} SET chat_id = NEW.user_id WHERE id = NEW.id; END
+        """)
+    # Список дня и напоминания чата — один поиск по индексу, сколько бы ни было участников
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_chat_day ON tasks (chat_id, day_iso)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reminders_chat_time ON reminders (chat_id, scheduled_iso)")
+
+    # Участники групп, которых видел бот; username в нижнем регистре — для разбора @упоминаний
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_members (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            first_name TEXT NOT NULL DEFAULT '',
+            joined_iso TEXT NOT NULL,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_members_username ON chat_members (chat_id, username)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_chat_members_user ON chat_members (user_id)")
+
+    # Исполнители группового напоминания упоминаются в нём при доставке
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reminder_assignees (
+            reminder_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (reminder_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_reminder_assignees_delete
+        AFTER DELETE ON reminders
+        BEGIN DELETE FROM reminder_assignees WHERE reminder_id = OLD.id; END
+    """)
+
+def init_export_schema(cur):
+    """file_id загруженных выгрузок /export и версия данных, из которой они построены"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS export_files (
+            user_id INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            PRIMARY KEY (user_id, format)
+        ) WITHOUT ROWID
+    """)
+
+def init_history_schema(cur):
+    """Дневные сводки по пользователям для отчёта об истории без сканирования tasks"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_daily (
+            user_id INTEGER NOT NULL,
+            day_iso TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            rolled_over INTEGER NOT NULL DEFAULT 0,
+            streak INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day_iso)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_history (
+            user_id INTEGER PRIMARY KEY,
+            best_streak INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_user_rollover ON tasks (user_id, rollover_count)"
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_day ON tasks (user_id, day_iso)")
+
+    # Версия данных пользователя для инвалидации кэшей (графики, выгрузки)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_versions (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    bump = """
+        INSERT INTO user_versions (user_id, version) VALUES ({row}.user_id, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+    """
+    # Изменение служебных полей (закрепление за процессом, состояние доставки)
+    # не меняет того, что видно в графиках и выгрузках, и кэши не сбрасывает
+    visible = {
+        "tasks": "status, description, day_iso, completed_iso",
+        "reminders": "title, scheduled_iso, lead_minutes, sent",
+    }
+    for table, columns in visible.items():
+        # Прежний триггер срабатывал на любое изменение строки
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_version_{table}_update")
+        for name, event, row in (("insert", "INSERT", "NEW"), ("edit", f"UPDATE OF {columns}", "NEW"),
+                                 ("delete", "DELETE", "OLD")):
+            cur.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{name} "
+                f"AFTER {event} ON {table} BEGIN {bump.format(row=row)} END"
+            )
+
 def get_connection():
     """Возвращает безопасное соединение с базой данных"""
     return sqlite3.connect(
@@ -52,6 +373,18 @@ def get_connection():
         timeout=15  # Таймаут для избежания блокировок
     )
 
+def set_meta(key, value):
+    with get_connection() as con:
+        con.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        con.commit()
+
+def pop_meta(key):
+    """Читает и удаляет отметку; None, если её нет"""
+    with get_connection() as con:
+        row = con.execute("DELETE FROM meta WHERE key=? RETURNING value", (key,)).fetchone()
+        con.commit()
+    return row[0] if row else None
+
 def execute_sql(sql, params=None):
     """Безопасное выполнение SQL-запроса"""
     try:
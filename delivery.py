@@ -0,0 +1,205 @@
+# delivery.py
+import random
+import logging
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter
+from config import Config
+from database import get_connection
+import clock
+
+logger = logging.getLogger(__name__)
+
+# Состояния доставки напоминания:
+# pending → in_flight → sent
+#                     ↘ retrying → in_flight → ...
+#                     ↘ dead (чат недоступен, ошибка не исправится повтором или попытки исчерпаны)
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+SENT = "sent"
+RETRYING = "retrying"
+DEAD = "dead"
+
+# Исходы неудачной отправки
+RETRY = "retry"
+DEAD_REMINDER = "dead_reminder"
+DEAD_CHAT = "dead_chat"
+
+# Ошибки BadRequest, после которых писать в чат бессмысленно
+DEAD_CHAT_ERRORS = ("chat not found", "user is deactivated", "bot was blocked", "peer_id_invalid")
+
+def claim(reminder_id, owner, lease_name=None):
+    """Переводит напоминание в in_flight и возвращает (ключ попытки, номер попытки).
+
+    Захват удаётся только из pending/retrying или у зависшей отправки, поэтому одну попытку
+    выполняет ровно один процесс. Ключ попытки (idempotency_key) подтверждает последующие
+    переходы: устаревший исполнитель не сможет ни отметить отправку, ни назначить повтор.
+    lease_name — аренда, которой процесс должен владеть в момент захвата (шард или ведущий).
+    Возвращает None, если напоминание уже отправлено, захвачено или чат недоступен.
+    """
+    now = clock.timestamp()
+    sql = """
+        UPDATE reminders SET
+            delivery_state = 'in_flight',
+            attempts = attempts + 1,
+            idempotency_key = id || ':' || (attempts + 1),
+            claimed_by = ?,
+            claimed_at = ?
+        WHERE id = ? AND sent = 0
+          AND (delivery_state IN ('pending', 'retrying')
+               OR (delivery_state = 'in_flight' AND claimed_at < ?))
+          AND NOT EXISTS (SELECT 1 FROM dead_letters WHERE chat_id = reminders.chat_id)
+    """
+    params = [owner, now, reminder_id, now - Config.DELIVERY_INFLIGHT_TIMEOUT]
+    if lease_name:
+        sql += " AND EXISTS (SELECT 1 FROM leases WHERE name = ? AND owner = ? AND expires_at > ?)"
+        params += [lease_name, owner, now]
+
+    with get_connection() as con:
+        row = con.execute(sql + " RETURNING idempotency_key, attempts", params).fetchone()
+        con.commit()
+    return (row[0], row[1]) if row else None
+
+def mark_sent(reminder_id, key):
+    with get_connection() as con:
+        con.execute("""
+            UPDATE reminders SET sent=1, delivery_state='sent', next_attempt_at=NULL, last_error=NULL
+            WHERE id=? AND idempotency_key=? AND delivery_state='in_flight'
+        """, (reminder_id, key))
+        con.commit()
+
+def schedule_retry(reminder_id, key, next_attempt_at, error):
+    with get_connection() as con:
+        cur = con.execute("""
+            UPDATE reminders SET delivery_state='retrying', next_attempt_at=?, last_error=?
+            WHERE id=? AND idempotency_key=? AND delivery_state='in_flight'
+        """, (next_attempt_at, error[:500], reminder_id, key))
+        con.commit()
+        return cur.rowcount == 1
+
+def mark_dead(reminder_id, key, error):
+    with get_connection() as con:
+        con.execute("""
+            UPDATE reminders SET delivery_state='dead', next_attempt_at=NULL, last_error=?
+            WHERE id=? AND idempotency_key=? AND delivery_state='in_flight'
+        """, (error[:500], reminder_id, key))
+        con.commit()
+
+def add_dead_letter(chat_id, reason, reminder_id):
+    """Заносит чат в dead_letters и гасит все его неотправленные напоминания.
+
+    Возвращает id погашенных напоминаний, чтобы снять их задачи в планировщике.
+    """
+    with get_connection() as con:
+        con.execute("""
+            INSERT OR REPLACE INTO dead_letters (chat_id, reason, failed_iso, reminder_id)
+            VALUES (?, ?, datetime('now'), ?)
+        """, (chat_id, reason[:500], reminder_id))
+        rows = con.execute("""
+            UPDATE reminders SET delivery_state='dead', next_attempt_at=NULL, last_error=?
+            WHERE chat_id=? AND sent=0 AND delivery_state <> 'dead'
+            RETURNING id
+        """, (reason[:500], chat_id)).fetchall()
+        con.commit()
+    return [row[0] for row in rows]
+
+def suppress_if_dead_chat(reminder_id, chat_id):
+    """Гасит напоминание, если его чат в dead_letters. Возвращает True, если погашено"""
+    with get_connection() as con:
+        cur = con.execute("""
+            UPDATE reminders SET delivery_state='dead', next_attempt_at=NULL,
+                last_error=(SELECT reason FROM dead_letters WHERE chat_id=?)
+            WHERE id=? AND sent=0 AND delivery_state <> 'dead'
+              AND EXISTS (SELECT 1 FROM dead_letters WHERE chat_id=?)
+        """, (chat_id, reminder_id, chat_id))
+        con.commit()
+        return cur.rowcount == 1
+
+def expire(reminder_id, error="event time passed"):
+    """Гасит повтор, который опоздал к событию"""
+    with get_connection() as con:
+        con.execute("""
+            UPDATE reminders SET delivery_state='dead', next_attempt_at=NULL, last_error=?
+            WHERE id=? AND sent=0 AND delivery_state IN ('retrying', 'in_flight')
+        """, (error, reminder_id))
+        con.commit()
+
+def checkpoint_in_flight(owner):
+    """Прерванные остановкой отправки процесса owner переводит в retrying без ожидания тайм-аута.
+
+    Дошло ли сообщение, неизвестно, поэтому при следующем запуске оно будет отправлено
+    повторно: дубль лучше потерянного напоминания.
+    """
+    with get_connection() as con:
+        cur = con.execute("""
+            UPDATE reminders SET delivery_state='retrying', next_attempt_at=?,
+                last_error='interrupted by shutdown'
+            WHERE delivery_state='in_flight' AND claimed_by=?
+        """, (clock.timestamp(), owner))
+        con.commit()
+        return cur.rowcount
+
+def release_orphaned_claims(owner, claimed_before):
+    """Отправки, захваченные процессом owner до claimed_before, переводит в retrying (сверка после сбоя).
+
+    Прежний процесс с этим INSTANCE_ID упал посреди отправки; захваты других
+    экземпляров освобождают они сами или тайм-аут захвата.
+    """
+    with get_connection() as con:
+        cur = con.execute("""
+            UPDATE reminders SET delivery_state='retrying', next_attempt_at=?,
+                last_error='owner process died'
+            WHERE delivery_state='in_flight' AND claimed_by=? AND claimed_at < ?
+        """, (clock.timestamp(), owner, claimed_before))
+        con.commit()
+        return cur.rowcount
+
+def resume_timestamp(state, next_attempt_at, claimed_at):
+    """Когда продолжить доставку после перезапуска; None — напоминание ещё не начинали отправлять"""
+    if state == RETRYING:
+        return next_attempt_at or clock.timestamp()
+    if state == IN_FLIGHT:
+        # Процесс упал посреди отправки: захват станет возможен после тайм-аута
+        return (claimed_at or 0) + Config.DELIVERY_INFLIGHT_TIMEOUT
+    return None
+
+def revive_chat(chat_id):
+    """Пользователь снова пишет боту: чат доступен, новые напоминания доставляются"""
+    with get_connection() as con:
+        cur = con.execute("DELETE FROM dead_letters WHERE chat_id=?", (chat_id,))
+        con.commit()
+    if cur.rowcount:
+        logger.info("Chat %s removed from dead letters", chat_id)
+    return cur.rowcount == 1
+
+def migrate_chat(old_chat_id, new_chat_id):
+    """Группа стала супергруппой: задачи, напоминания и участники переходят на новый id чата"""
+    with get_connection() as con:
+        for table in ("tasks", "reminders"):
+            con.execute(f"UPDATE {table} SET chat_id=? WHERE chat_id=?", (new_chat_id, old_chat_id))
+        # Участник мог уже появиться под новым id: такая запись свежее
+        con.execute("UPDATE OR IGNORE chat_members SET chat_id=? WHERE chat_id=?", (new_chat_id, old_chat_id))
+        con.execute("DELETE FROM chat_members WHERE chat_id=?", (old_chat_id,))
+        con.commit()
+    logger.info("Chat %s migrated to %s", old_chat_id, new_chat_id)
+
+def classify(error):
+    """Исход неудачной отправки и задержка повтора в секундах (None — по расписанию попыток)"""
+    if isinstance(error, Forbidden):
+        return DEAD_CHAT, None
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        if any(text in message for text in DEAD_CHAT_ERRORS):
+            return DEAD_CHAT, None
+        # Некорректный запрос не исправится повтором
+        return DEAD_REMINDER, None
+    if isinstance(error, ChatMigrated):
+        # Старый id больше не принимает сообщений; отправку по новому id делает вызывающий
+        return DEAD_REMINDER, None
+    if isinstance(error, RetryAfter):
+        return RETRY, float(error.retry_after)
+    # Сетевые ошибки, тайм-ауты и сбои на стороне Telegram
+    return RETRY, None
+
+def backoff(attempt):
+    """Экспоненциальная задержка с небольшим разбросом, чтобы повторы не шли залпом"""
+    delay = min(Config.DELIVERY_RETRY_BASE_SECONDS * 2 ** (attempt - 1), Config.DELIVERY_RETRY_MAX_SECONDS)
+    return delay + random.uniform(0, delay * 0.1)
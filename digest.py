@@ -0,0 +1,203 @@
+# digest.py
+"""
+Утренняя сводка: задачи и напоминания на день для подписчиков /digest.
+
+Сводки строятся страницами подписчиков: одна сгруппированная выборка по tasks и
+reminders на страницу, строки читаются курсором подряд и собираются в сообщения
+через groupby по user_id — без отдельного запроса на каждого пользователя.
+Отправка идёт в общем темпе Config.DIGEST_RATE; после каждой страницы
+подписчики отмечаются отправленными, поэтому перезапуск не повторит сводку.
+
+Замер генерации для 100 тыс. подписчиков: python digest.py
+"""
+import time
+import asyncio
+import logging
+from itertools import groupby
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from config import Config
+from database import get_connection
+from ratelimit import TokenBucket
+import broadcast
+import clock
+import metrics
+
+logger = logging.getLogger(__name__)
+
+KIND_SUBSCRIBER = 0
+KIND_TASK = 1
+KIND_REMINDER = 2
+
+# Строка-заголовок на каждого подписчика гарантирует сводку и тем, у кого день пуст.
+# CROSS JOIN закрепляет порядок: сначала страница подписчиков, затем поиск по индексам
+# (chat_id, day_iso) и (chat_id, scheduled_iso), а не просмотр всех задач. Сводка
+# приходит в личный чат, поэтому задачи групп, созданные подписчиком, в неё не входят
+DIGEST_PAGE_SQL = """
+    WITH subs AS MATERIALIZED (
+        SELECT user_id FROM digest_subscriptions
+        WHERE hour <= :hour AND last_sent_day < :day AND user_id > :after
+          AND user_id NOT IN (SELECT chat_id FROM dead_letters)
+        ORDER BY user_id LIMIT :limit
+    )
+    SELECT user_id, 0, NULL, NULL, NULL FROM subs
+    UNION ALL
+    SELECT t.chat_id, 1, t.id, t.description, t.status
+    FROM subs CROSS JOIN tasks t ON t.chat_id = subs.user_id AND t.day_iso = :day
+    UNION ALL
+    SELECT r.chat_id, 2, r.scheduled_iso, r.title, NULL
+    FROM subs CROSS JOIN reminders r ON r.chat_id = subs.user_id
+     AND r.scheduled_iso >= :day AND r.scheduled_iso < :next_day
+     AND r.sent = 0 AND r.delivery_state != 'dead'
+    ORDER BY 1, 2, 3
+"""
+
+def subscribe(user_id, hour):
+    """Подписывает на сводку в указанный час; сегодняшняя не придёт, если её час уже прошёл"""
+    now = clock.now()
+    last_sent_day = now.date().isoformat() if hour <= now.hour else ""
+    with get_connection() as con:
+        con.execute("""
+            INSERT INTO digest_subscriptions (user_id, hour, last_sent_day) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET hour = excluded.hour,
+                last_sent_day = MAX(last_sent_day, excluded.last_sent_day)
+        """, (user_id, hour, last_sent_day))
+        con.commit()
+
+def unsubscribe(user_id):
+    with get_connection() as con:
+        cur = con.execute("DELETE FROM digest_subscriptions WHERE user_id=?", (user_id,))
+        con.commit()
+        return cur.rowcount > 0
+
+def get_subscription(user_id):
+    """Час сводки или None"""
+    with get_connection() as con:
+        row = con.execute("SELECT hour FROM digest_subscriptions WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+def format_digest(day, tasks, reminders):
+    lines = [f"☀️ План на {day.strftime('%d.%m.%Y')}"]
+    if not tasks and not reminders:
+        lines.append("Задач и напоминаний нет. Хорошего дня!")
+        return "\n".join(lines)
+    if tasks:
+        lines.append("")
+        lines.append("📋 Задачи:")
+        lines.extend(f"{'✅' if status == 'completed' else '❌'} {description}" for description, status in tasks)
+    if reminders:
+        lines.append("")
+        lines.append("⏰ Напоминания:")
+        lines.extend(f"• {scheduled_iso[11:16]} {title}" for scheduled_iso, title in reminders)
+    return "\n".join(lines)
+
+def build_page(day, hour, after_user_id, limit):
+    """Следующая страница сводок: [(user_id, текст)]"""
+    params = {
+        "day": day.isoformat(),
+        "next_day": (day + timedelta(days=1)).isoformat(),
+        "hour": hour,
+        "after": after_user_id,
+        "limit": limit,
+    }
+    page = []
+    with get_connection() as con:
+        rows = con.execute(DIGEST_PAGE_SQL, params)
+        for user_id, group in groupby(rows, key=lambda row: row[0]):
+            tasks = []
+            reminders = []
+            # Третий столбец — порядок внутри вида: id задачи или время напоминания
+            for _, kind, order, title, status in group:
+                if kind == KIND_TASK:
+                    tasks.append((title, status))
+                elif kind == KIND_REMINDER:
+                    reminders.append((order, title))
+            page.append((user_id, format_digest(day, tasks, reminders)))
+    return page
+
+def _mark_sent(user_ids, day):
+    with get_connection() as con:
+        con.executemany(
+            "UPDATE digest_subscriptions SET last_sent_day=? WHERE user_id=?",
+            [(day.isoformat(), user_id) for user_id in user_ids]
+        )
+        con.commit()
+
+async def send_due(bot):
+    """Отправляет сводки, час которых наступил; выполняется ведущим раз в час"""
+    now = clock.now()
+    day = now.date()
+    bucket = TokenBucket(Config.DIGEST_RATE, capacity=Config.BROADCAST_CONCURRENCY)
+    semaphore = asyncio.Semaphore(Config.BROADCAST_CONCURRENCY)
+    after = 0
+    sent = failed = 0
+    started = time.perf_counter()
+
+    while True:
+        with metrics.timed("digest.page"):
+            page = await asyncio.to_thread(build_page, day, now.hour, after, Config.DIGEST_PAGE_SIZE)
+        if not page:
+            break
+        results = await asyncio.gather(*(
+            broadcast.send_paced(bot, bucket, semaphore, user_id, text, metric="digest")
+            for user_id, text in page
+        ))
+        sent += sum(results)
+        failed += len(results) - sum(results)
+        after = page[-1][0]
+        # Неудачные тоже отмечаются: повтор сводки позже в тот же день уже не нужен
+        await asyncio.to_thread(_mark_sent, [user_id for user_id, _ in page], day)
+
+    if sent or failed:
+        logger.info("Digests sent: %d, failed: %d in %.1fs", sent, failed, time.perf_counter() - started)
+
+def _benchmark():
+    """Время генерации сводок (без отправки) для 100 тыс. подписчиков"""
+    import os
+    import random
+    import tempfile
+    from database import init_db
+
+    subscribers = 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.DB_PATH = os.path.join(tmp, "bench.db")
+        init_db()
+        now = datetime.now(ZoneInfo(Config.TZ))
+        day = now.date()
+        day_iso = day.isoformat()
+        rng = random.Random(1)
+        with get_connection() as con:
+            con.executemany(
+                "INSERT INTO digest_subscriptions (user_id, hour) VALUES (?, ?)",
+                [(user_id, 0) for user_id in range(1, subscribers + 1)]
+            )
+            con.executemany(
+                "INSERT INTO tasks (user_id, description, day_iso, created_iso, original_day_iso) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(rng.randint(1, subscribers), f"task {i}", day_iso, now.isoformat(), day_iso)
+                 for i in range(3 * subscribers)]
+            )
+            con.executemany(
+                "INSERT INTO reminders (user_id, title, scheduled_iso, lead_minutes, created_iso) "
+                "VALUES (?, ?, ?, 0, ?)",
+                [(rng.randint(1, subscribers), f"reminder {i}",
+                  now.replace(hour=rng.randint(0, 23), minute=0).isoformat(), now.isoformat())
+                 for i in range(subscribers)]
+            )
+            con.commit()
+
+        started = time.perf_counter()
+        after = 0
+        users = 0
+        while True:
+            page = build_page(day, 23, after, Config.DIGEST_PAGE_SIZE)
+            if not page:
+                break
+            users += len(page)
+            after = page[-1][0]
+        elapsed = time.perf_counter() - started
+        print(f"{users} digests generated in {elapsed:.2f}s ({users / elapsed:.0f} per second, "
+              f"page {Config.DIGEST_PAGE_SIZE})")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,294 @@
+# export.py
+"""
+Выгрузка задач и напоминаний пользователя в CSV и iCalendar (/export).
+
+Строки читаются страницами по Config.EXPORT_PAGE_SIZE с продолжением по ключу
+(дата, id) из основной базы и из архива и сразу пишутся во временный файл —
+вся история в памяти не собирается. Страница — отдельный короткий запрос:
+курсор, открытый на всю выгрузку, держал бы транзакцию чтения, и контрольная
+точка WAL не могла бы перенести журнал в базу. Выгрузка больше
+Config.EXPORT_GZIP_ROWS строк сжимается gzip по мере записи. Файл строится в
+потоке, а не в цикле событий.
+
+Загруженный в Telegram файл запоминается в export_files вместе с версией данных
+пользователя (user_versions); пока версия не изменилась, повторная выгрузка
+отправляет тот же file_id без построения и загрузки.
+
+Замер на 100 тыс. задач: python export.py
+"""
+import os
+import csv
+import gzip
+import time
+import logging
+import tempfile
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+from config import Config
+from database import get_connection
+from archive import get_archive_connection
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ics")
+
+CSV_HEADER = ["type", "id", "title", "date", "time", "status", "lead_minutes", "created", "completed", "archived"]
+
+# Выгружается только личный чат (chat_id = id пользователя): задачи и напоминания
+# групп, созданные пользователем, принадлежат группе
+TASK_PAGE_SQL = """
+    SELECT id, description, day_iso, status, created_iso, completed_iso
+    FROM {db}.tasks
+    WHERE {key} = ? AND (day_iso, id) > (?, ?)
+    ORDER BY day_iso, id LIMIT ?
+"""
+
+REMINDER_PAGE_SQL = """
+    SELECT id, title, scheduled_iso, lead_minutes, sent, created_iso
+    FROM {db}.reminders
+    WHERE {key} = ? AND (scheduled_iso, id) > (?, ?)
+    ORDER BY scheduled_iso, id LIMIT ?
+"""
+
+def get_version(con, user_id):
+    row = con.execute("SELECT version FROM user_versions WHERE user_id=?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+def get_cached_file_id(user_id, fmt):
+    """file_id прошлой выгрузки, если данные пользователя с тех пор не менялись"""
+    with get_connection() as con:
+        row = con.execute(
+            "SELECT version, file_id FROM export_files WHERE user_id=? AND format=?", (user_id, fmt)
+        ).fetchone()
+        if row and row[0] == get_version(con, user_id):
+            return row[1]
+    return None
+
+def remember_file_id(user_id, fmt, version, file_id):
+    with get_connection() as con:
+        con.execute("""
+            INSERT INTO export_files (user_id, format, version, file_id) VALUES (?, ?, ?, ?)
+            ON CONFLICT (user_id, format) DO UPDATE SET version = excluded.version, file_id = excluded.file_id
+        """, (user_id, fmt, version, file_id))
+
+def forget_file_id(user_id, fmt):
+    with get_connection() as con:
+        con.execute("DELETE FROM export_files WHERE user_id=? AND format=?", (user_id, fmt))
+
+def _sources():
+    """Схемы с данными пользователя: сначала архив (более старые строки), затем основная"""
+    dbs = []
+    if os.path.exists(Config.ARCHIVE_DB_PATH):
+        dbs.append("archive")
+    dbs.append("main")
+    return dbs
+
+def _chat_key(con, db, table):
+    """Столбец чата в таблице или None, если таблицы нет"""
+    columns = {row[1] for row in con.execute(f"PRAGMA {db}.table_info({table})")}
+    if not columns:
+        return None
+    # Архив без chat_id ещё не синхронизирован после появления групп: в нём только личные записи
+    return "chat_id" if "chat_id" in columns else "user_id"
+
+def _pages(con, sql, user_id):
+    """Строки выборки по страницам; продолжение по (дата, id) последней строки"""
+    last_key, last_id = "", 0
+    while True:
+        rows = con.execute(sql, (user_id, last_key, last_id, Config.EXPORT_PAGE_SIZE)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < Config.EXPORT_PAGE_SIZE:
+            return
+        last_key, last_id = rows[-1][2], rows[-1][0]
+
+def _rows(con, user_id):
+    """(тип, строка, из архива) для задач и напоминаний личного чата пользователя"""
+    for table, sql in (("tasks", TASK_PAGE_SQL), ("reminders", REMINDER_PAGE_SQL)):
+        for db in _sources():
+            key = _chat_key(con, db, table)
+            if not key:
+                continue
+            for row in _pages(con, sql.format(db=db, key=key), user_id):
+                yield table, row, db == "archive"
+
+def _count_rows(con, user_id):
+    total = 0
+    for table in ("tasks", "reminders"):
+        for db in _sources():
+            key = _chat_key(con, db, table)
+            if key:
+                total += con.execute(f"SELECT COUNT(*) FROM {db}.{table} WHERE {key}=?", (user_id,)).fetchone()[0]
+    return total
+
+def _local(iso):
+    value = datetime.fromisoformat(iso)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=ZoneInfo(Config.TZ))
+    return value.astimezone(ZoneInfo(Config.TZ))
+
+def _write_csv(out, rows):
+    writer = csv.writer(out)
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for table, row, archived in rows:
+        if table == "tasks":
+            task_id, description, day_iso, status, created_iso, completed_iso = row
+            writer.writerow(["task", task_id, description, day_iso, "", status, "",
+                             created_iso, completed_iso or "", int(archived)])
+        else:
+            reminder_id, title, scheduled_iso, lead_minutes, sent, created_iso = row
+            scheduled = _local(scheduled_iso)
+            writer.writerow(["reminder", reminder_id, title or "", scheduled.date().isoformat(),
+                             scheduled.strftime("%H:%M"), "sent" if sent else "pending", lead_minutes,
+                             created_iso, "", int(archived)])
+        count += 1
+    return count
+
+def _ics_text(value):
+    return (value or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def _ics_utc(iso):
+    return _local(iso).astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def _ics_line(out, line):
+    """Строки длиннее 75 байт переносятся по RFC 5545, не разрывая символы UTF-8"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        out.write(line + "\r\n")
+        return
+    chunk, size, limit = [], 0, 75
+    for char in line:
+        char_size = len(char.encode("utf-8"))
+        if size + char_size > limit:
+            out.write("".join(chunk) + "\r\n ")
+            chunk, size, limit = [], 0, 74
+        chunk.append(char)
+        size += char_size
+    out.write("".join(chunk) + "\r\n")
+
+def _write_ics(out, rows):
+    _ics_line(out, "BEGIN:VCALENDAR")
+    _ics_line(out, "VERSION:2.0")
+    _ics_line(out, "PRODID:-//Scheduler Bot//RU")
+    _ics_line(out, "CALSCALE:GREGORIAN")
+    count = 0
+    for table, row, _ in rows:
+        if table == "tasks":
+            task_id, description, day_iso, status, created_iso, completed_iso = row
+            lines = [
+                "BEGIN:VTODO",
+                f"UID:task-{task_id}@scheduler-bot",
+                f"DTSTAMP:{_ics_utc(created_iso)}",
+                f"SUMMARY:{_ics_text(description)}",
+                f"DUE;VALUE=DATE:{day_iso.replace('-', '')}",
+                f"STATUS:{'COMPLETED' if status == 'completed' else 'NEEDS-ACTION'}",
+            ]
+            if completed_iso:
+                lines.append(f"COMPLETED:{_ics_utc(completed_iso)}")
+            lines.append("END:VTODO")
+        else:
+            reminder_id, title, scheduled_iso, lead_minutes, sent, created_iso = row
+            lines = [
+                "BEGIN:VEVENT",
+                f"UID:reminder-{reminder_id}@scheduler-bot",
+                f"DTSTAMP:{_ics_utc(created_iso)}",
+                f"DTSTART:{_ics_utc(scheduled_iso)}",
+                f"SUMMARY:{_ics_text(title)}",
+            ]
+            if lead_minutes:
+                lines.extend([
+                    "BEGIN:VALARM",
+                    "ACTION:DISPLAY",
+                    f"DESCRIPTION:{_ics_text(title)}",
+                    f"TRIGGER:-PT{lead_minutes}M",
+                    "END:VALARM",
+                ])
+            lines.append("END:VEVENT")
+        for line in lines:
+            _ics_line(out, line)
+        count += 1
+    _ics_line(out, "END:VCALENDAR")
+    return count
+
+def build_export(user_id, fmt):
+    """Пишет выгрузку во временный файл; возвращает (путь, имя файла, строк, версия).
+
+    Вызывается через asyncio.to_thread. Версия читается до первой страницы: если
+    данные менялись во время записи, file_id под этой версией всё равно не
+    совпадёт с текущей и не будет использован повторно.
+    """
+    started = time.perf_counter()
+    con = get_archive_connection() if os.path.exists(Config.ARCHIVE_DB_PATH) else get_connection()
+    try:
+        version = get_version(con, user_id)
+        compress = _count_rows(con, user_id) > Config.EXPORT_GZIP_ROWS
+        filename = f"scheduler-{time.strftime('%Y%m%d')}.{fmt}" + (".gz" if compress else "")
+        fd, path = tempfile.mkstemp(prefix="export-", suffix=f".{fmt}")
+        os.close(fd)
+        try:
+            # Для CSV — BOM, чтобы Excel распознал UTF-8; переводы строк пишет сам формат
+            encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+            if compress:
+                out = gzip.open(path, "wt", encoding=encoding, newline="", compresslevel=6)
+            else:
+                out = open(path, "w", encoding=encoding, newline="")
+            with out:
+                write = _write_csv if fmt == "csv" else _write_ics
+                count = write(out, _rows(con, user_id))
+        except Exception:
+            os.unlink(path)
+            raise
+    finally:
+        con.close()
+
+    metrics.observe("export.build", time.perf_counter() - started)
+    logger.info(f"Built {fmt} export of {count} rows for user {user_id} (gzip: {compress})")
+    return path, filename, count, version
+
+def _benchmark():
+    """Время и пиковая память выгрузки 100 тыс. задач и 20 тыс. напоминаний"""
+    import random
+    import tracemalloc
+    from database import init_db
+
+    tasks, reminders = 100_000, 20_000
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.DB_PATH = os.path.join(tmp, "bench.db")
+        Config.ARCHIVE_DB_PATH = os.path.join(tmp, "archive.db")
+        init_db()
+        now = datetime.now(ZoneInfo(Config.TZ))
+        rng = random.Random(1)
+        with get_connection() as con:
+            con.executemany(
+                "INSERT INTO tasks (user_id, description, day_iso, status, created_iso, original_day_iso) "
+                "VALUES (1, ?, ?, ?, ?, '')",
+                [(f"задача {i}, с запятой; и точкой с запятой", f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                  rng.choice(("pending", "completed")), now.isoformat()) for i in range(tasks)]
+            )
+            con.executemany(
+                "INSERT INTO reminders (user_id, title, scheduled_iso, lead_minutes, created_iso) "
+                "VALUES (1, ?, ?, 15, ?)",
+                [(f"напоминание {i}", now.replace(month=rng.randint(1, 12), day=rng.randint(1, 28)).isoformat(),
+                  now.isoformat()) for i in range(reminders)]
+            )
+            con.commit()
+
+        for fmt in FORMATS:
+            started = time.perf_counter()
+            path, filename, count, _ = build_export(1, fmt)
+            elapsed = time.perf_counter() - started
+            os.unlink(path)
+            # Отдельный проход: под tracemalloc выгрузка идёт в разы медленнее
+            tracemalloc.start()
+            path, _, _, _ = build_export(1, fmt)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{fmt}: {count} rows in {elapsed:.2f}s, {os.path.getsize(path) / 1024:.0f} KiB "
+                  f"({filename}), peak Python memory {peak / 1024:.0f} KiB")
+            os.unlink(path)
+
+if __name__ == "__main__":
+    _benchmark()
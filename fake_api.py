@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Локальная имитация Telegram Bot API для проверки нескольких процессов и нагрузочных прогонов.
+
+Запуск:
+    python fake_api.py --port 8081 --log fake_api.jsonl
+    SCHEDULER_BOT_API_BASE_URL=http://127.0.0.1:8081/bot python bot.py --worker
+
+Проверка дублей отправленных сообщений:
+    python fake_api.py --report fake_api.jsonl
+"""
+import json
+import time
+import argparse
+import threading
+import itertools
+from collections import Counter
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+MESSAGE_METHODS = {
+    "sendMessage", "sendPhoto", "sendDocument",
+    "editMessageText", "editMessageCaption", "editMessageReplyMarkup",
+}
+
+class FakeBotAPI:
+    def __init__(self, log_path=None, latency=0.0):
+        self.latency = latency
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._log = open(log_path, "a", encoding="utf-8") if log_path else None
+
+    def record(self, method, params):
+        if not self._log:
+            return
+        with self._lock:
+            self._log.write(json.dumps({"t": time.time(), "method": method, "params": params}, ensure_ascii=False) + "\n")
+            self._log.flush()
+
+    def call(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        self.record(method, params)
+
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            # Обновлений нет; имитируем долгий опрос, не занимая процессор
+            time.sleep(min(float(params.get("timeout", 0) or 0), 1.0))
+            return []
+        if method in MESSAGE_METHODS:
+            message = {
+                "message_id": params.get("message_id") or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id", 0)), "type": "private"},
+            }
+            if method == "sendPhoto":
+                message["photo"] = [{"file_id": f"photo-{message['message_id']}",
+                                     "file_unique_id": f"u{message['message_id']}",
+                                     "width": 1, "height": 1}]
+            elif method == "sendDocument":
+                message["document"] = {"file_id": f"doc-{message['message_id']}",
+                                       "file_unique_id": f"d{message['message_id']}"}
+            else:
+                message["text"] = params.get("text") or params.get("caption") or ""
+            return message
+        return True
+
+def _parse_params(handler):
+    length = int(handler.headers.get("Content-Length") or 0)
+    body = handler.rfile.read(length) if length else b""
+    content_type = handler.headers.get("Content-Type", "")
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        # Файлы не разбираем, для статистики достаточно факта вызова
+        return {}
+    params = {}
+    for key, values in parse_qs(body.decode("utf-8")).items():
+        try:
+            params[key] = json.loads(values[0])
+        except ValueError:
+            params[key] = values[0]
+    return params
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        # Соединения держатся открытыми, как у настоящего Bot API; без задержки
+        # Нагла ответ из двух записей (заголовки, тело) не ждёт подтверждения
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            method = self.path.rstrip("/").rsplit("/", 1)[-1]
+            result = api.call(method, _parse_params(self))
+            payload = json.dumps({"ok": True, "result": result}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+class FakeServer(ThreadingHTTPServer):
+    # Очередь подключений по умолчанию (5) сбрасывает соединения при большом пуле клиента
+    request_queue_size = 256
+    daemon_threads = True
+
+def report(log_path):
+    """Считает отправленные сообщения и повторные отправки одного текста в один чат"""
+    sends = Counter()
+    with open(log_path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["method"] == "sendMessage":
+                params = entry["params"]
+                sends[(params.get("chat_id"), params.get("text"))] += 1
+    duplicates = {key: count for key, count in sends.items() if count > 1}
+    print(f"sendMessage calls: {sum(sends.values())}, unique: {len(sends)}, duplicated: {len(duplicates)}")
+    for (chat_id, text), count in list(duplicates.items())[:20]:
+        print(f"  chat {chat_id}: {count}x {text[:60]!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Имитация Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--log", help="файл журнала вызовов (JSONL)")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунды")
+    parser.add_argument("--report", metavar="LOG", help="показать статистику по журналу и выйти")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.report)
+        return
+
+    server = FakeServer((args.host, args.port), make_handler(FakeBotAPI(args.log, args.latency)))
+    print(f"Fake Bot API on http://{args.host}:{args.port}/bot")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
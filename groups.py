@@ -0,0 +1,87 @@
+# groups.py
+"""
+Групповые чаты: общий список задач и напоминаний на всех участников.
+
+Задачи и напоминания группы хранятся с chat_id группы, поэтому список дня —
+один запрос по индексу (chat_id, day_iso) независимо от числа участников, а
+напоминание уходит одним сообщением в чат с упоминанием исполнителей.
+
+Bot API не отдаёт список участников, поэтому chat_members пополняется по мере
+того, как бот их видит: автор любого обновления в группе, вступившие и вышедшие.
+Запись в базу — только если участник новый или сменил имя: последние известные
+хранятся в памяти (Config.GROUP_MEMBERS_CACHE).
+
+При включённом режиме приватности бот видит в группе только команды; для
+этого есть /task и /remind.
+"""
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram import Chat, MessageEntity, Update
+from telegram.ext import ContextTypes
+from config import Config
+from utils import user_now
+import storage
+
+logger = logging.getLogger(__name__)
+
+GROUP_TYPES = frozenset({Chat.GROUP, Chat.SUPERGROUP})
+
+# (chat_id, user_id) -> (username, first_name), как записано в chat_members
+_known = OrderedDict()
+
+def is_group(chat):
+    return chat is not None and chat.type in GROUP_TYPES
+
+async def _remember(chat_id, user):
+    key = (chat_id, user.id)
+    value = (user.username.lower() if user.username else None, user.first_name or "")
+    if _known.get(key) == value:
+        _known.move_to_end(key)
+        return
+    await asyncio.to_thread(
+        storage.current().save_member, chat_id, user.id, user.username, user.first_name, user_now().isoformat()
+    )
+    _known[key] = value
+    _known.move_to_end(key)
+    if len(_known) > Config.GROUP_MEMBERS_CACHE:
+        _known.popitem(last=False)
+
+async def _forget(chat_id, user):
+    _known.pop((chat_id, user.id), None)
+    await asyncio.to_thread(storage.current().remove_member, chat_id, user.id)
+
+async def track_members(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик группы -10: учёт участников групп, которых видит бот"""
+    chat = update.effective_chat
+    if not is_group(chat):
+        return
+    try:
+        message = update.effective_message
+        if message:
+            for member in message.new_chat_members or ():
+                if not member.is_bot:
+                    await _remember(chat.id, member)
+            if message.left_chat_member and not message.left_chat_member.is_bot:
+                await _forget(chat.id, message.left_chat_member)
+                return
+        user = update.effective_user
+        if user and not user.is_bot:
+            await _remember(chat.id, user)
+    except Exception as e:
+        logger.error(f"Failed to track members of chat {chat.id}: {e}")
+
+async def resolve_assignees(message):
+    """id исполнителей по упоминаниям в сообщении: @username участников группы и упоминания без username"""
+    entities = message.parse_entities([MessageEntity.MENTION, MessageEntity.TEXT_MENTION])
+    assignees = set()
+    usernames = []
+    for entity, text in entities.items():
+        if entity.type == MessageEntity.TEXT_MENTION and entity.user:
+            assignees.add(entity.user.id)
+        elif entity.type == MessageEntity.MENTION:
+            usernames.append(text.lstrip("@"))
+    if usernames:
+        found = await asyncio.to_thread(storage.current().members_by_username, message.chat_id, usernames)
+        assignees.update(found.values())
+    return sorted(assignees)
@@ -1,16 +1,35 @@
+import io
+import os
+import time
 import asyncio
 import logging
 import calendar
 from datetime import datetime, date, timedelta
 from zoneinfo import ZoneInfo
 from telegram import (
-    Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile,
+    Update, Chat, InlineKeyboardButton, InlineKeyboardMarkup, InputFile,
     ReplyKeyboardMarkup, KeyboardButton
 )
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from config import Config
-from utils import ensure_profile_image, user_now, safe_edit_message, build_hours_keyboard
-from database import execute_sql, get_connection
+from utils import ensure_profile_image, user_now, safe_edit_message, build_hours_keyboard, split_message
+from archive import fetch_tasks_for_day
+import stats
+import history
+import charts
+import delivery
+import broadcast
+import digest
+import callbacks
+import metrics
+import quickadd
+import writer
+import storage
+import watchdog
+import export
+import groups
+from callbacks import CallbackError
 
 logger = logging.getLogger(__name__)
 
@@ -60,7 +79,53 @@ class Messages:
     def reminder_item(title: str, time_str: str, lead: int) -> str:
         return f"• {title} - {time_str} (напомнить за {lead} мин.)"
     
+    # Утренняя сводка
+    @staticmethod
+    def digest_status(hour) -> str:
+        usage = (
+            "/digest 8 — присылать в 08:00\n"
+            "/digest 0 — сразу после полуночи\n"
+            "/digest off — отключить"
+        )
+        if hour is None:
+            return f"☀️ Утренняя сводка задач и напоминаний на день не подключена.\n\n{usage}"
+        when = "сразу после полуночи" if hour == 0 else f"в {hour:02d}:00"
+        return f"☀️ Сводка на день приходит {when}.\n\n{usage}"
+    
+    # Групповые чаты
+    @staticmethod
+    def remind_usage() -> str:
+        return (
+            "⏰ Напоминание одной фразой: /remind завтра 9:30 созвон @анна\n"
+            "В группе упомянутые участники станут исполнителями и будут отмечены в напоминании."
+        )
+    
+    # Выгрузка
+    @staticmethod
+    def export_usage() -> str:
+        return (
+            "📤 Выгрузка задач и напоминаний, включая архив:\n"
+            "/export — таблица CSV и календарь .ics\n"
+            "/export csv — только таблица\n"
+            "/export ics — только календарь (импорт в Google, Apple, Outlook)"
+        )
+    
     # Технические сообщения
+    @staticmethod
+    def private_only() -> str:
+        return "🔒 Эта команда показывает личные данные, поэтому работает только в личном чате с ботом."
+    
+    @staticmethod
+    def stale_button() -> str:
+        return "⚠️ Эта кнопка устарела. Откройте меню заново."
+    
+    @staticmethod
+    def unknown_text() -> str:
+        return (
+            "🤔 Используй меню рядом со строкой ввода или команду /start.\n"
+            "Напоминание можно создать одной фразой, например: «завтра 9:30 встреча за 10 мин»."
+        )
+    
     @staticmethod
     def maintenance_notification() -> str:
         return (
@@ -74,20 +139,31 @@ class Messages:
             "ℹ️ Бот-напоминалка с функциями:\n\n"
             "• Управление задачами на день ✅\n"
             "• Напоминания о событиях ⏰\n"
-            "• История выполненных задач 📊"
+            "• Быстрое добавление: «завтра 9:30 встреча» ⚡\n"
+            "• История выполненных задач 📊\n"
+            "• Утренняя сводка на день: /digest ☀️\n"
+            "• Выгрузка в CSV и календарь: /export 📤\n"
+            "• Общий список в группе: /task и /remind 👥"
         )
 
 # UI keyboard (persistent)
 REPLY_KEYBOARD = ReplyKeyboardMarkup(
     [[KeyboardButton("📅 Создать напоминание"), KeyboardButton("✅ Список дел на сегодня")],
      [KeyboardButton("📊 Просмотреть задачи по дате"), KeyboardButton("📋 Мои напоминания")],
-     [KeyboardButton("ℹ️ О боте")]],
+     [KeyboardButton("📈 История"), KeyboardButton("ℹ️ О боте")]],
     resize_keyboard=True
 )
 
+# file_id логотипа после первой загрузки: повторный /start не отправляет файл заново
+_profile_photo_id = None
+
+# Состояния диалога, ожидающие ввода текста (context.user_data['state'])
+STATE_AWAITING_TITLE = "awaiting_title"
+STATE_ADDING_TASK = "adding_task"
+
 def build_month_keyboard(year, month, mode="view", disable_past=True):
     cal = calendar.Calendar(firstweekday=0)
-    today = datetime.now(ZoneInfo(Config.TZ)).date()
+    today = user_now().date()
     kb = []
     
     # Add emoji to title based on mode
@@ -95,32 +171,32 @@ def build_month_keyboard(year, month, mode="view", disable_past=True):
     if mode == "create_reminder": emoji = "⏰"
     elif mode == "view_tasks": emoji = "✅"
     
-    kb.append([InlineKeyboardButton(f"{emoji} {calendar.month_name[month]} {year}", callback_data="noop")])
-    kb.append([InlineKeyboardButton(w, callback_data="noop") for w in ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]])
+    kb.append([InlineKeyboardButton(f"{emoji} {calendar.month_name[month]} {year}", callback_data=callbacks.noop())])
+    kb.append([InlineKeyboardButton(w, callback_data=callbacks.noop()) for w in ["Пн","Вт","Ср","Чт","Пт","Сб","Вс"]])
     
     for week in cal.monthdayscalendar(year, month):
         row = []
         for d in week:
             if d == 0: 
-                row.append(InlineKeyboardButton(" ", callback_data="noop"))
+                row.append(InlineKeyboardButton(" ", callback_data=callbacks.noop()))
             else:
                 dt = date(year, month, d)
                 if disable_past and dt < today:
-                    row.append(InlineKeyboardButton("·", callback_data="noop"))
+                    row.append(InlineKeyboardButton("·", callback_data=callbacks.noop()))
                 else:
                     today_indicator = "🟢" if dt == today else ""
                     row.append(InlineKeyboardButton(
                         f"{today_indicator}{d}", 
-                        callback_data=f"daysel:{mode}:{year}:{month}:{d}"
+                        callback_data=callbacks.day_select(mode, year, month, d)
                     ))
         kb.append(row)
     
     kb.append([
-        InlineKeyboardButton("◀️", callback_data=f"chmonth:{mode}:{year}:{month-1}"),
-        InlineKeyboardButton("Сегодня 🟢", callback_data=f"chmonth:{mode}:today"),
-        InlineKeyboardButton("▶️", callback_data=f"chmonth:{mode}:{year}:{month+1}")
+        InlineKeyboardButton("◀️", callback_data=callbacks.change_month(mode, year, month - 1)),
+        InlineKeyboardButton("Сегодня 🟢", callback_data=callbacks.change_month_today(mode)),
+        InlineKeyboardButton("▶️", callback_data=callbacks.change_month(mode, year, month + 1))
     ])
-    kb.append([InlineKeyboardButton("🔙 Назад", callback_data="menu")])
+    kb.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.menu())])
     return InlineKeyboardMarkup(kb)
 
 
@@ -156,64 +232,264 @@ def normalize_month(year, month):
     return year, month
 
 async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    ensure_profile_image()
     user = update.effective_user
     
+    # После разблокировки бота Telegram присылает /start: чат снова доступен
+    await asyncio.to_thread(delivery.revive_chat, update.effective_chat.id)
+    
     # Формируем имя пользователя
     user_name = user.first_name or ""
     if user.last_name:
         user_name = f"{user_name} {user.last_name}".strip()
     user_name = user_name or "друг"
     
-    welcome_text = Messages.welcome(user_name)
+    # Приветствие и постоянная клавиатура отправляются одним сообщением
+    caption = f"{Messages.welcome(user_name)}\n\n{Messages.start_actions()}"
+    await send_profile_photo(update.message, caption)
+
+async def send_profile_photo(message, caption):
+    """Отправляет логотип с подписью; после первой загрузки используется file_id"""
+    global _profile_photo_id
+    if _profile_photo_id:
+        try:
+            await message.reply_photo(photo=_profile_photo_id, caption=caption, reply_markup=REPLY_KEYBOARD)
+            return
+        except BadRequest as e:
+            logger.warning(f"Cached profile photo rejected, uploading again: {e}")
+            _profile_photo_id = None
     
     try:
+        ensure_profile_image()
         with open(Config.PROFILE_PNG, "rb") as f:
-            await update.message.reply_photo(photo=InputFile(f), caption=welcome_text)
-    except Exception:
-        await update.message.reply_text(welcome_text)
-    
-    await update.message.reply_text(Messages.start_actions(), reply_markup=REPLY_KEYBOARD)
+            sent = await message.reply_photo(photo=InputFile(f), caption=caption, reply_markup=REPLY_KEYBOARD)
+        if sent.photo:
+            _profile_photo_id = sent.photo[-1].file_id
+    except Exception as e:
+        logger.error(f"Error sending profile photo: {e}")
+        await message.reply_text(caption, reply_markup=REPLY_KEYBOARD)
 
 async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != Config.ADMIN_ID:
         await update.message.reply_text("❌ Нет доступа.")
         return
     
+    # Количество дней для временного ряда: /stats 30
+    days = Config.STATS_HISTORY_DAYS
+    if context.args:
+        try:
+            days = max(1, min(int(context.args[0]), 90))
+        except ValueError:
+            pass
+    
     try:
-        # Получаем статистику из базы данных
-        with get_connection() as con:
-            cur = con.cursor()
-            cur.execute("SELECT COUNT(*) FROM reminders")
-            reminders_count = cur.fetchone()[0]
-            cur.execute("SELECT COUNT(*) FROM tasks")
-            tasks_count = cur.fetchone()[0]
-        
-        message = (
-            f"📊 Статистика бота:\n\n"
-            f"⏰ Напоминаний: {reminders_count}\n"
-            f"✅ Задач: {tasks_count}"
-        )
-        await update.message.reply_text(message)
+        # Счётчики поддерживаются триггерами, поэтому чтение не сканирует таблицы
+        message = stats.format_report(days)
+        # За 90 дней с метриками процесса отчёт не помещается в одно сообщение
+        for part in split_message(message):
+            await update.message.reply_text(part)
     except Exception as e:
         logger.error(f"Error in stats command: {e}")
         await update.message.reply_text("❌ Ошибка при получении статистики.")
 
-async def show_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает список активных напоминаний пользователя"""
+async def broadcast_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Рассылка всем пользователям: /broadcast текст, /broadcast stop — остановить"""
+    if update.effective_user.id != Config.ADMIN_ID:
+        await update.message.reply_text("❌ Нет доступа.")
+        return
+    
+    # Текст берём целиком, чтобы сохранить переносы строк
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) < 2:
+        lines = ["Использование: /broadcast текст сообщения", "/broadcast stop — остановить рассылку"]
+        for broadcast_id, status, sent, failed, total, created_iso in broadcast.recent_broadcasts():
+            lines.append(f"#{broadcast_id} {created_iso[:16]} {status}: {sent + failed}/{total}, ошибок {failed}")
+        await update.message.reply_text("\n".join(lines))
+        return
+    
+    text = parts[1].strip()
+    if text == "stop":
+        stopped = await asyncio.to_thread(broadcast.cancel_running)
+        await update.message.reply_text(f"⏹ Остановлено рассылок: {stopped}")
+        return
+    
+    try:
+        progress = await update.message.reply_text("📣 Рассылка запускается...")
+        broadcast_id = await asyncio.to_thread(
+            broadcast.create_broadcast, text, progress.chat_id, progress.message_id
+        )
+        broadcast.start(context.bot, broadcast_id)
+    except Exception as e:
+        logger.error(f"Error starting broadcast: {e}")
+        await update.message.reply_text("❌ Не удалось запустить рассылку.")
+
+async def lag_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Задержка цикла событий и стеки последних зависаний"""
+    if update.effective_user.id != Config.ADMIN_ID:
+        await update.message.reply_text("❌ Нет доступа.")
+        return
+
+    await update.message.reply_text(watchdog.format_lag())
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Профиль на время: /profile cpu 10 или /profile mem 30; результат — документом.
+
+    Регистрируется с block=False: пока идёт замер, обработка обновлений не ждёт.
+    """
+    if update.effective_user.id != Config.ADMIN_ID:
+        await update.message.reply_text("❌ Нет доступа.")
+        return
+
+    args = context.args or []
+    mode = args[0].lower() if args else "cpu"
+    try:
+        seconds = max(1, min(int(args[1]), Config.PROFILE_MAX_SECONDS)) if len(args) > 1 else 10
+    except ValueError:
+        seconds = 10
+    if mode not in ("cpu", "mem"):
+        await update.message.reply_text(
+            f"Использование: /profile cpu|mem [секунды, до {Config.PROFILE_MAX_SECONDS}]"
+        )
+        return
+
+    await update.message.reply_text(f"⏱ Профилирование ({mode}) на {seconds} с...")
+    try:
+        if mode == "cpu":
+            report = await watchdog.profile_cpu(seconds)
+        else:
+            report = await watchdog.profile_memory(seconds)
+    except watchdog.ProfileBusy:
+        await update.message.reply_text("⚠️ Профилирование уже выполняется.")
+        return
+    except Exception as e:
+        logger.error(f"Error in profile command: {e}")
+        await update.message.reply_text("❌ Не удалось выполнить профилирование.")
+        return
+
+    filename = f"profile-{mode}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+    await update.message.reply_document(
+        document=InputFile(io.BytesIO(report.encode("utf-8")), filename=filename),
+        caption=f"Профиль {mode}, {seconds} с"
+    )
+
+async def digest_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Утренняя сводка: /digest 8 — в 08:00, /digest 0 — сразу после полуночи, /digest off — отписаться"""
     user_id = update.effective_user.id
+    args = context.args or []
+    
+    try:
+        if not args:
+            hour = await asyncio.to_thread(digest.get_subscription, user_id)
+            await update.message.reply_text(Messages.digest_status(hour), reply_markup=REPLY_KEYBOARD)
+            return
+        
+        if args[0].lower() in ("off", "стоп", "нет"):
+            await asyncio.to_thread(digest.unsubscribe, user_id)
+            await update.message.reply_text("🔕 Утренняя сводка отключена.", reply_markup=REPLY_KEYBOARD)
+            return
+        
+        try:
+            hour = int(args[0].split(":")[0])
+        except ValueError:
+            hour = -1
+        if not 0 <= hour <= 23:
+            await update.message.reply_text(Messages.digest_status(None), reply_markup=REPLY_KEYBOARD)
+            return
+        
+        await asyncio.to_thread(digest.subscribe, user_id, hour)
+        await update.message.reply_text(Messages.digest_status(hour), reply_markup=REPLY_KEYBOARD)
+    except Exception as e:
+        logger.error(f"Error in digest command: {e}")
+        await update.message.reply_text("❌ Ошибка при настройке сводки.", reply_markup=REPLY_KEYBOARD)
+
+EXPORT_CAPTIONS = {"csv": "📤 Задачи и напоминания (CSV)", "ics": "📅 Календарь (iCalendar)"}
+
+async def reject_outside_private(update: Update):
+    """True, если команда пришла не из личного чата: отвечает отказом, личные данные не выводятся"""
+    if update.effective_chat.type == Chat.PRIVATE:
+        return False
+    await update.message.reply_text(Messages.private_only())
+    return True
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Выгрузка: /export — CSV и .ics, /export csv или /export ics — один формат.
+
+    Регистрируется с block=False: файл строится в потоке, обработка других обновлений не ждёт.
+    """
+    if await reject_outside_private(update):
+        return
+    user_id = update.effective_user.id
+    args = context.args or []
+    formats = export.FORMATS if not args else (args[0].lower().lstrip("."),)
+    if formats[0] not in export.FORMATS:
+        await update.message.reply_text(Messages.export_usage(), reply_markup=REPLY_KEYBOARD)
+        return
+    
+    for fmt in formats:
+        try:
+            # Данные не менялись с прошлой выгрузки: файл уже лежит в Telegram
+            file_id = await asyncio.to_thread(export.get_cached_file_id, user_id, fmt)
+            if file_id:
+                try:
+                    await update.message.reply_document(
+                        document=file_id, caption=EXPORT_CAPTIONS[fmt], reply_markup=REPLY_KEYBOARD
+                    )
+                    metrics.inc("export.cached")
+                    continue
+                except BadRequest as e:
+                    logger.warning(f"Cached export rejected, building again: {e}")
+                    await asyncio.to_thread(export.forget_file_id, user_id, fmt)
+            
+            path, filename, count, version = await asyncio.to_thread(export.build_export, user_id, fmt)
+            try:
+                if not count:
+                    await update.message.reply_text("📭 Выгружать пока нечего.", reply_markup=REPLY_KEYBOARD)
+                    return
+                with open(path, "rb") as f:
+                    sent = await update.message.reply_document(
+                        document=InputFile(f, filename=filename),
+                        caption=f"{EXPORT_CAPTIONS[fmt]}, записей: {count}",
+                        reply_markup=REPLY_KEYBOARD
+                    )
+            finally:
+                os.unlink(path)
+            if sent.document:
+                await asyncio.to_thread(export.remember_file_id, user_id, fmt, version, sent.document.file_id)
+        except Exception as e:
+            logger.error(f"Error in export command: {e}")
+            await update.message.reply_text("❌ Ошибка при выгрузке.", reply_markup=REPLY_KEYBOARD)
+            return
+
+async def history_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает историю выполнения задач пользователя с графиком"""
+    if await reject_outside_private(update):
+        return
+    user_id = update.effective_user.id
+    try:
+        message = history.format_history(user_id)
+    except Exception as e:
+        logger.error(f"Error building history: {e}")
+        await update.message.reply_text("❌ Ошибка при получении истории.", reply_markup=REPLY_KEYBOARD)
+        return
+    
+    try:
+        key, chart = await charts.get_history_chart(user_id)
+        # Повторная отправка использует file_id и не загружает картинку заново
+        photo = chart["file_id"] or chart["png"]
+        sent = await update.message.reply_photo(photo=photo)
+        if not chart["file_id"] and sent.photo:
+            charts.chart_cache.set_file_id(key, sent.photo[-1].file_id)
+    except Exception as e:
+        logger.error(f"Error sending history chart: {e}")
+    
+    await update.message.reply_text(message, reply_markup=REPLY_KEYBOARD)
+
+async def show_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает список активных напоминаний чата (в группе — общих)"""
+    chat_id = update.effective_chat.id
     now = user_now()
     
     try:
-        with get_connection() as con:
-            cur = con.cursor()
-            cur.execute("""
-                SELECT title, scheduled_iso, lead_minutes 
-                FROM reminders 
-                WHERE user_id=? AND sent=0 AND scheduled_iso > ?
-                ORDER BY scheduled_iso
-            """, (user_id, now.isoformat()))
-            rows = cur.fetchall()
+        rows = storage.current().upcoming_reminders(chat_id, now.isoformat())
     except Exception as e:
         logger.error(f"Database error in show_reminders: {e}")
         await update.message.reply_text("❌ Ошибка при получении напоминаний.")
@@ -233,17 +509,9 @@ async def show_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = Messages.reminders_list_header() + "\n\n" + "\n".join(reminders_list)
     await update.message.reply_text(message, reply_markup=REPLY_KEYBOARD)
 
-async def open_calendar_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def open_calendar_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, mode="create_reminder"):
     if update.callback_query:
         await update.callback_query.answer()
-        data = update.callback_query.data
-    else:
-        data = "open_calendar:create_reminder"
-    
-    try:
-        _, mode = data.split(":")
-    except Exception:
-        mode = "view"
     
     now = user_now()
     markup = build_month_keyboard(now.year, now.month, mode=mode)
@@ -254,82 +522,39 @@ async def open_calendar_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await update.message.reply_text(text, reply_markup=markup)
 
-async def chmonth_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def chmonth_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, mode, year, month):
     await update.callback_query.answer()
-    data = update.callback_query.data
-    parts = data.split(":")
     now = user_now()
     
-    # Установим значения по умолчанию
-    mode = "create_reminder"
-    y = now.year
-    m = now.month
-    
-    try:
-        # Обработка разных форматов callback_data
-        if len(parts) >= 4:
-            if parts[2] == "today":
-                # Формат: chmonth:mode:today
-                mode = parts[1]
-            else:
-                # Формат: chmonth:mode:year:month
-                mode = parts[1]
-                y = int(parts[2])
-                m = int(parts[3])
-        elif len(parts) == 3 and parts[2] == "today":
-            # Формат: chmonth:mode:today
-            mode = parts[1]
-        elif len(parts) == 3:
-            # Формат: chmonth:year:month
-            y = int(parts[1])
-            m = int(parts[2])
-        
-        # Нормализуем месяц
-        y, m = normalize_month(y, m)
-        
-    except Exception as e:
-        logger.error(f"Error parsing chmonth callback: {e}")
-        # В случае ошибки используем текущую дату
+    # Год 0 означает переход к текущему месяцу; месяц соседних кнопок может выйти за 1..12
+    if year == 0:
         y, m = now.year, now.month
+    else:
+        y, m = normalize_month(year, month)
     
     # Для режима просмотра задач разрешаем прошлые даты
     disable_past = mode != "view_tasks"
     markup = build_month_keyboard(y, m, mode=mode, disable_past=disable_past)
     await safe_edit_message(update.callback_query.message, text=None, reply_markup=markup)
 
-async def day_selection_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.answer()
-    data = update.callback_query.data
-    
+async def day_selection_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, mode, year, month, day):
     try:
-        _, mode, year, month, day = data.split(":")
-        year = int(year)
-        month = int(month)
-        day = int(day)
-    except Exception:
-        await update.callback_query.answer("❌ Ошибка в callback", show_alert=True)
-        return
-        
-    selected_date = date(year, month, day)
+        selected_date = date(year, month, day)
+    except ValueError as e:
+        raise CallbackError(f"bad date {year}-{month}-{day}") from e
+    await update.callback_query.answer()
     
     if mode == "create_reminder":
         context.user_data['new_reminder'] = {'year': year, 'month': month, 'day': day}
         await show_hours_page(update.callback_query.message)
         
     elif mode == "view_tasks":
-        user_id = update.effective_user.id
+        chat_id = update.effective_chat.id
         day_iso = selected_date.isoformat()
         
         try:
-            with get_connection() as con:
-                cur = con.cursor()
-                cur.execute("""
-                    SELECT description, status 
-                    FROM tasks 
-                    WHERE user_id=? AND day_iso=?
-                    ORDER BY id
-                """, (user_id, day_iso))
-                rows = cur.fetchall()
+            # Старые даты прозрачно дочитываются из архива
+            rows = fetch_tasks_for_day(chat_id, day_iso)
         except Exception as e:
             logger.error(f"Database error: {e}")
             await update.callback_query.answer("❌ Ошибка базы данных", show_alert=True)
@@ -352,7 +577,7 @@ async def day_selection_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if pending:
                 txt += "\n" + "\n".join(pending)
         
-        back_button = InlineKeyboardButton("🔙 Назад к календарю", callback_data="open_calendar:view_tasks")
+        back_button = InlineKeyboardButton("🔙 Назад к календарю", callback_data=callbacks.open_calendar("view_tasks"))
         await safe_edit_message(
             update.callback_query.message, 
             txt, 
@@ -365,10 +590,8 @@ async def show_hours_page(message):
     markup = build_hours_keyboard()
     await safe_edit_message(message, "⏰ Выберите час:", reply_markup=markup)
 
-async def hoursel_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def hoursel_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, hh):
     await update.callback_query.answer()
-    _, hh = update.callback_query.data.split(":")
-    hh = int(hh)
     
     if 'new_reminder' not in context.user_data:
         context.user_data['new_reminder'] = {}
@@ -376,11 +599,11 @@ async def hoursel_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['new_reminder']['hour'] = hh
     
     kb = [
-        [InlineKeyboardButton("00", callback_data="minutesel:0"),
-         InlineKeyboardButton("15", callback_data="minutesel:15"),
-         InlineKeyboardButton("30", callback_data="minutesel:30"),
-         InlineKeyboardButton("45", callback_data="minutesel:45")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="open_calendar:create_reminder")]
+        [InlineKeyboardButton("00", callback_data=callbacks.minute_select(0)),
+         InlineKeyboardButton("15", callback_data=callbacks.minute_select(15)),
+         InlineKeyboardButton("30", callback_data=callbacks.minute_select(30)),
+         InlineKeyboardButton("45", callback_data=callbacks.minute_select(45))],
+        [InlineKeyboardButton("🔙 Назад", callback_data=callbacks.open_calendar("create_reminder"))]
     ]
     
     await safe_edit_message(
@@ -389,10 +612,8 @@ async def hoursel_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(kb)
     )
 
-async def minute_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def minute_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, mm):
     await update.callback_query.answer()
-    _, mm = update.callback_query.data.split(":")
-    mm = int(mm)
     
     if 'new_reminder' not in context.user_data:
         context.user_data['new_reminder'] = {}
@@ -404,13 +625,13 @@ async def minute_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     h, mi = nr['hour'], mm
     
     kb = [
-        [InlineKeyboardButton("Отправлю напоминание за 0 мин", callback_data="lead:0"),
-         InlineKeyboardButton("За 5 мин", callback_data="lead:5"),
-         InlineKeyboardButton("За 10 мин", callback_data="lead:10")],
-        [InlineKeyboardButton("За 30 мин", callback_data="lead:30"),
-         InlineKeyboardButton("За 60 мин", callback_data="lead:60")],
-        [InlineKeyboardButton("✅ Подтвердить", callback_data="confirm_reminder"),
-         InlineKeyboardButton("❌ Отмена", callback_data="open_calendar:create_reminder")]
+        [InlineKeyboardButton("Отправлю напоминание за 0 мин", callback_data=callbacks.lead_select(0)),
+         InlineKeyboardButton("За 5 мин", callback_data=callbacks.lead_select(5)),
+         InlineKeyboardButton("За 10 мин", callback_data=callbacks.lead_select(10))],
+        [InlineKeyboardButton("За 30 мин", callback_data=callbacks.lead_select(30)),
+         InlineKeyboardButton("За 60 мин", callback_data=callbacks.lead_select(60))],
+        [InlineKeyboardButton("✅ Подтвердить", callback_data=callbacks.confirm_reminder()),
+         InlineKeyboardButton("❌ Отмена", callback_data=callbacks.open_calendar("create_reminder"))]
     ]
     
     await safe_edit_message(
@@ -419,10 +640,8 @@ async def minute_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=InlineKeyboardMarkup(kb)
     )
 
-async def lead_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def lead_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, lm):
     await update.callback_query.answer()
-    _, lm = update.callback_query.data.split(":")
-    lm = int(lm)
     
     if 'new_reminder' not in context.user_data:
         context.user_data['new_reminder'] = {}
@@ -431,48 +650,29 @@ async def lead_select_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await safe_edit_message(
         update.callback_query.message, 
         "✏️ Введите название события (отправьте текстом):", 
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="open_calendar:create_reminder")]])
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data=callbacks.open_calendar("create_reminder"))]])
     )
-    context.user_data['awaiting_title'] = True
+    context.user_data['state'] = STATE_AWAITING_TITLE
 
-async def confirm_save_reminder_from_title(update: Update, context: ContextTypes.DEFAULT_TYPE, title_text: str):
-    if 'new_reminder' not in context.user_data:
-        await update.message.reply_text("❌ Нет данных напоминания. Начните заново.", reply_markup=REPLY_KEYBOARD)
-        context.user_data.pop('awaiting_title', None)
-        return
-    
-    nr = context.user_data['new_reminder']
-    y, m, d = nr['year'], nr['month'], nr['day']
-    h, mi = nr.get('hour', 0), nr.get('minute', 0)
-    lead = nr.get('lead', 0)
-    
-    try:
-        # Создаем datetime с часовым поясом
-        scheduled_local = datetime(y, m, d, h, mi, tzinfo=ZoneInfo(Config.TZ))
-    except Exception as e:
-        logger.error(f"Invalid datetime: {e}")
-        await update.message.reply_text("❌ Некорректная дата/время.", reply_markup=REPLY_KEYBOARD)
-        return
-    
+async def create_reminder(update: Update, context: ContextTypes.DEFAULT_TYPE, title: str, scheduled_local, lead: int):
+    """Сохраняет и планирует напоминание; общий путь для пошагового и быстрого добавления"""
     if scheduled_local <= user_now():
         await update.message.reply_text("❌ Нельзя создавать напоминание на прошлое время.", reply_markup=REPLY_KEYBOARD)
-        context.user_data.pop('awaiting_title', None)
-        return
+        return False
     
-    title = title_text.strip() or f"Событие {d}.{m}.{y} {h:02d}:{mi:02d}"
     created_iso = user_now().isoformat()
+    chat_id = update.effective_chat.id
     
     try:
-        # Используем соединение, чтобы получить ID созданной записи
-        with get_connection() as con:
-            cur = con.cursor()
-            cur.execute(
-                "INSERT INTO reminders (user_id, title, scheduled_iso, lead_minutes, created_iso) "
-                "VALUES (?, ?, ?, ?, ?)",
-                (update.effective_user.id, title, scheduled_local.isoformat(), lead, created_iso)
-            )
-            reminder_id = cur.lastrowid
-            con.commit()
+        # В группе упомянутые в тексте участники становятся исполнителями
+        assignees = await groups.resolve_assignees(update.message) if groups.is_group(update.effective_chat) else []
+        reminder_id = storage.current().add_reminder(
+            update.effective_user.id, title, scheduled_local.isoformat(), lead, created_iso,
+            chat_id=chat_id, assignees=assignees
+        )
+        
+        # Пользователь пишет в чат, значит бот в нём и чат доступен
+        await asyncio.to_thread(delivery.revive_chat, chat_id)
         
         # Получаем планировщик из контекста приложения
         scheduler_manager = context.application.scheduler_manager
@@ -480,51 +680,66 @@ async def confirm_save_reminder_from_title(update: Update, context: ContextTypes
         # Планируем напоминание с правильным ID
         await scheduler_manager.schedule_reminder(
             reminder_id,
-            update.effective_user.id,
+            chat_id,
             title,
             scheduled_local,
             lead
         )
         
         time_str = scheduled_local.strftime('%d.%m.%Y %H:%M')
-        await update.message.reply_text(
-            Messages.reminder_created(title, time_str, lead),
-            reply_markup=REPLY_KEYBOARD
-        )
+        reply = Messages.reminder_created(title, time_str, lead)
+        if assignees:
+            reply += f"\n👥 Исполнителей: {len(assignees)}"
+        await update.message.reply_text(reply, reply_markup=REPLY_KEYBOARD)
+        return True
     except Exception as e:
         logger.error(f"Error saving reminder: {e}")
         await update.message.reply_text("❌ Ошибка при создании напоминания.", reply_markup=REPLY_KEYBOARD)
+        return False
+
+async def confirm_save_reminder_from_title(update: Update, context: ContextTypes.DEFAULT_TYPE, title_text: str):
+    if 'new_reminder' not in context.user_data:
+        await update.message.reply_text("❌ Нет данных напоминания. Начните заново.", reply_markup=REPLY_KEYBOARD)
+        context.user_data.pop('state', None)
+        return
+    
+    nr = context.user_data['new_reminder']
+    y, m, d = nr['year'], nr['month'], nr['day']
+    h, mi = nr.get('hour', 0), nr.get('minute', 0)
+    lead = nr.get('lead', 0)
+    
+    try:
+        # Создаем datetime с часовым поясом
+        scheduled_local = datetime(y, m, d, h, mi, tzinfo=ZoneInfo(Config.TZ))
+    except Exception as e:
+        logger.error(f"Invalid datetime: {e}")
+        await update.message.reply_text("❌ Некорректная дата/время.", reply_markup=REPLY_KEYBOARD)
+        return
+    
+    title = title_text.strip() or f"Событие {d}.{m}.{y} {h:02d}:{mi:02d}"
+    await create_reminder(update, context, title, scheduled_local, lead)
     
     context.user_data.pop('new_reminder', None)
-    context.user_data.pop('awaiting_title', None)
+    context.user_data.pop('state', None)
 
 async def confirm_reminder_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.callback_query.answer()
     await safe_edit_message(
         update.callback_query.message, 
         "⚠️ Пожалуйста, сначала укажите название события.", 
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="open_calendar:create_reminder")]])
+        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data=callbacks.open_calendar("create_reminder"))]])
     )
 
 async def today_tasks_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query: 
         await update.callback_query.answer()
     
-    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
     today_iso = user_now().date().isoformat()
     
     try:
-        with get_connection() as con:
-            cur = con.cursor()
-            cur.execute("""
-                SELECT id, description, status, original_day_iso 
-                FROM tasks 
-                WHERE user_id=? AND day_iso=?
-                ORDER BY 
-                    CASE WHEN original_day_iso < ? THEN 0 ELSE 1 END,
-                    original_day_iso ASC
-            """, (user_id, today_iso, today_iso))
-            rows = cur.fetchall()
+        # В группе — общий список чата, отметить задачу может любой участник
+        rows = storage.current().get_today_tasks(chat_id, today_iso)
     except Exception as e:
         logger.error(f"Database error: {e}")
         if update.callback_query:
@@ -547,142 +762,189 @@ async def today_tasks_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Добавляем кнопку для задачи
             kb.append([InlineKeyboardButton(
                 f"{'✅ Выполнено' if status == 'completed' else '❌ Не выполнено'}: {desc[:20]}", 
-                callback_data=f"toggle_task:{tid}"
+                callback_data=callbacks.toggle_task(tid)
             )])
         
         txt = Messages.task_list_header() + "\n" + "\n".join(tasks_list)
     
-    kb.append([InlineKeyboardButton("➕ Добавить задачу", callback_data="add_task")])
-    kb.append([InlineKeyboardButton("🔙 Назад", callback_data="menu")])
+    kb.append([InlineKeyboardButton("➕ Добавить задачу", callback_data=callbacks.add_task())])
+    kb.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.menu())])
     
     if update.callback_query:
         await safe_edit_message(update.callback_query.message, txt, reply_markup=InlineKeyboardMarkup(kb))
     else:
         await update.message.reply_text(txt, reply_markup=InlineKeyboardMarkup(kb))
 
-async def toggle_task_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def toggle_task_cb(update: Update, context: ContextTypes.DEFAULT_TYPE, tid):
     await update.callback_query.answer()
-    _, tid = update.callback_query.data.split(":")
-    tid = int(tid)
     
     try:
-        with get_connection() as con:
-            cur = con.cursor()
-            cur.execute("SELECT status, user_id FROM tasks WHERE id=?", (tid,))
-            row = cur.fetchone()
-            
-            if not row:
-                await safe_edit_message(
-                    update.callback_query.message, 
-                    "❌ Задача не найдена.", 
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data="today_tasks")]])
-                )
-                return
-            
-            status, uid = row
-            if uid != update.effective_user.id:
-                await update.callback_query.answer("⚠️ Это не ваша задача.", show_alert=True)
-                return
-            
-            if status == "pending":
-                cur.execute(
-                    "UPDATE tasks SET status='completed', completed_iso=? WHERE id=?",
-                    (user_now().isoformat(), tid)
-                )
-                new_status = "✅ Выполнено"
-            else:
-                cur.execute(
-                    "UPDATE tasks SET status='pending', completed_iso=NULL WHERE id=?",
-                    (tid,)
-                )
-                new_status = "❌ Не выполнено"
-            
-            con.commit()
-        
-        await safe_edit_message(
-            update.callback_query.message, 
-            f"🔄 Статус задачи изменён на: {new_status}", 
-            reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("🔄 Обновить список", callback_data="today_tasks")],
-                [InlineKeyboardButton("🔙 Назад", callback_data="menu")]
-            ])
-        )
+        # Переключение пишется группой с другими изменениями; результат приходит после записи на диск
+        result = await writer.toggle_task(tid, update.effective_chat.id, user_now())
     except Exception as e:
         logger.error(f"Error toggling task: {e}")
         await update.callback_query.answer("❌ Ошибка при обновлении задачи", show_alert=True)
+        return
+    
+    if result == writer.NOT_FOUND:
+        await safe_edit_message(
+            update.callback_query.message, 
+            "❌ Задача не найдена.", 
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад", callback_data=callbacks.today_tasks())]])
+        )
+        return
+    
+    if result == writer.FORBIDDEN:
+        await update.callback_query.answer("⚠️ Задача из другого чата.", show_alert=True)
+        return
+    
+    new_status = "✅ Выполнено" if result == "completed" else "❌ Не выполнено"
+    await safe_edit_message(
+        update.callback_query.message, 
+        f"🔄 Статус задачи изменён на: {new_status}", 
+        reply_markup=InlineKeyboardMarkup([
+            [InlineKeyboardButton("🔄 Обновить список", callback_data=callbacks.today_tasks())],
+            [InlineKeyboardButton("🔙 Назад", callback_data=callbacks.menu())]
+        ])
+    )
 
 async def add_task_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
         await update.callback_query.answer()
-        context.user_data['adding_task'] = True
+        context.user_data['state'] = STATE_ADDING_TASK
         await safe_edit_message(
             update.callback_query.message, 
             "✏️ Отправьте текст задачи:", 
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data="today_tasks")]])
+            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Отмена", callback_data=callbacks.today_tasks())]])
         )
     else:
-        context.user_data['adding_task'] = True
+        context.user_data['state'] = STATE_ADDING_TASK
         await update.message.reply_text("✏️ Отправьте текст задачи:")
 
-async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (update.message.text or "").strip()
-    
-    # Обработка кнопок меню
-    if text == "📅 Создать напоминание":
-        await open_calendar_cb(update, context)
-        return
-    
-    if text == "✅ Список дел на сегодня":
-        await today_tasks_cb(update, context)
+async def view_tasks_calendar(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    now = user_now()
+    markup = build_month_keyboard(now.year, now.month, mode="view_tasks", disable_past=False)
+    await update.message.reply_text("📅 Выберите дату для просмотра задач:", reply_markup=markup)
+
+async def about_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(Messages.bot_about(), reply_markup=REPLY_KEYBOARD)
+
+async def save_task_from_text(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    if not text:
+        await update.message.reply_text("❌ Пустая задача не сохранена.")
         return
     
-    if text == "📊 Просмотреть задачи по дате":
+    try:
         now = user_now()
-        markup = build_month_keyboard(now.year, now.month, mode="view_tasks", disable_past=False)
-        await update.message.reply_text("📅 Выберите дату для просмотра задач:", reply_markup=markup)
-        return
+        await writer.add_task(
+            update.effective_user.id, text, now.date().isoformat(), now.isoformat(), chat_id=update.effective_chat.id
+        )
+        context.user_data.pop('state', None)
+        await update.message.reply_text("✅ Задача добавлена!", reply_markup=REPLY_KEYBOARD)
+    except Exception as e:
+        logger.error(f"Error adding task: {e}")
+        await update.message.reply_text("❌ Ошибка при добавлении задачи", reply_markup=REPLY_KEYBOARD)
+
+async def quick_add(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str):
+    """Напоминание одной фразой ("завтра 9:30 встреча"). False — текст не распознан"""
+    parsed = quickadd.parse(text, user_now())
+    if parsed is None:
+        return False
+    metrics.inc("text.quick_add")
+    await create_reminder(update, context, parsed.title, parsed.when, parsed.lead)
+    return True
+
+async def task_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/task текст — задача на сегодня в список чата; в группе доступна и в режиме приватности"""
+    await save_task_from_text(update, context, " ".join(context.args or []).strip())
+
+async def remind_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/remind завтра 9:30 созвон @анна — напоминание одной фразой; упомянутые станут исполнителями"""
+    if not await quick_add(update, context, " ".join(context.args or []).strip()):
+        await update.message.reply_text(Messages.remind_usage(), reply_markup=REPLY_KEYBOARD)
+
+# Кнопки постоянной клавиатуры: точное совпадение текста -> обработчик
+TEXT_ROUTES = {
+    "📅 Создать напоминание": open_calendar_cb,
+    "✅ Список дел на сегодня": today_tasks_cb,
+    "📊 Просмотреть задачи по дате": view_tasks_calendar,
+    "📋 Мои напоминания": show_reminders,
+    "📈 История": history_cmd,
+    "ℹ️ О боте": about_cmd,
+}
+
+# При перегрузке отбрасываются первыми (throttle.py): просмотр, а не изменение данных
+LOW_PRIORITY_TEXTS = frozenset({"📊 Просмотреть задачи по дате", "📈 История", "ℹ️ О боте", "/history", "/export"})
+
+# Состояние диалога -> обработчик введённого текста
+STATE_ROUTES = {
+    STATE_AWAITING_TITLE: confirm_save_reminder_from_title,
+    STATE_ADDING_TASK: save_task_from_text,
+}
+
+async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    text = (update.message.text or "").strip()
     
-    if text == "📋 Мои напоминания":
-        await show_reminders(update, context)
+    # Кнопки меню работают в любом состоянии
+    route = TEXT_ROUTES.get(text)
+    if route is not None:
+        await route(update, context)
         return
     
-    if text == "ℹ️ О боте":
-        await update.message.reply_text(Messages.bot_about(), reply_markup=REPLY_KEYBOARD)
+    # Ожидаемый ввод: название события или текст задачи
+    handler = STATE_ROUTES.get(context.user_data.get('state'))
+    if handler is not None:
+        await handler(update, context, text)
         return
     
-    # Ожидание названия события
-    if context.user_data.get('awaiting_title'):
-        await confirm_save_reminder_from_title(update, context, text)
+    # Быстрое добавление — только в личном чате: в группе обычная переписка со
+    # временем превращалась бы в напоминания, там для этого /remind. На прочий
+    # текст в группе бот тоже не отвечает
+    if update.effective_chat.type != Chat.PRIVATE:
         return
     
-    # Добавление новой задачи
-    if context.user_data.get('adding_task'):
-        if not text:
-            await update.message.reply_text("❌ Пустая задача не сохранена.")
-            return
-        
-        try:
-            today_iso = user_now().date().isoformat()
-            execute_sql(
-                "INSERT INTO tasks (user_id, description, day_iso, created_iso, original_day_iso) "
-                "VALUES (:user_id, :description, :day_iso, :created_iso, :day_iso)",
-                {
-                    "user_id": update.effective_user.id,
-                    "description": text,
-                    "day_iso": today_iso,
-                    "created_iso": user_now().isoformat()
-                }
-            )
-            context.user_data.pop('adding_task', None)
-            await update.message.reply_text("✅ Задача добавлена!", reply_markup=REPLY_KEYBOARD)
-        except Exception as e:
-            logger.error(f"Error adding task: {e}")
-            await update.message.reply_text("❌ Ошибка при добавлении задачи", reply_markup=REPLY_KEYBOARD)
+    if await quick_add(update, context, text):
         return
     
     # Обработка неизвестных сообщений
-    await update.message.reply_text("🤔 Используй меню рядом со строкой ввода или команду /start.", reply_markup=REPLY_KEYBOARD)
+    await update.message.reply_text(Messages.unknown_text(), reply_markup=REPLY_KEYBOARD)
 
 async def unknown_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.callback_query:
-        await update.callback_query.answer()
\ No newline at end of file
+        await update.callback_query.answer()
+
+# Действие кнопки -> обработчик; аргументы кнопки передаются обработчику позиционно
+CALLBACK_ROUTES = {
+    callbacks.NOOP: unknown_cb,
+    callbacks.MENU: unknown_cb,
+    callbacks.OPEN_CALENDAR: open_calendar_cb,
+    callbacks.DAY_SELECT: day_selection_cb,
+    callbacks.CHANGE_MONTH: chmonth_cb,
+    callbacks.HOUR_SELECT: hoursel_cb,
+    callbacks.MINUTE_SELECT: minute_select_cb,
+    callbacks.LEAD_SELECT: lead_select_cb,
+    callbacks.CONFIRM_REMINDER: confirm_reminder_cb,
+    callbacks.TODAY_TASKS: today_tasks_cb,
+    callbacks.ADD_TASK: add_task_cb,
+    callbacks.TOGGLE_TASK: toggle_task_cb,
+}
+LOW_PRIORITY_ACTIONS = frozenset({callbacks.NOOP, callbacks.MENU, callbacks.CHANGE_MONTH})
+# Действия, первый аргумент которых — режим календаря
+MODE_ACTIONS = {callbacks.OPEN_CALENDAR, callbacks.DAY_SELECT, callbacks.CHANGE_MONTH}
+
+async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Единая точка входа для кнопок: разбор данных и выбор обработчика по словарю"""
+    query = update.callback_query
+    started = time.perf_counter()
+    try:
+        action, args = callbacks.decode(query.data or "")
+        if action in MODE_ACTIONS:
+            args = (callbacks.mode_name(args[0]), *args[1:])
+        handler = CALLBACK_ROUTES[action]
+        metrics.observe("callback.route", time.perf_counter() - started)
+        await handler(update, context, *args)
+    except CallbackError as e:
+        # Кнопки из сообщений до смены формата и повреждённые данные обрабатываются одинаково
+        metrics.inc("callback.stale")
+        logger.info(f"Stale callback from user {update.effective_user.id}: {e}")
+        await query.answer(Messages.stale_button(), show_alert=True)
@@ -0,0 +1,128 @@
+# history.py
+import logging
+from datetime import date, timedelta
+from database import get_connection
+from utils import user_now
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DAYS = 7
+HISTORY_WEEKS = 4
+TOP_ROLLED = 3
+
+def _upsert_daily(con, user_id, day_iso, column, delta):
+    con.execute(
+        f"INSERT INTO task_daily (user_id, day_iso, {column}) VALUES (?, ?, ?) "
+        f"ON CONFLICT (user_id, day_iso) DO UPDATE SET {column} = {column} + excluded.{column}",
+        (user_id, day_iso, delta)
+    )
+
+def record_toggle(con, user_id, day_iso, completed):
+    """Обновляет сводку дня и серию при отметке задачи выполненной или снятии отметки"""
+    _upsert_daily(con, user_id, day_iso, "completed", 1 if completed else -1)
+    count = con.execute(
+        "SELECT completed FROM task_daily WHERE user_id=? AND day_iso=?",
+        (user_id, day_iso)
+    ).fetchone()[0]
+
+    if count == 0:
+        con.execute(
+            "UPDATE task_daily SET streak=0 WHERE user_id=? AND day_iso=?",
+            (user_id, day_iso)
+        )
+        return
+    if not completed or count > 1:
+        return
+
+    # Первая выполненная задача за день продолжает серию предыдущего дня
+    prev_iso = (date.fromisoformat(day_iso) - timedelta(days=1)).isoformat()
+    prev = con.execute(
+        "SELECT streak FROM task_daily WHERE user_id=? AND day_iso=? AND completed > 0",
+        (user_id, prev_iso)
+    ).fetchone()
+    streak = (prev[0] if prev else 0) + 1
+    con.execute(
+        "UPDATE task_daily SET streak=? WHERE user_id=? AND day_iso=?",
+        (streak, user_id, day_iso)
+    )
+    con.execute(
+        "INSERT INTO user_history (user_id, best_streak) VALUES (?, ?) "
+        "ON CONFLICT (user_id) DO UPDATE SET best_streak = MAX(best_streak, excluded.best_streak)",
+        (user_id, streak)
+    )
+
+def record_rollover(con, condition, params):
+    """Учитывает переносимые задачи; вызывается до UPDATE переноса с тем же условием"""
+    con.execute(f"""
+        INSERT INTO task_daily (user_id, day_iso, rolled_over)
+        SELECT user_id, day_iso, COUNT(*) FROM tasks
+        WHERE {condition}
+        GROUP BY user_id, day_iso
+        ON CONFLICT (user_id, day_iso) DO UPDATE SET rolled_over = rolled_over + excluded.rolled_over
+    """, params)
+    con.execute(f"UPDATE tasks SET rollover_count = rollover_count + 1 WHERE {condition}", params)
+
+def _rate(completed, rolled_over):
+    total = completed + rolled_over
+    return f"{round(100 * completed / total)}%" if total else "—"
+
+def format_history(user_id):
+    """Отчёт за фиксированное окно, поэтому время построения не зависит от длины истории"""
+    today = user_now().date()
+    since = today - timedelta(weeks=HISTORY_WEEKS) + timedelta(days=1)
+
+    with get_connection() as con:
+        rows = con.execute(
+            "SELECT day_iso, completed, rolled_over, streak FROM task_daily "
+            "WHERE user_id=? AND day_iso BETWEEN ? AND ?",
+            (user_id, since.isoformat(), today.isoformat())
+        ).fetchall()
+        best = con.execute(
+            "SELECT best_streak FROM user_history WHERE user_id=?", (user_id,)
+        ).fetchone()
+        top_rolled = con.execute(
+            "SELECT description, rollover_count FROM tasks "
+            "WHERE user_id=? AND rollover_count > 0 "
+            "ORDER BY rollover_count DESC LIMIT ?",
+            (user_id, TOP_ROLLED)
+        ).fetchall()
+
+    daily = {day_iso: (completed, rolled, streak) for day_iso, completed, rolled, streak in rows}
+
+    current_streak = 0
+    for day in (today, today - timedelta(days=1)):
+        completed, _, streak = daily.get(day.isoformat(), (0, 0, 0))
+        if completed:
+            current_streak = streak
+            break
+
+    lines = [
+        "📊 История выполненных задач\n",
+        f"🔥 Текущая серия: {current_streak} дн.",
+        f"🏆 Лучшая серия: {best[0] if best else 0} дн.",
+        "",
+        f"📅 Последние {HISTORY_DAYS} дн. (выполнено / перенесено):",
+    ]
+    for offset in range(HISTORY_DAYS - 1, -1, -1):
+        day = today - timedelta(days=offset)
+        completed, rolled, _ = daily.get(day.isoformat(), (0, 0, 0))
+        lines.append(f"{day.strftime('%d.%m')}: ✅{completed} 🔁{rolled} — {_rate(completed, rolled)}")
+
+    lines.append("")
+    lines.append("🗓 По неделям:")
+    for week in range(HISTORY_WEEKS - 1, -1, -1):
+        end = today - timedelta(weeks=week)
+        days = [(end - timedelta(days=i)).isoformat() for i in range(7)]
+        completed = sum(daily.get(d, (0, 0, 0))[0] for d in days)
+        rolled = sum(daily.get(d, (0, 0, 0))[1] for d in days)
+        lines.append(
+            f"{(end - timedelta(days=6)).strftime('%d.%m')}–{end.strftime('%d.%m')}: "
+            f"✅{completed} 🔁{rolled} — {_rate(completed, rolled)}"
+        )
+
+    if top_rolled:
+        lines.append("")
+        lines.append("🐢 Чаще всего переносятся:")
+        lines.extend(f"• {desc[:40]} — {count} раз" for desc, count in top_rolled)
+
+    return "\n".join(lines)
@@ -0,0 +1,77 @@
+# leader.py
+import asyncio
+import logging
+from config import Config
+from database import get_connection
+import clock
+import leases
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+
+class LeaderElector:
+    """Выбор ведущего экземпляра через аренду в общей базе.
+
+    Ведущий выполняет единичные задачи (перенос задач в полночь, архив, резервные копии),
+    остальные экземпляры держат планировщик запущенным и забирают аренду после её истечения.
+    """
+
+    def __init__(self, owner, on_elected, on_demoted):
+        self.owner = owner
+        self.ttl = Config.LEADER_LEASE_TTL
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._last_renewed = 0.0
+
+    def _tick_sync(self):
+        now = clock.timestamp()
+        with get_connection() as con:
+            previous = con.execute(
+                "SELECT owner, expires_at FROM leases WHERE name=?", (LEADER_LEASE,)
+            ).fetchone()
+            acquired = leases.try_acquire(con, LEADER_LEASE, self.owner, self.ttl, now)
+            con.commit()
+
+        # Время переключения: от последнего продления прежним ведущим до захвата аренды
+        failover = None
+        if acquired and not self.is_leader and previous and previous[0] != self.owner:
+            failover = now - (previous[1] - self.ttl)
+        return acquired, failover, now
+
+    async def tick(self):
+        try:
+            acquired, failover, now = await asyncio.to_thread(self._tick_sync)
+            if acquired:
+                self._last_renewed = now
+        except Exception as e:
+            logger.error("Leader election tick failed: %s", e)
+            failover = None
+            # Без продления аренда истечёт, и её заберёт другой экземпляр
+            acquired = self.is_leader and clock.timestamp() - self._last_renewed < self.ttl
+
+        if acquired and not self.is_leader:
+            self.is_leader = True
+            metrics.set_gauge("leader.is_leader", 1)
+            if failover is not None:
+                metrics.set_gauge("leader.failover_seconds", failover)
+                logger.info("Instance %s elected leader, failover took %.1fs", self.owner, failover)
+            else:
+                logger.info("Instance %s elected leader", self.owner)
+            await self.on_elected()
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            metrics.set_gauge("leader.is_leader", 0)
+            logger.warning("Instance %s lost leadership", self.owner)
+            await self.on_demoted()
+
+    def release(self):
+        """Освобождает аренду при штатной остановке, чтобы другой экземпляр занял её сразу"""
+        if not self.is_leader:
+            return
+        with get_connection() as con:
+            leases.release(con, LEADER_LEASE, self.owner)
+            con.commit()
+        self.is_leader = False
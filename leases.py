@@ -0,0 +1,50 @@
+# leases.py
+import logging
+import clock
+
+logger = logging.getLogger(__name__)
+
+def init_leases_schema(cur):
+    """Таблица аренд: владение шардами напоминаний и другими общими ресурсами"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            acquired_at REAL NOT NULL
+        )
+    """)
+
+def try_acquire(con, name, owner, ttl, now=None):
+    """Захватывает или продлевает аренду. Чужую аренду можно забрать только после истечения"""
+    now = clock.timestamp() if now is None else now
+    cur = con.execute("""
+        INSERT INTO leases (name, owner, expires_at, acquired_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET
+            owner = excluded.owner,
+            expires_at = excluded.expires_at,
+            acquired_at = CASE WHEN leases.owner = excluded.owner
+                               THEN leases.acquired_at ELSE excluded.acquired_at END
+        WHERE leases.owner = excluded.owner OR leases.expires_at < excluded.acquired_at
+    """, (name, owner, now + ttl, now))
+    return cur.rowcount == 1
+
+def release(con, name, owner):
+    con.execute("DELETE FROM leases WHERE name=? AND owner=?", (name, owner))
+
+def holds(con, name, owner, now=None):
+    now = clock.timestamp() if now is None else now
+    row = con.execute(
+        "SELECT 1 FROM leases WHERE name=? AND owner=? AND expires_at > ?",
+        (name, owner, now)
+    ).fetchone()
+    return row is not None
+
+def live_owners(con, prefix, now=None):
+    """Владельцы действующих аренд с заданным префиксом имени"""
+    now = clock.timestamp() if now is None else now
+    rows = con.execute(
+        "SELECT DISTINCT owner FROM leases WHERE name LIKE ? AND expires_at > ?",
+        (f"{prefix}%", now)
+    ).fetchall()
+    return {row[0] for row in rows}
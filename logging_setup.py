@@ -0,0 +1,95 @@
+# logging_setup.py
+import os
+import json
+import gzip
+import queue
+import shutil
+import logging
+import itertools
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from config import Config
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# Пометка для частых сообщений, которые на уровне INFO пишутся выборочно:
+# logger.info("...", extra=HOT_PATH)
+HOT_PATH = {"hot_path": True}
+
+class LazyQueueHandler(QueueHandler):
+    """Кладёт запись в очередь без форматирования: строка собирается в фоновом потоке"""
+
+    def prepare(self, record):
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только каждое N-е INFO-сообщение, помеченное как HOT_PATH"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = max(rate, 1)
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno != logging.INFO or not getattr(record, "hot_path", False):
+            return True
+        return next(self._counter) % self.rate == 0
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный вывод: одна JSON-запись на строку"""
+
+    def format(self, record):
+        payload = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False)
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def _build_file_handler():
+    if Config.LOG_ROTATE_WHEN:
+        handler = TimedRotatingFileHandler(
+            Config.LOG_PATH, when=Config.LOG_ROTATE_WHEN,
+            backupCount=Config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = RotatingFileHandler(
+            Config.LOG_PATH, maxBytes=Config.LOG_MAX_BYTES,
+            backupCount=Config.LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    handler.namer = _gzip_namer
+    handler.rotator = _gzip_rotator
+    return handler
+
+def setup_logging(level=logging.INFO):
+    """Настраивает логирование через очередь; запись на диск выполняет фоновый поток.
+
+    Возвращает запущенный QueueListener, его нужно остановить при завершении работы.
+    """
+    formatter = JsonFormatter() if Config.LOG_JSON else logging.Formatter(LOG_FORMAT)
+    targets = [_build_file_handler(), logging.StreamHandler()]
+    for handler in targets:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *targets, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,111 @@
+# metrics.py
+import time
+from contextlib import contextmanager
+from collections import defaultdict, deque
+
+# Простые метрики процесса: счётчики, значения и распределения длительностей
+_counters = defaultdict(int)
+_gauges = {}
+_timings = {}
+
+class Timing:
+    """Количество, сумма, максимум и последние значения для перцентилей"""
+
+    def __init__(self, reservoir=1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=reservoir)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, p):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[min(int(len(values) * p), len(values) - 1)]
+
+def inc(name, value=1):
+    _counters[name] += value
+
+def set_gauge(name, value):
+    _gauges[name] = value
+
+def observe(name, seconds):
+    timing = _timings.get(name)
+    if timing is None:
+        timing = _timings[name] = Timing()
+    timing.observe(seconds)
+
+class timed:
+    """Контекстный менеджер: with metrics.timed("db.query"): ..."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+class PhaseTimer:
+    """Замер последовательных фаз, например запуска: with timer.phase("init_db"): ...
+
+    Длительность каждой фазы сохраняется как значение "<prefix>.<фаза>".
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.phases = []
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+        set_gauge(f"{self.prefix}.{name}", seconds)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def report(self):
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases)
+
+def snapshot():
+    return {
+        "counters": dict(_counters),
+        "gauges": dict(_gauges),
+        "timings": {
+            name: {
+                "count": t.count,
+                "avg": t.total / t.count if t.count else 0.0,
+                "p50": t.percentile(0.5),
+                "p95": t.percentile(0.95),
+                "max": t.max,
+            }
+            for name, t in _timings.items()
+        },
+    }
+
+def format_metrics():
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name}: {value}")
+    for name, value in sorted(data["gauges"].items()):
+        lines.append(f"{name}: {round(value, 3) if isinstance(value, float) else value}")
+    for name, t in sorted(data["timings"].items()):
+        lines.append(
+            f"{name}: n={t['count']} avg={t['avg'] * 1000:.1f}ms "
+            f"p95={t['p95'] * 1000:.1f}ms max={t['max'] * 1000:.1f}ms"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,129 @@
+# quickadd.py
+"""
+Разбор быстрого добавления напоминания одной фразой:
+
+    завтра 9:30 встреча
+    в пятницу 18:00 футбол за 30 мин
+    25.12 10:00 поздравить маму
+    14:15 созвон            (сегодня, а если время прошло — завтра)
+
+Обязательны время ЧЧ:ММ и название; дата и упреждение ("за N мин", "за час") необязательны.
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+WEEKDAYS = {
+    "пн": 0, "понедельник": 0,
+    "вт": 1, "вторник": 1,
+    "ср": 2, "среда": 2, "среду": 2,
+    "чт": 3, "четверг": 3,
+    "пт": 4, "пятница": 4, "пятницу": 4,
+    "сб": 5, "суббота": 5, "субботу": 5,
+    "вс": 6, "воскресенье": 6,
+}
+MAX_LEAD_MINUTES = 24 * 60
+
+_B = r"(?:(?<=\s)|^)"   # граница слова слева
+_E = r"(?=\s|$)"        # граница слова справа
+TIME_RE = re.compile(_B + r"(?:в\s+)?([01]?\d|2[0-3]):([0-5]\d)" + _E)
+LEAD_RE = re.compile(_B + r"за\s+(?:(\d{1,4})\s*(?:мин\w*|м)|(час))" + _E)
+RELATIVE_RE = re.compile(_B + r"(" + "|".join(RELATIVE_DAYS) + r")" + _E)
+WEEKDAY_RE = re.compile(_B + r"(?:во?\s+)?(" + "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + r")" + _E)
+DATE_RE = re.compile(_B + r"(\d{1,2})\.(\d{1,2})(?:\.(\d{4}|\d{2}))?" + _E)
+
+class QuickAdd(NamedTuple):
+    when: datetime
+    title: str
+    lead: int
+
+def _take(pattern, text):
+    """Ищет первое совпадение и вырезает его из текста"""
+    match = pattern.search(text)
+    if not match:
+        return None, text
+    return match, text[:match.start()] + " " + text[match.end():]
+
+def _resolve_date(text, now, hour, minute):
+    """Дата из текста; None, если дата указана некорректно"""
+    today = now.date()
+
+    match, text = _take(RELATIVE_RE, text)
+    if match:
+        return today + timedelta(days=RELATIVE_DAYS[match.group(1)]), text
+
+    match, text = _take(WEEKDAY_RE, text)
+    if match:
+        ahead = (WEEKDAYS[match.group(1)] - today.weekday()) % 7
+        if ahead == 0 and (hour, minute) <= (now.hour, now.minute):
+            ahead = 7
+        return today + timedelta(days=ahead), text
+
+    match, text = _take(DATE_RE, text)
+    if match:
+        day, month, year = match.groups()
+        year = int(year) if year else today.year
+        if year < 100:
+            year += 2000
+        try:
+            result = date(year, int(month), int(day))
+        except ValueError:
+            return None, text
+        if not match.group(3) and result < today:
+            try:
+                result = result.replace(year=year + 1)
+            except ValueError:
+                return None, text
+        return result, text
+
+    # Без даты: сегодня, а если время уже прошло — завтра
+    if (hour, minute) <= (now.hour, now.minute):
+        return today + timedelta(days=1), text
+    return today, text
+
+def parse(text, now):
+    """Возвращает QuickAdd или None, если фраза не похожа на быстрое добавление.
+
+    now — текущее время с часовым поясом пользователя; результат в том же поясе.
+    """
+    text = " ".join(text.split())
+    lowered = text.lower()
+
+    match, rest = _take(TIME_RE, lowered)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+
+    lead = 0
+    lead_match, rest = _take(LEAD_RE, rest)
+    if lead_match:
+        lead = 60 if lead_match.group(2) else int(lead_match.group(1))
+        if lead > MAX_LEAD_MINUTES:
+            return None
+
+    day, rest = _resolve_date(rest, now, hour, minute)
+    if day is None:
+        return None
+
+    # Название берём из исходного текста, чтобы сохранить регистр: убираем те же позиции
+    title = _restore_case(text, lowered, rest)
+    if not title:
+        return None
+
+    when = datetime(day.year, day.month, day.day, hour, minute, tzinfo=now.tzinfo)
+    return QuickAdd(when, title, lead)
+
+def _restore_case(original, lowered, rest):
+    """Оставшиеся слова rest в регистре исходного текста"""
+    words = rest.split()
+    result = []
+    position = 0
+    for word in words:
+        index = lowered.find(word, position)
+        if index < 0:
+            result.append(word)
+            continue
+        result.append(original[index:index + len(word)])
+        position = index + len(word)
+    return " ".join(result)
@@ -0,0 +1,185 @@
+# recorder.py
+"""
+Запись входящих обновлений для воспроизведения реальной нагрузки (replay.py).
+
+Включается переменной SCHEDULER_BOT_RECORD_UPDATES_PATH. Каждое обновление
+обезличивается и дописывается строкой JSON {"t": время прихода, "u": обновление}
+в сжатый gzip-журнал. Запись идёт фоновым потоком и не задерживает обработчики;
+каждый запуск добавляет к файлу новый gzip-фрагмент, gzip читает их подряд.
+
+Обезличивание: id пользователей и чатов заменяются хэшем с солью
+(Config.RECORD_SALT), имена и номера телефонов удаляются, в тексте буквы
+заменяются на "x", кроме кнопок меню, команд и слов быстрого добавления —
+от них зависит выбор обработчика.
+
+Проверка обезличивания: python recorder.py
+"""
+import re
+import gzip
+import json
+import time
+import queue
+import hashlib
+import logging
+import secrets
+import threading
+from telegram import Update
+from telegram.ext import ContextTypes
+from config import Config
+import quickadd
+
+logger = logging.getLogger(__name__)
+
+# Признаки объекта User или Chat: вместе с числовым id по ним объект узнаётся
+# в любом месте обновления — в new_chat_members, left_chat_member, entities
+PERSON_MARKERS = {"first_name", "is_bot", "type"}
+# Личные данные, которые в журнал не попадают
+DROP_KEYS = {"last_name", "username", "title", "phone_number", "bio", "location", "contact"}
+# Обязательные для разбора поля заменяются заглушкой
+PLACEHOLDERS = {"first_name": "user"}
+# Слова, которые разбирает quickadd: замена исказила бы выбор обработчика
+KEEP_WORDS = {"в", "во", "за", "мин", "минут", "минуты", "час"} | set(quickadd.RELATIVE_DAYS) | set(quickadd.WEEKDAYS)
+WORD_RE = re.compile(r"[^\W\d_]+")
+
+# Сжатый поток сбрасывается на диск не чаще, чем раз в FLUSH_SECONDS
+FLUSH_SECONDS = 1.0
+
+# None в очереди завершает поток записи
+_queue = queue.SimpleQueue()
+_thread = None
+_salt = b""
+_keep_texts = frozenset()
+
+def _anonymize_id(value):
+    digest = hashlib.blake2b(str(value).encode(), key=_salt, digest_size=6).digest()
+    anonymous = int.from_bytes(digest, "big") >> 1
+    # Знак сохраняется: отрицательные id у групповых чатов
+    return -anonymous if value < 0 else anonymous
+
+def _anonymize_text(text):
+    if text in _keep_texts:
+        return text
+    if text.startswith("/"):
+        command, _, rest = text.partition(" ")
+        return command + (" " + _anonymize_text(rest) if rest else "")
+    return WORD_RE.sub(lambda m: m.group(0) if m.group(0).lower() in KEEP_WORDS else "x" * len(m.group(0)), text)
+
+def _is_person(data):
+    return isinstance(data.get("id"), int) and not PERSON_MARKERS.isdisjoint(data)
+
+def anonymize(data):
+    """Обезличенная копия словаря обновления"""
+    if isinstance(data, list):
+        return [anonymize(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    person = _is_person(data)
+    result = {}
+    for key, value in data.items():
+        if key in DROP_KEYS:
+            continue
+        if person and key == "id":
+            result[key] = _anonymize_id(value)
+        elif person and key in PLACEHOLDERS:
+            result[key] = PLACEHOLDERS[key]
+        elif key in ("text", "caption") and isinstance(value, str):
+            # Длина текста не меняется, поэтому смещения entities остаются верными
+            result[key] = _anonymize_text(value)
+        else:
+            result[key] = anonymize(value)
+    return result
+
+def _writer_loop(path):
+    with gzip.open(path, "ab", compresslevel=6) as f:
+        last_flush = time.monotonic()
+        dirty = False
+        while True:
+            try:
+                line = _queue.get(timeout=FLUSH_SECONDS)
+            except queue.Empty:
+                line = b""
+            if line is None:
+                break
+            if line:
+                f.write(line)
+                dirty = True
+            if dirty and time.monotonic() - last_flush >= FLUSH_SECONDS:
+                f.flush()
+                dirty = False
+                last_flush = time.monotonic()
+
+def start(keep_texts=()):
+    """Запускает запись, если задан Config.RECORD_UPDATES_PATH. keep_texts — тексты кнопок меню"""
+    global _thread, _salt, _keep_texts
+    if not Config.RECORD_UPDATES_PATH or _thread:
+        return False
+    # Без постоянной соли одинаковые пользователи совпадают только в пределах запуска
+    _salt = (Config.RECORD_SALT or secrets.token_hex(16)).encode()[:64]
+    _keep_texts = frozenset(keep_texts)
+    _thread = threading.Thread(
+        target=_writer_loop, args=(Config.RECORD_UPDATES_PATH,), name="update-recorder", daemon=True
+    )
+    _thread.start()
+    logger.info(f"Recording updates to {Config.RECORD_UPDATES_PATH}")
+    return True
+
+def stop():
+    global _thread
+    if _thread:
+        _queue.put(None)
+        _thread.join(timeout=5)
+        _thread = None
+
+async def record_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик группы -100: ставит обновление в очередь записи"""
+    if not _thread:
+        return
+    try:
+        entry = {"t": round(time.time(), 3), "u": anonymize(update.to_dict())}
+        _queue.put(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+    except Exception as e:
+        logger.error(f"Failed to record update: {e}")
+
+def read_log(path):
+    """Записи журнала по порядку: (время прихода, словарь обновления)"""
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Последняя строка могла оборваться при аварийной остановке
+                continue
+            yield entry["t"], entry["u"]
+
+def _self_check():
+    """Проверка обезличивания: вступление и выход участников, упоминание без username"""
+    global _salt
+    _salt = b"self-check"
+    alice = {"id": 601, "is_bot": False, "first_name": "Alice", "last_name": "Smith", "username": "alice"}
+    bob = {"id": 602, "is_bot": False, "first_name": "Bob", "username": "bob_b"}
+    group = {"id": -100500, "type": "supergroup", "title": "Family"}
+    updates = [
+        {"update_id": 1, "message": {"message_id": 10, "date": 0, "chat": group, "from": alice,
+                                     "new_chat_members": [alice, bob], "new_chat_member": bob,
+                                     "new_chat_participant": bob}},
+        {"update_id": 2, "message": {"message_id": 11, "date": 0, "chat": group, "from": bob,
+                                     "left_chat_member": bob, "left_chat_participant": bob}},
+        {"update_id": 3, "message": {"message_id": 12, "date": 0, "chat": group, "from": bob,
+                                     "text": "/remind Alice завтра в 10:00",
+                                     "entities": [{"type": "bot_command", "offset": 0, "length": 7},
+                                                  {"type": "text_mention", "offset": 8, "length": 5,
+                                                   "user": alice}]}},
+    ]
+    secrets_left = ("601", "602", "100500", "Alice", "Smith", "alice", "Bob", "bob_b", "Family")
+    for update in updates:
+        dump = json.dumps(anonymize(update), ensure_ascii=False)
+        leaked = [value for value in secrets_left if value in dump]
+        assert not leaked, f"update {update['update_id']} leaks {leaked}: {dump}"
+    anonymous = anonymize(updates[0])["message"]
+    # Один и тот же пользователь получает один и тот же id везде в журнале
+    assert anonymous["from"]["id"] == anonymous["new_chat_members"][0]["id"]
+    assert anonymous["chat"]["id"] < 0
+    print("recorder: anonymize ok")
+
+if __name__ == "__main__":
+    _self_check()
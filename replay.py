@@ -0,0 +1,229 @@
+# replay.py
+"""
+Воспроизведение журнала обновлений (recorder.py) против локальной имитации Bot API.
+
+Обновления подаются в обработчики из bot.register_handlers в исходном темпе,
+ускоренно или без пауз. База — временная копия рабочей, сама рабочая не меняется.
+Отчёт: задержки по обработчикам, пропускная способность и вызовы API; его можно
+сохранить и сравнить с прогоном другой версии.
+
+    python replay.py updates.jsonl.gz --speed max --json before.json
+    python replay.py updates.jsonl.gz --speed 10 --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from functools import wraps
+from telegram import Update
+from config import Config
+import fake_api
+import metrics
+import recorder
+
+class CountingAPI(fake_api.FakeBotAPI):
+    """Имитация Bot API, считающая вызовы по методам"""
+
+    def __init__(self, latency):
+        super().__init__(latency=latency)
+        self.calls = Counter()
+        self._counter_lock = threading.Lock()
+
+    def call(self, method, params):
+        with self._counter_lock:
+            self.calls[method] += 1
+        return super().call(method, params)
+
+def start_fake_api(latency):
+    api = CountingAPI(latency)
+    server = fake_api.FakeServer(("127.0.0.1", 0), fake_api.make_handler(api))
+    threading.Thread(target=server.serve_forever, name="fake-api", daemon=True).start()
+    return api, server
+
+def copy_database(source, target):
+    """Согласованная копия рабочей базы через backup API (база может быть открыта ботом)"""
+    if not source or not os.path.exists(source):
+        return False
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return True
+
+def instrument(app, timings):
+    """Оборачивает обработчики приложения замером времени по имени функции"""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            callback = handler.callback
+            name = getattr(callback, "__name__", repr(callback))
+            timing = timings.setdefault(name, metrics.Timing(reservoir=100_000))
+
+            def timed(callback=callback, timing=timing):
+                @wraps(callback)
+                async def wrapper(update, context):
+                    started = time.perf_counter()
+                    try:
+                        return await callback(update, context)
+                    finally:
+                        timing.observe(time.perf_counter() - started)
+                return wrapper
+            handler.callback = timed()
+
+def summarize(timing):
+    return {
+        "count": timing.count,
+        "mean_ms": timing.total / timing.count * 1000 if timing.count else 0.0,
+        "p50_ms": timing.percentile(0.5) * 1000,
+        "p95_ms": timing.percentile(0.95) * 1000,
+        "p99_ms": timing.percentile(0.99) * 1000,
+        "max_ms": timing.max * 1000,
+    }
+
+async def replay(args):
+    import bot
+    from database import init_db
+    from scheduler import SchedulerManager
+    import writer
+    import throttle
+    import logging
+
+    bot.start_logging()
+    # Строки о каждом запросе к имитации API заглушили бы отчёт
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("apscheduler").setLevel(logging.WARNING)
+    api, server = start_fake_api(args.api_latency)
+    Config.TOKEN = "123456:replay"
+    Config.BOT_API_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}/bot"
+    app = bot.build_application()
+    bot.register_handlers(app)
+
+    timings = {}
+    instrument(app, timings)
+    total = metrics.Timing(reservoir=100_000)
+    lag = metrics.Timing(reservoir=100_000)
+
+    init_db()
+    app.scheduler_manager = SchedulerManager(app)
+    await app.scheduler_manager.start_scheduler()
+    writer.start()
+    await app.initialize()
+
+    errors = 0
+    processed = 0
+    first_t = None
+    started = time.perf_counter()
+    try:
+        for t, data in recorder.read_log(args.log):
+            if args.limit and processed >= args.limit:
+                break
+            if first_t is None:
+                first_t = t
+            if args.speed:
+                # Пауза до момента прихода обновления в масштабе --speed; отставание учитывается
+                delay = (t - first_t) / args.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                lag.observe(max(-delay, 0.0))
+
+            update = Update.de_json(data, app.bot)
+            update_started = time.perf_counter()
+            try:
+                await app.process_update(update)
+            except Exception as e:
+                errors += 1
+                print(f"update {data.get('update_id')} failed: {e}", file=sys.stderr)
+            total.observe(time.perf_counter() - update_started)
+            processed += 1
+        # Отложенные throttle.py переключения месяца тоже входят в прогон
+        await throttle.flush()
+    finally:
+        wall = time.perf_counter() - started
+        await writer.stop()
+        await app.shutdown()
+        app.scheduler_manager.scheduler.shutdown(wait=False)
+        server.shutdown()
+        bot.log_listener.stop()
+
+    return {
+        "log": os.path.basename(args.log),
+        "speed": args.speed or "max",
+        "updates": processed,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput": processed / wall if wall else 0.0,
+        "update": summarize(total),
+        "lag_ms_p95": lag.percentile(0.95) * 1000,
+        "handlers": {name: summarize(timing) for name, timing in sorted(timings.items()) if timing.count},
+        "api_calls": dict(api.calls),
+    }
+
+def print_report(report, baseline=None):
+    print(f"{report['updates']} updates in {report['wall_seconds']:.2f}s "
+          f"({report['throughput']:.1f}/s, speed {report['speed']}), errors: {report['errors']}")
+    if report["speed"] != "max":
+        print(f"lag behind recorded timing p95: {report['lag_ms_p95']:.1f} ms")
+    print(f"{'handler':32} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = [("(whole update)", report["update"])] + list(report["handlers"].items())
+    for name, row in rows:
+        line = (f"{name:32} {row['count']:7} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} "
+                f"{row['p99_ms']:8.2f} {row['max_ms']:8.2f}")
+        if baseline:
+            old = baseline["update"] if name == "(whole update)" else baseline["handlers"].get(name)
+            if old and old["p95_ms"]:
+                line += f"   p95 {(row['p95_ms'] / old['p95_ms'] - 1) * 100:+.0f}%"
+        print(line)
+    if baseline and baseline.get("throughput"):
+        print(f"throughput vs baseline: {(report['throughput'] / baseline['throughput'] - 1) * 100:+.0f}%")
+    print("API calls: " + ", ".join(f"{method} {count}" for method, count in sorted(report["api_calls"].items())))
+
+def parse_speed(value):
+    if value == "max":
+        return 0.0
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument("log", help="журнал recorder.py (.jsonl.gz)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 10 (или 10x), max")
+    parser.add_argument("--db", default=Config.DB_PATH, help="база, копия которой используется")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа имитации API, секунды")
+    parser.add_argument("--limit", type=int, default=0, help="не больше N обновлений")
+    parser.add_argument("--json", help="сохранить отчёт в файл")
+    parser.add_argument("--compare", help="сравнить с сохранённым отчётом")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = os.path.join(tmp, "replay.db")
+        if not copy_database(args.db, scratch):
+            print(f"{args.db} not found, replaying against an empty database")
+        Config.DB_PATH = scratch
+        Config.ARCHIVE_DB_PATH = os.path.join(tmp, "replay_archive.db")
+        Config.BACKUP_DIR = os.path.join(tmp, "backups")
+        Config.LOG_PATH = os.path.join(tmp, "replay.log")
+        # Воспроизведение не должно само писать журнал
+        Config.RECORD_UPDATES_PATH = ""
+        report = asyncio.run(replay(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
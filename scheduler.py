@@ -1,20 +1,42 @@
+import html
+import time
 import asyncio
 import logging
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
+from telegram.constants import ParseMode
+from telegram.error import ChatMigrated
 from config import Config
-from database import get_connection
+from logging_setup import HOT_PATH
+import storage
+import metrics
+import delivery
+import clock
+from leader import LEADER_LEASE
 
 logger = logging.getLogger(__name__)
 
 class SchedulerManager:
-    def __init__(self, app):
+    def __init__(self, app, scheduler=None):
         self.app = app
-        self.scheduler = AsyncIOScheduler(timezone=ZoneInfo(Config.TZ))
+        # Свой планировщик передаёт simulation.py, чтобы задачи шли по виртуальному времени
+        self.scheduler = scheduler or AsyncIOScheduler(timezone=ZoneInfo(Config.TZ))
         logger.info("Scheduler initialized")
         self.active_jobs = {}
+        # job_id -> chat_id, чтобы снимать задачи шардов, которые перешли другому процессу
+        self.job_chats = {}
+        # Координатор шардов; None, если процесс обслуживает все напоминания
+        self.coordinator = None
+        # Выбор ведущего; без шардов напоминания доставляет только ведущий
+        self.elector = None
+        self.last_seen_id = 0
+        # Выполняющиеся отправки, которые нужно дождаться при остановке
+        self.in_flight = set()
+        # Фоновые загрузки напоминаний из базы
+        self.loading_tasks = set()
+        self.draining = False
         
     async def start_scheduler(self):
         """Запускает планировщик"""
@@ -22,26 +44,56 @@ class SchedulerManager:
             self.scheduler.start()
             logger.info("Scheduler started")
 
-    async def schedule_reminder(self, reminder_id, user_id, title, scheduled_dt_local, lead_minutes):
+    def delivers(self, chat_id):
+        """Доставляет ли этот процесс напоминания чата"""
+        if self.coordinator:
+            return self.coordinator.owns(chat_id)
+        if self.elector:
+            return self.elector.is_leader
+        return True
+
+    def delivery_lease(self, chat_id):
+        """Аренда, без которой процесс не вправе отправлять напоминание в чат"""
+        if self.coordinator:
+            return self.coordinator.lease_name_for(chat_id)
+        if self.elector:
+            return LEADER_LEASE
+        return None
+
+    async def schedule_reminder(self, reminder_id, chat_id, title, scheduled_dt_local, lead_minutes,
+                                catch_up=False, resume_at=None, check_dead=True):
+        # Чужие напоминания подхватит их владелец при следующем heartbeat
+        if not self.delivers(chat_id):
+            return False
+        
+        # Не тратим вызовы API на чаты, которые заблокировали бота
+        # (при загрузке из базы такие чаты уже отфильтрованы запросом)
+        if check_dead and await asyncio.to_thread(delivery.suppress_if_dead_chat, reminder_id, chat_id):
+            metrics.inc("delivery.suppressed")
+            logger.info("Reminder %s suppressed: chat %s is unreachable", reminder_id, chat_id)
+            return False
+        
         # Рассчитываем время отправки напоминания
         send_at = scheduled_dt_local - timedelta(minutes=lead_minutes)
-        now = datetime.now(ZoneInfo(Config.TZ))
+        now = clock.now()
+        
+        if resume_at is not None:
+            # Повторная попытка или прерванная отправка: время события уже проверено
+            send_at = max(resume_at, now + timedelta(seconds=1))
+        # При переходе шарда недавно пропущенное напоминание отправляем с опозданием, а не теряем
+        elif catch_up and now - timedelta(seconds=Config.DELIVERY_GRACE_SECONDS) < send_at <= now:
+            send_at = now + timedelta(seconds=1)
         
         # Проверяем, не прошло ли уже время
         if send_at <= now:
-            logger.warning(f"Send time in past, skipping schedule: {send_at} <= {now}")
+            logger.warning("Send time in past, skipping schedule: %s <= %s", send_at, now)
             
             # Помечаем напоминание как отправленное, если время уже прошло
             try:
-                with get_connection() as con:
-                    con.execute(
-                        "UPDATE reminders SET sent=1 WHERE id=?",
-                        (reminder_id,)
-                    )
-                    con.commit()
-                logger.info(f"Marked past reminder {reminder_id} as sent")
+                storage.current().mark_sent_many([reminder_id])
+                logger.info("Marked past reminder %s as sent", reminder_id)
             except Exception as e:
-                logger.error(f"Failed to mark past reminder as sent: {e}")
+                logger.error("Failed to mark past reminder as sent: %s", e)
                 
             return False
         
@@ -51,141 +103,343 @@ class SchedulerManager:
         if job_id in self.active_jobs:
             try:
                 self.scheduler.remove_job(job_id)
-                logger.debug(f"Removed existing job: {job_id}")
+                logger.debug("Removed existing job: %s", job_id)
             except Exception as e:
-                logger.error(f"Error removing job {job_id}: {e}")
+                logger.error("Error removing job %s: %s", job_id, e)
         
-        # Создаем задачу для отправки напоминания
-        async def send_reminder_task():
-            try:
-                logger.info(f"Executing reminder job: {job_id}")
-                
-                # Форматируем время для пользователя
-                time_str = scheduled_dt_local.strftime('%d.%m.%Y %H:%M')
-                message = (
-                    f"🔔 Напоминание: {title}\n"
-                    f"⏰ Время события: {time_str}"
-                )
-                
-                if lead_minutes > 0:
-                    message += f"\nОтправлено за {lead_minutes} мин. до события"
-                
-                await self.app.bot.send_message(chat_id=user_id, text=message)
-                logger.info(f"Reminder sent to user {user_id}")
-                
-                # Отмечаем напоминание как отправленное в БД
-                with get_connection() as con:
-                    con.execute(
-                        "UPDATE reminders SET sent=1 WHERE id=?",
-                        (reminder_id,)
-                    )
-                    con.commit()
-                logger.info(f"Reminder {reminder_id} marked as sent")
-                
-            except Exception as e:
-                logger.error(f"Failed to send reminder {job_id}: {e}", exc_info=True)
-            finally:
-                # Удаляем задачу из активных
-                if job_id in self.active_jobs:
-                    del self.active_jobs[job_id]
-
         try:
-            # Создаем и запускаем фоновую задачу
-            job = self.scheduler.add_job(
-                send_reminder_task,  # Передаем корутину напрямую
-                trigger=DateTrigger(run_date=send_at),
-                id=job_id
+            return self._add_delivery_job(
+                job_id, send_at, (reminder_id, chat_id, title, scheduled_dt_local, lead_minutes)
             )
-            
-            self.active_jobs[job_id] = job
-            logger.info(f"Scheduled reminder {job_id} for {send_at.isoformat()}")
-            return True
         except Exception as e:
-            logger.error(f"Failed to schedule job {job_id}: {e}", exc_info=True)
+            logger.error("Failed to schedule job %s: %s", job_id, e, exc_info=True)
             return False
 
-    async def schedule_existing_reminders(self):
-        logger.info("Scheduling existing reminders")
+    def _add_delivery_job(self, job_id, run_at, args):
+        job = self.scheduler.add_job(
+            self._run_delivery,
+            trigger=DateTrigger(run_date=run_at),
+            id=job_id,
+            args=args,
+            replace_existing=True
+        )
+        self.active_jobs[job_id] = job
+        self.job_chats[job_id] = args[1]
+        logger.info("Scheduled reminder %s for %s", job_id, run_at, extra=HOT_PATH)
+        return True
+
+    async def _run_delivery(self, reminder_id, chat_id, title, scheduled_dt_local, lead_minutes):
+        job_id = f"reminder_{reminder_id}"
+        retry_at = None
+        if self.draining:
+            # Напоминание остаётся pending и будет загружено при следующем запуске
+            return
+        task = asyncio.current_task()
+        self.in_flight.add(task)
         try:
-            with get_connection() as con:
-                cur = con.cursor()
-                cur.execute(
-                    "SELECT id, user_id, title, scheduled_iso, lead_minutes "
-                    "FROM reminders WHERE sent=0"
+            logger.info("Executing reminder job: %s", job_id, extra=HOT_PATH)
+            retry_at = await self.deliver_reminder(reminder_id, chat_id, title, scheduled_dt_local, lead_minutes)
+        except Exception as e:
+            logger.error("Failed to deliver reminder %s: %s", job_id, e, exc_info=True)
+        finally:
+            self.in_flight.discard(task)
+            if retry_at is not None and self.delivers(chat_id):
+                # Задача повтора занимает место текущей под тем же id
+                self._add_delivery_job(
+                    job_id, retry_at, (reminder_id, chat_id, title, scheduled_dt_local, lead_minutes)
+                )
+            else:
+                # Удаляем задачу из активных
+                self.active_jobs.pop(job_id, None)
+                self.job_chats.pop(job_id, None)
+
+    async def deliver_reminder(self, reminder_id, chat_id, title, scheduled_dt_local, lead_minutes):
+        """Одна попытка доставки. Возвращает время следующей попытки или None.
+
+        Попытка начинается с захвата напоминания (pending/retrying → in_flight) и
+        завершается переходом в sent, retrying или dead с проверкой ключа попытки.
+        """
+        claimed = await asyncio.to_thread(
+            delivery.claim, reminder_id, Config.INSTANCE_ID, self.delivery_lease(chat_id)
+        )
+        if claimed is None:
+            logger.info("Reminder %s already delivered or claimed elsewhere, skipping", reminder_id)
+            return None
+        key, attempt = claimed
+        
+        # Групповому напоминанию — одно сообщение в чат с упоминанием исполнителей,
+        # а не отдельная отправка каждому (id групп в Telegram отрицательные)
+        assignees = []
+        if chat_id < 0:
+            assignees = await asyncio.to_thread(storage.current().reminder_assignees, reminder_id)
+        
+        # Форматируем время для пользователя
+        time_str = scheduled_dt_local.strftime('%d.%m.%Y %H:%M')
+        message = (
+            f"🔔 Напоминание: {html.escape(title)}\n"
+            f"⏰ Время события: {time_str}"
+        )
+        
+        if lead_minutes > 0:
+            message += f"\nОтправлено за {lead_minutes} мин. до события"
+        if assignees:
+            message += "\n👥 " + ", ".join(
+                f'<a href="tg://user?id={user_id}">{html.escape(first_name or username or str(user_id))}</a>'
+                for user_id, first_name, username in assignees
+            )
+        
+        try:
+            try:
+                with metrics.timed("delivery.send"):
+                    await self.app.bot.send_message(chat_id=chat_id, text=message, parse_mode=ParseMode.HTML)
+            except ChatMigrated as e:
+                # Группа стала супергруппой: переносим её записи и отправляем по новому id в той же попытке
+                await asyncio.to_thread(delivery.migrate_chat, chat_id, e.new_chat_id)
+                chat_id = e.new_chat_id
+                with metrics.timed("delivery.send"):
+                    await self.app.bot.send_message(chat_id=chat_id, text=message, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            return await self._handle_delivery_error(reminder_id, chat_id, scheduled_dt_local, key, attempt, e)
+        
+        # Сообщение ушло: повторять нельзя, даже если запись в БД не удалась —
+        # ключ попытки не даст другому процессу считать её своей до истечения тайм-аута
+        metrics.inc("delivery.sent")
+        logger.info("Reminder sent to chat %s", chat_id, extra=HOT_PATH)
+        try:
+            await asyncio.to_thread(delivery.mark_sent, reminder_id, key)
+            logger.info("Reminder %s marked as sent", reminder_id, extra=HOT_PATH)
+        except Exception as e:
+            logger.error("Failed to mark reminder %s as sent: %s", reminder_id, e, exc_info=True)
+        return None
+
+    async def _handle_delivery_error(self, reminder_id, chat_id, scheduled_dt_local, key, attempt, error):
+        outcome, delay = delivery.classify(error)
+        error_text = f"{type(error).__name__}: {error}"
+        
+        if outcome == delivery.DEAD_CHAT:
+            suppressed = await asyncio.to_thread(delivery.add_dead_letter, chat_id, error_text, reminder_id)
+            for rem_id in suppressed:
+                job_id = f"reminder_{rem_id}"
+                if rem_id != reminder_id and self.active_jobs.pop(job_id, None):
+                    self.job_chats.pop(job_id, None)
+                    try:
+                        self.scheduler.remove_job(job_id)
+                    except Exception:
+                        pass
+            metrics.inc("delivery.dead_chats")
+            logger.warning(
+                "Chat %s is unreachable (%s), suppressed %d reminders", chat_id, error_text, len(suppressed)
+            )
+            return None
+        
+        now = clock.now()
+        retry_at = now + timedelta(seconds=delay if delay is not None else delivery.backoff(attempt))
+        # Напоминание после начала события бесполезно; ждём не дольше окна опоздания
+        deadline = scheduled_dt_local + timedelta(seconds=Config.DELIVERY_GRACE_SECONDS)
+        
+        if outcome == delivery.RETRY and attempt < Config.DELIVERY_MAX_ATTEMPTS and retry_at <= deadline:
+            if await asyncio.to_thread(delivery.schedule_retry, reminder_id, key, retry_at.timestamp(), error_text):
+                metrics.inc("delivery.retries")
+                logger.warning(
+                    "Reminder %s attempt %d failed (%s), retrying at %s", reminder_id, attempt, error_text, retry_at
                 )
-                rows = cur.fetchall()
+                return retry_at
+            return None
+        
+        await asyncio.to_thread(delivery.mark_dead, reminder_id, key, error_text)
+        metrics.inc("delivery.dead")
+        logger.error("Reminder %s is dead after %d attempts: %s", reminder_id, attempt, error_text)
+        return None
+
+    def _fetch_pending_chunk(self, shards, min_id, after, limit):
+        """Следующая порция неотправленных напоминаний по возрастанию времени события.
+
+        С min_id — только созданные позже, по возрастанию id: heartbeat подхватывает их каждые
+        несколько секунд, и обход всех неотправленных по времени был бы линейным
+        по их числу. after — (scheduled_iso, id) последней строки прошлой порции.
+        """
+        shard_count = self.coordinator.shard_count if shards is not None else 1
+        if min_id:
+            return storage.current().new_reminders_page(
+                max(min_id, after[1]), limit, shards=shards, shard_count=shard_count
+            )
+        return storage.current().pending_reminders_page(after, limit, shards=shards, shard_count=shard_count)
+
+    @staticmethod
+    def _mark_past_sent(reminder_ids):
+        storage.current().mark_sent_many(reminder_ids)
+
+    async def schedule_existing_reminders(self, shards=None, catch_up=False, min_id=0):
+        """Планирует неотправленные напоминания; shards ограничивает выборку шардами процесса.
+
+        Напоминания читаются порциями по Config.REMINDER_LOAD_CHUNK в порядке времени
+        события, поэтому ближайшие планируются первыми, а между порциями цикл событий
+        успевает обрабатывать обновления. Возвращает число запланированных напоминаний.
+        """
+        if not min_id:
+            logger.info("Scheduling existing reminders")
+        scheduled = 0
+        try:
+            max_id = storage.current().max_reminder_id()
+            self.last_seen_id = max(self.last_seen_id, max_id)
             
-            now = datetime.now(ZoneInfo(Config.TZ))
-            for row in rows:
-                rem_id, user_id, title, sched_iso, lead = row
-                try:
-                    # Преобразуем строку в datetime с часовым поясом
-                    scheduled_dt = datetime.fromisoformat(sched_iso).replace(tzinfo=ZoneInfo(Config.TZ))
-                    
-                    # Проверяем, не прошло ли уже время события
-                    if scheduled_dt <= now:
-                        # Помечаем напоминание как отправленное, если время уже прошло
-                        with get_connection() as con:
-                            con.execute(
-                                "UPDATE reminders SET sent=1 WHERE id=?",
-                                (rem_id,)
-                            )
-                            con.commit()
-                        logger.info(f"Marked past reminder {rem_id} as sent")
+            after = ("", 0)
+            while True:
+                rows = await asyncio.to_thread(
+                    self._fetch_pending_chunk, shards, min_id, after, Config.REMINDER_LOAD_CHUNK
+                )
+                if not rows:
+                    break
+                after = (rows[-1][3], rows[-1][0])
+                
+                now = clock.now()
+                past = []
+                for row in rows:
+                    rem_id, chat_id, title, sched_iso, lead, state, next_attempt_at, claimed_at = row
+                    if f"reminder_{rem_id}" in self.active_jobs:
                         continue
+                    try:
+                        # Преобразуем строку в datetime с часовым поясом
+                        scheduled_dt = datetime.fromisoformat(sched_iso).replace(tzinfo=ZoneInfo(Config.TZ))
+                        
+                        # Отложенный повтор или отправка, прерванная падением процесса
+                        resume_ts = delivery.resume_timestamp(state, next_attempt_at, claimed_at)
+                        if resume_ts is not None:
+                            if now > scheduled_dt + timedelta(seconds=Config.DELIVERY_GRACE_SECONDS):
+                                await asyncio.to_thread(delivery.expire, rem_id)
+                                logger.info("Expired undelivered reminder %s", rem_id, extra=HOT_PATH)
+                                continue
+                            resume_at = datetime.fromtimestamp(resume_ts, ZoneInfo(Config.TZ))
+                            scheduled += await self.schedule_reminder(
+                                rem_id, chat_id, title, scheduled_dt, lead, resume_at=resume_at, check_dead=False
+                            )
+                            continue
                         
-                    await self.schedule_reminder(rem_id, user_id, title, scheduled_dt, lead)
-                except Exception as e:
-                    logger.error(f"Failed to schedule existing reminder {rem_id}: {e}", exc_info=True)
+                        # Проверяем, не прошло ли уже время события
+                        send_at = scheduled_dt - timedelta(minutes=lead)
+                        missed = now - send_at
+                        if scheduled_dt <= now and not (catch_up and missed.total_seconds() < Config.DELIVERY_GRACE_SECONDS):
+                            # Помечаем напоминание как отправленное, если время уже прошло
+                            past.append(rem_id)
+                            continue
+                            
+                        scheduled += await self.schedule_reminder(
+                            rem_id, chat_id, title, scheduled_dt, lead, catch_up=catch_up, check_dead=False
+                        )
+                    except Exception as e:
+                        logger.error("Failed to schedule existing reminder %s: %s", rem_id, e, exc_info=True)
+                
+                if past:
+                    await asyncio.to_thread(self._mark_past_sent, past)
+                    logger.info("Marked %d past reminders as sent", len(past))
+                # Отдаём управление обработчикам обновлений между порциями
+                await asyncio.sleep(0)
         except Exception as e:
-            logger.error(f"Error scheduling existing reminders: {e}", exc_info=True)
+            logger.error("Error scheduling existing reminders: %s", e, exc_info=True)
+        return scheduled
+
+    def load_in_background(self, shards=None, catch_up=False):
+        """Загружает напоминания фоновой задачей, не задерживая приём обновлений"""
+        # Новые напоминания (id больше текущего максимума) подхватит schedule_new_reminders
+        max_id = storage.current().max_reminder_id()
+        self.last_seen_id = max(self.last_seen_id, max_id)
+        
+        async def load():
+            started = time.perf_counter()
+            count = await self.schedule_existing_reminders(shards=shards, catch_up=catch_up)
+            elapsed = time.perf_counter() - started
+            metrics.set_gauge("startup.reminders_load", elapsed)
+            logger.info("Loaded %d reminders in %.2fs", count, elapsed)
+        
+        task = asyncio.create_task(load())
+        self.loading_tasks.add(task)
+        task.add_done_callback(self.loading_tasks.discard)
+        return task
+
+    async def schedule_new_reminders(self):
+        """Подхватывает напоминания, созданные другими процессами после последней проверки"""
+        shards = self.coordinator.owned if self.coordinator else None
+        if shards is not None and not shards:
+            return
+        await self.schedule_existing_reminders(shards=shards, min_id=self.last_seen_id)
+
+    async def drain(self, timeout):
+        """Останавливает запуск новых отправок и ждёт текущие не дольше timeout секунд.
+
+        Отправки, не успевшие завершиться, отменяются, а их напоминания переводятся
+        в retrying, чтобы следующий запуск повторил их сразу. Возвращает True, если
+        все отправки завершились сами.
+        """
+        self.draining = True
+        if self.scheduler.running:
+            self.scheduler.pause()
+        for task in list(self.loading_tasks):
+            task.cancel()
+        
+        pending = {task for task in self.in_flight if not task.done()}
+        if pending:
+            logger.info("Draining %d in-flight deliveries", len(pending))
+            _, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        
+        checkpointed = await asyncio.to_thread(delivery.checkpoint_in_flight, Config.INSTANCE_ID)
+        if pending or checkpointed:
+            logger.warning(
+                "Drain deadline hit: cancelled %d deliveries, checkpointed %d reminders",
+                len(pending), checkpointed
+            )
+        return not pending and not checkpointed
+
+    def unschedule_all(self):
+        """Снимает все задачи напоминаний, когда экземпляр перестаёт их доставлять"""
+        for job_id in list(self.active_jobs):
+            try:
+                self.scheduler.remove_job(job_id)
+            except Exception:
+                pass
+        self.active_jobs.clear()
+        self.job_chats.clear()
+
+    def unschedule_shards(self, shards, shard_count):
+        """Снимает задачи напоминаний, шарды которых больше не принадлежат процессу"""
+        for job_id, chat_id in list(self.job_chats.items()):
+            if abs(chat_id) % shard_count in shards:
+                try:
+                    self.scheduler.remove_job(job_id)
+                except Exception:
+                    pass
+                self.active_jobs.pop(job_id, None)
+                self.job_chats.pop(job_id, None)
 
     def rollover_pending_tasks(self):
+        """Переносит невыполненные задачи прошедших дней на наступивший день.
+
+        Запускается сразу после полуночи, поэтому переносит на сегодня: задачи, отложенные
+        на сегодня заранее, остаются на месте.
+        """
         logger.info("Running daily rollover")
         try:
-            today = datetime.now(ZoneInfo(Config.TZ)).date()
-            tomorrow = today + timedelta(days=1)
+            today = clock.now().date()
+            yesterday = today - timedelta(days=1)
             
-            # Обновляем только задачи без исходной даты
-            with get_connection() as con:
-                # Для задач, у которых original_day_iso не установлен (старые задачи) устанавливаем original_day_iso = day_iso
-                con.execute(
-                    "UPDATE tasks SET original_day_iso = day_iso WHERE original_day_iso = '' AND status='pending'"
-                )
-                con.commit()
-
-                # Теперь обновляем day_iso на завтра для всех невыполненных задач на сегодня
-                con.execute(
-                    "UPDATE tasks SET day_iso=? WHERE day_iso=? AND status='pending'",
-                    (tomorrow.isoformat(), today.isoformat())
-                )
-                con.commit()
+            storage.current().rollover(yesterday.isoformat(), today.isoformat())
             
-            logger.info(f"Rolled over tasks from {today} to {tomorrow}")
+            logger.info("Rolled over tasks from %s and earlier to %s", yesterday, today)
         except Exception as e:
-            logger.error(f"Error in task rollover: {e}", exc_info=True)
+            logger.error("Error in task rollover: %s", e, exc_info=True)
 
     def rollover_all_pending_tasks(self):
         """Переносит все невыполненные задачи на следующий день"""
         logger.info("Running complete task rollover")
         try:
-            today = datetime.now(ZoneInfo(Config.TZ)).date()
+            today = clock.now().date()
             tomorrow = today + timedelta(days=1)
             
-            with get_connection() as con:
-                # Устанавливаем original_day_iso для задач, у которых его нет
-                con.execute(
-                    "UPDATE tasks SET original_day_iso = day_iso WHERE original_day_iso = '' AND status='pending'"
-                )
-                con.commit()
-                
-                # Переносим все невыполненные задачи на сегодняшний день на завтра
-                con.execute(
-                    "UPDATE tasks SET day_iso=? WHERE day_iso<=? AND status='pending'",
-                    (tomorrow.isoformat(), today.isoformat())
-                )
-                con.commit()
+            # Переносим все невыполненные задачи на сегодняшний день и ранее на завтра
+            storage.current().rollover(today.isoformat(), tomorrow.isoformat())
             
-            logger.info(f"Rolled over all pending tasks to {tomorrow}")
+            logger.info("Rolled over all pending tasks to %s", tomorrow)
         except Exception as e:
-            logger.error(f"Error in complete task rollover: {e}", exc_info=True)
\ No newline at end of file
+            logger.error("Error in complete task rollover: %s", e, exc_info=True)
\ No newline at end of file
@@ -0,0 +1,96 @@
+# sharding.py
+import math
+import asyncio
+import logging
+from config import Config
+from database import get_connection
+import clock
+import leases
+
+logger = logging.getLogger(__name__)
+
+def shard_of(chat_id, shard_count):
+    """Шард напоминания; то же выражение используется в SQL: abs(chat_id) % shard_count"""
+    return abs(chat_id) % shard_count
+
+def shard_lease_name(shard):
+    return f"shard:{shard}"
+
+class ShardCoordinator:
+    """Распределяет шарды напоминаний между процессами через аренды в общей базе.
+
+    Каждый процесс раз в Config.SHARD_HEARTBEAT_SECONDS продлевает свои аренды,
+    забирает свободные или просроченные шарды до справедливой доли и отдаёт лишние,
+    когда появляются новые процессы. Шард умершего процесса освобождается через
+    Config.SHARD_LEASE_TTL секунд.
+    """
+
+    def __init__(self, scheduler_manager, owner, shard_count):
+        self.scheduler_manager = scheduler_manager
+        self.owner = owner
+        self.shard_count = shard_count
+        self.ttl = Config.SHARD_LEASE_TTL
+        self.owned = set()
+
+    def owns(self, chat_id):
+        return shard_of(chat_id, self.shard_count) in self.owned
+
+    def lease_name_for(self, chat_id):
+        return shard_lease_name(shard_of(chat_id, self.shard_count))
+
+    def _heartbeat_sync(self):
+        now = clock.timestamp()
+        acquired, lost = set(), set()
+        with get_connection() as con:
+            leases.try_acquire(con, f"worker:{self.owner}", self.owner, self.ttl, now)
+            workers = leases.live_owners(con, "worker:", now) | {self.owner}
+            fair_share = math.ceil(self.shard_count / len(workers))
+
+            for shard in sorted(self.owned):
+                if not leases.try_acquire(con, shard_lease_name(shard), self.owner, self.ttl, now):
+                    lost.add(shard)
+            held = self.owned - lost
+
+            # Отдаём лишние шарды, чтобы новые процессы получили свою долю
+            for shard in sorted(held, reverse=True)[:max(len(held) - fair_share, 0)]:
+                leases.release(con, shard_lease_name(shard), self.owner)
+                lost.add(shard)
+            held = self.owned - lost
+
+            for shard in range(self.shard_count):
+                if len(held) >= fair_share:
+                    break
+                if shard in held:
+                    continue
+                if leases.try_acquire(con, shard_lease_name(shard), self.owner, self.ttl, now):
+                    held.add(shard)
+                    acquired.add(shard)
+            con.commit()
+
+        self.owned = held
+        return acquired, lost
+
+    async def heartbeat(self):
+        """Продлевает аренды и подхватывает напоминания новых и полученных шардов"""
+        try:
+            acquired, lost = await asyncio.to_thread(self._heartbeat_sync)
+        except Exception as e:
+            logger.error("Shard heartbeat failed: %s", e, exc_info=True)
+            return
+
+        if lost:
+            logger.info("Worker %s released shards %s", self.owner, sorted(lost))
+            self.scheduler_manager.unschedule_shards(lost, self.shard_count)
+        if acquired:
+            logger.info("Worker %s acquired shards %s", self.owner, sorted(acquired))
+            self.scheduler_manager.load_in_background(shards=acquired, catch_up=True)
+        await self.scheduler_manager.schedule_new_reminders()
+
+    def release_all(self):
+        """Освобождает аренды при штатной остановке, чтобы шарды сразу перешли другим"""
+        with get_connection() as con:
+            for shard in self.owned:
+                leases.release(con, shard_lease_name(shard), self.owner)
+            leases.release(con, f"worker:{self.owner}", self.owner)
+            con.commit()
+        self.owned = set()
@@ -0,0 +1,278 @@
+# simulation.py
+"""
+Прогон планировщика по виртуальному времени.
+
+SchedulerManager работает как обычно, но вместо AsyncIOScheduler задачи хранит
+VirtualScheduler, а часы (clock.py) переводятся сразу к следующему событию.
+Неделя напоминаний и несколько ночных переносов проходят за секунды, после чего
+проверяются порядок доставки, опоздания и перенос задач.
+
+    python simulation.py                                   # через базу и delivery.claim
+    python simulation.py --failure-rate 0.05               # с ошибками сети и повторами
+    python simulation.py --fast --reminders 2000000 --days 7  # только планирование, без базы
+
+В режиме --fast доставка не трогает базу: проверяется расписание на больших объёмах.
+"""
+import os
+import re
+import sys
+import heapq
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.triggers.date import DateTrigger
+from telegram.error import NetworkError
+from config import Config
+from database import init_db, get_connection
+from scheduler import SchedulerManager
+import clock
+
+LEADS = (0, 5, 10, 30, 60)
+TITLE_RE = re.compile(r"Напоминание: sim-(\d+)")
+
+class VirtualScheduler:
+    """Замена AsyncIOScheduler для SchedulerManager: разовые задачи в куче по времени запуска"""
+
+    def __init__(self, virtual_clock):
+        self.clock = virtual_clock
+        self.running = False
+        self.paused = False
+        self._heap = []
+        self._jobs = {}
+        self._seq = 0
+
+    def start(self):
+        self.running = True
+
+    def pause(self):
+        self.paused = True
+
+    def shutdown(self, wait=False):
+        self.running = False
+
+    def add_job(self, func, trigger=None, id=None, args=(), replace_existing=False, run_date=None, **kwargs):
+        run_at = trigger.run_date if isinstance(trigger, DateTrigger) else run_date
+        if run_at is None:
+            raise ValueError("VirtualScheduler supports only one-off jobs")
+        if id in self._jobs:
+            if not replace_existing:
+                raise ValueError(f"Job {id} already exists")
+            self._jobs.pop(id)[3] = None
+        self._seq += 1
+        # Ключ кучи — число: сравнение datetime с часовым поясом заметно медленнее
+        entry = [run_at.timestamp(), self._seq, id, func, tuple(args), run_at]
+        if id is not None:
+            self._jobs[id] = entry
+        heapq.heappush(self._heap, entry)
+        return entry
+
+    def remove_job(self, job_id):
+        entry = self._jobs.pop(job_id, None)
+        if entry is None:
+            raise JobLookupError(job_id)
+        # Запись остаётся в куче и пропускается при извлечении
+        entry[3] = None
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    @property
+    def pending(self):
+        return len(self._jobs)
+
+    async def run_until(self, moment):
+        """Выполняет задачи со временем запуска не позже moment в порядке времени"""
+        limit = moment.timestamp()
+        while self._heap and self._heap[0][0] <= limit and not self.paused:
+            entry = heapq.heappop(self._heap)
+            _, _, job_id, func, args, run_at = entry
+            if func is None:
+                continue
+            if self._jobs.get(job_id) is entry:
+                del self._jobs[job_id]
+            self.clock.advance_to(run_at)
+            await func(*args)
+        self.clock.advance_to(moment)
+
+class FakeBot:
+    """Запоминает отправленные напоминания; failure_rate — доля отправок с ошибкой сети"""
+
+    def __init__(self, failure_rate, rng):
+        self.failure_rate = failure_rate
+        self.rng = rng
+        self.delivered = []
+        self.failures = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise NetworkError("simulated network error")
+        self.delivered.append((int(TITLE_RE.search(text).group(1)), clock.timestamp()))
+
+class FastManager(SchedulerManager):
+    """Доставка без базы: проверяется только расписание"""
+
+    def __init__(self, app, scheduler):
+        super().__init__(app, scheduler=scheduler)
+        self.delivered = []
+
+    async def deliver_reminder(self, reminder_id, user_id, title, scheduled_dt_local, lead_minutes):
+        self.delivered.append((reminder_id, clock.timestamp()))
+        return None
+
+def generate(count, start, days, users, rng):
+    """Напоминания, равномерно распределённые по days суткам: [(id, user_id, время события, упреждение)]"""
+    minutes = days * 1440
+    for reminder_id in range(1, count + 1):
+        scheduled = start + timedelta(minutes=60 + int(rng.random() * (minutes - 60)))
+        yield reminder_id, 1 + int(rng.random() * users), scheduled, LEADS[int(rng.random() * len(LEADS))]
+
+def seed_database(reminders, start, days, users, rng):
+    with get_connection() as con:
+        con.executemany(
+            "INSERT INTO reminders (id, user_id, title, scheduled_iso, lead_minutes, created_iso) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(rid, uid, f"sim-{rid}", scheduled.isoformat(), lead, start.isoformat())
+             for rid, uid, scheduled, lead in reminders]
+        )
+        # По несколько невыполненных задач на каждый день для проверки переноса
+        con.executemany(
+            "INSERT INTO tasks (user_id, description, day_iso, created_iso, original_day_iso) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(rng.randint(1, users), f"task {day}-{i}", (start + timedelta(days=day)).date().isoformat(),
+              start.isoformat(), (start + timedelta(days=day)).date().isoformat())
+             for day in range(days) for i in range(20)]
+        )
+        con.commit()
+
+def check_rollover(day):
+    """После переноса в полночь невыполненных задач за прошедшие дни не остаётся"""
+    with get_connection() as con:
+        stale = con.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status='pending' AND day_iso<?", (day.isoformat(),)
+        ).fetchone()[0]
+    assert stale == 0, f"{stale} pending tasks left before {day} after rollover"
+
+def check_deliveries(expected, delivered, failures):
+    """Каждое напоминание доставлено один раз, в порядке времени и без лишнего опоздания"""
+    seen = set()
+    lateness = []
+    previous = 0.0
+    for reminder_id, delivered_at in delivered:
+        assert reminder_id not in seen, f"reminder {reminder_id} delivered twice"
+        seen.add(reminder_id)
+        # Без повторов напоминания уходят строго по возрастанию времени отправки
+        if not failures:
+            assert expected[reminder_id] >= previous, f"reminder {reminder_id} delivered out of order"
+            previous = expected[reminder_id]
+        late = delivered_at - expected[reminder_id]
+        assert late >= 0, f"reminder {reminder_id} delivered {-late:.0f}s early"
+        # Без ошибок опоздания нет; повторы укладываются в окно опоздания
+        limit = Config.DELIVERY_GRACE_SECONDS if failures else 0
+        assert late <= limit, f"reminder {reminder_id} delivered {late:.0f}s late"
+        lateness.append(late)
+    return seen, lateness
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    # Разброс задержек повтора в delivery.backoff тоже воспроизводим
+    random.seed(args.seed)
+    tz = ZoneInfo(Config.TZ)
+    start = datetime(2030, 1, 7, 0, 30, tzinfo=tz)
+    virtual = clock.VirtualClock(start)
+    previous_clock = clock.install(virtual)
+    scheduler = VirtualScheduler(virtual)
+    bot = FakeBot(args.failure_rate, rng)
+    app = SimpleNamespace(bot=bot)
+
+    try:
+        with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as tmp:
+            Config.DB_PATH = os.path.join(tmp, "simulation.db")
+            init_db()
+            reminders = list(generate(args.reminders, start, args.days, args.users, rng))
+            expected = {
+                rid: (scheduled - timedelta(minutes=lead)).timestamp()
+                for rid, _, scheduled, lead in reminders
+            }
+            wall = time.perf_counter()
+
+            if args.fast:
+                manager = FastManager(app, scheduler)
+                seed_database([], start, args.days, args.users, rng)
+                for rid, uid, scheduled, lead in reminders:
+                    await manager.schedule_reminder(rid, uid, f"sim-{rid}", scheduled, lead, check_dead=False)
+            else:
+                manager = SchedulerManager(app, scheduler=scheduler)
+                seed_database(reminders, start, args.days, args.users, rng)
+                await manager.schedule_existing_reminders()
+            del reminders
+            await manager.start_scheduler()
+            scheduled_in = time.perf_counter() - wall
+
+            # Напоминания, чьё время отправки уже прошло к началу, не отправляются
+            expected = {rid: ts for rid, ts in expected.items() if ts > start.timestamp()}
+            assert scheduler.pending == len(expected), \
+                f"{scheduler.pending} jobs scheduled, expected {len(expected)}"
+
+            # Сутки за сутками: задачи до полуночи, затем ночной перенос
+            for day in range(1, args.days + 2):
+                midnight = datetime.combine((start + timedelta(days=day)).date(), datetime.min.time(), tz)
+                await scheduler.run_until(midnight)
+                manager.rollover_pending_tasks()
+                check_rollover(midnight.date())
+            await scheduler.run_until(midnight + timedelta(hours=1))
+            elapsed = time.perf_counter() - wall
+
+            delivered = manager.delivered if args.fast else bot.delivered
+            seen, lateness = check_deliveries(expected, delivered, bot.failures)
+            if args.fast or not bot.failures:
+                missing = set(expected) - seen
+                assert not missing, f"{len(missing)} reminders never delivered, e.g. {sorted(missing)[:5]}"
+            else:
+                # С ошибками часть напоминаний может исчерпать попытки: они должны стать dead
+                with get_connection() as con:
+                    dead = con.execute(
+                        "SELECT COUNT(*) FROM reminders WHERE delivery_state='dead'"
+                    ).fetchone()[0]
+                assert len(seen) + dead == len(expected), \
+                    f"{len(expected) - len(seen) - dead} reminders lost (delivered {len(seen)}, dead {dead})"
+
+            lateness.sort()
+            p99 = lateness[int(len(lateness) * 0.99)] if lateness else 0.0
+            print(
+                f"{'fast' if args.fast else 'full'}: {len(seen)} reminders over {args.days} days, "
+                f"{args.days + 1} rollovers, {bot.failures} send failures\n"
+                f"scheduled in {scheduled_in:.2f}s, simulated in {elapsed:.2f}s wall time; "
+                f"lateness p99 {p99:.0f}s, max {lateness[-1] if lateness else 0:.0f}s"
+            )
+    finally:
+        clock.install(previous_clock)
+
+def main():
+    parser = argparse.ArgumentParser(description="Прогон планировщика по виртуальному времени")
+    parser.add_argument("--reminders", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fast", action="store_true", help="без базы: только расписание")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Ожидаемые предупреждения о повторах не нужны в выводе прогона
+    logging.getLogger("scheduler").setLevel(logging.CRITICAL)
+    try:
+        asyncio.run(simulate(args))
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
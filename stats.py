@@ -0,0 +1,136 @@
+# stats.py
+import os
+import logging
+from datetime import timedelta
+from telegram import Update
+from telegram.ext import ContextTypes
+from config import Config
+from database import get_connection
+from utils import user_now
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Метрика -> (значок, подпись) в отчёте
+DAILY_METRICS = {
+    "active_users": ("👤", "активные пользователи"),
+    "reminders_sent": ("⏰", "отправлено напоминаний"),
+    "reminders_dead": ("🚫", "недоставлено напоминаний"),
+    "tasks_created": ("➕", "создано задач"),
+    "tasks_completed": ("✅", "выполнено задач"),
+    "tasks_rolled_over": ("🔁", "перенесено задач"),
+}
+
+# Пользователи, уже учтённые сегодня, чтобы не писать в базу на каждое обновление
+_seen_today = {"day": None, "users": set()}
+
+def bump_daily(con, day_iso, metric, delta=1):
+    """Увеличивает дневной счётчик в рамках переданного соединения"""
+    con.execute(
+        "INSERT INTO stats_daily (day_iso, metric, value) VALUES (?, ?, ?) "
+        "ON CONFLICT (day_iso, metric) DO UPDATE SET value = value + excluded.value",
+        (day_iso, metric, delta)
+    )
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Учитывает активного пользователя за день; вызывается до остальных обработчиков"""
+    user = update.effective_user
+    if not user:
+        return
+
+    day_iso = user_now().date().isoformat()
+    if _seen_today["day"] != day_iso:
+        _seen_today["day"] = day_iso
+        _seen_today["users"] = set()
+    if user.id in _seen_today["users"]:
+        return
+    _seen_today["users"].add(user.id)
+
+    try:
+        with get_connection() as con:
+            cur = con.execute(
+                "INSERT OR IGNORE INTO stats_active_users (day_iso, user_id) VALUES (?, ?)",
+                (day_iso, user.id)
+            )
+            if cur.rowcount:
+                bump_daily(con, day_iso, "active_users")
+            con.commit()
+    except Exception as e:
+        logger.error(f"Failed to track activity: {e}")
+
+def get_counters():
+    with get_connection() as con:
+        return dict(con.execute("SELECT name, value FROM stats_counters").fetchall())
+
+def _archived_count_sql(con, table):
+    """Подзапрос числа строк table в архиве, ещё не удалённых из основной базы переносом"""
+    exists = con.execute(
+        "SELECT 1 FROM archive.sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()
+    if not exists:
+        return "0"
+    return f"(SELECT COUNT(*) FROM archive.{table} WHERE id NOT IN (SELECT id FROM main.{table}))"
+
+def recount_counters():
+    """Пересчитывает счётчики по таблицам: сверка после аварийной остановки.
+
+    Итоги считаются вместе с архивом: перенос удаляет строки из основной базы,
+    не уменьшая счётчиков, которые их уже учли.
+    """
+    with get_connection() as con:
+        archived_reminders = archived_tasks = "0"
+        if os.path.exists(Config.ARCHIVE_DB_PATH):
+            con.execute("ATTACH DATABASE ? AS archive", (Config.ARCHIVE_DB_PATH,))
+            archived_reminders = _archived_count_sql(con, "reminders")
+            archived_tasks = _archived_count_sql(con, "tasks")
+        con.execute(f"""
+            INSERT OR REPLACE INTO stats_counters (name, value)
+            SELECT 'reminders_total', COUNT(*) + {archived_reminders} FROM reminders
+            UNION ALL SELECT 'reminders_active', COUNT(*) FROM reminders
+                WHERE sent=0 AND delivery_state <> 'dead'
+            UNION ALL SELECT 'tasks_total', COUNT(*) + {archived_tasks} FROM tasks
+        """)
+        con.commit()
+
+def get_daily_series(days):
+    """Дневные счётчики за последние days дней: {day_iso: {metric: value}}"""
+    since = (user_now().date() - timedelta(days=days - 1)).isoformat()
+    series = {}
+    with get_connection() as con:
+        rows = con.execute(
+            "SELECT day_iso, metric, value FROM stats_daily WHERE day_iso >= ? ORDER BY day_iso",
+            (since,)
+        ).fetchall()
+    for day_iso, metric, value in rows:
+        series.setdefault(day_iso, {})[metric] = value
+    return series
+
+def format_report(days):
+    counters = get_counters()
+    lines = [
+        "📊 Статистика бота:\n",
+        f"⏰ Напоминаний: {counters.get('reminders_total', 0)} "
+        f"(активных: {counters.get('reminders_active', 0)})",
+        f"✅ Задач: {counters.get('tasks_total', 0)}",
+        "",
+        f"📈 За последние {days} дн.:",
+    ]
+    lines.extend(f"{emoji} — {label}" for emoji, label in DAILY_METRICS.values())
+    lines.append("")
+
+    series = get_daily_series(days)
+    today = user_now().date()
+    for offset in range(days - 1, -1, -1):
+        day_iso = (today - timedelta(days=offset)).isoformat()
+        values = series.get(day_iso, {})
+        lines.append(
+            f"{day_iso[5:]}: " + " ".join(
+                f"{emoji}{values.get(metric, 0)}" for metric, (emoji, _) in DAILY_METRICS.items()
+            )
+        )
+    runtime = metrics.format_metrics()
+    if runtime:
+        lines.append("")
+        lines.append("⚙️ Метрики процесса:")
+        lines.append(runtime)
+    return "\n".join(lines)
@@ -0,0 +1,574 @@
+# storage.py
+"""
+Хранилище напоминаний, задач, пользователей и участников групп за одним интерфейсом.
+
+Задачи и напоминания принадлежат чату (chat_id): в личном чате он совпадает с
+пользователем, в группе список общий для всех участников. user_id — автор.
+
+SQLiteStorage — рабочая реализация поверх Config.DB_PATH, запросы собраны здесь,
+а не в обработчиках. MemoryStorage держит данные в словарях с индексами по
+чату и дню — для замеров и проверок без диска. Групповая запись задач
+и переключение статуса идут через writer.py и в интерфейс не входят.
+
+Проверка обеих реализаций на одних сценариях и замер: python storage.py
+"""
+import bisect
+import itertools
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from database import get_connection
+import history
+import stats
+
+class Storage(ABC):
+    # Напоминания
+
+    @abstractmethod
+    def add_reminder(self, user_id, title, scheduled_iso, lead_minutes, created_iso, chat_id=None, assignees=()):
+        """Сохраняет напоминание в чат chat_id (по умолчанию личный) с исполнителями; возвращает его id"""
+
+    @abstractmethod
+    def upcoming_reminders(self, chat_id, after_iso):
+        """Неотправленные напоминания чата позже after_iso: [(title, scheduled_iso, lead_minutes)]"""
+
+    @abstractmethod
+    def reminder_assignees(self, reminder_id):
+        """Исполнители напоминания для упоминания: [(user_id, first_name, username)] по user_id"""
+
+    @abstractmethod
+    def pending_reminders_page(self, after, limit, shards=None, shard_count=1):
+        """Порция неотправленных напоминаний по (scheduled_iso, id) после after.
+
+        Строки: (id, chat_id, title, scheduled_iso, lead_minutes, delivery_state,
+        next_attempt_at, claimed_at); chat_id — куда отправлять. Пропускаются мёртвые
+        напоминания и недоступные чаты; shards ограничивает выборку шардами
+        abs(chat_id) % shard_count.
+        """
+
+    @abstractmethod
+    def new_reminders_page(self, min_id, limit, shards=None, shard_count=1):
+        """Порция неотправленных напоминаний с id больше min_id по возрастанию id.
+
+        Строки и отбор — как в pending_reminders_page. Для подхвата новых напоминаний:
+        выборка не зависит от числа уже запланированных.
+        """
+
+    @abstractmethod
+    def mark_sent_many(self, reminder_ids):
+        """Отмечает напоминания отправленными одной транзакцией; возвращает число изменённых"""
+
+    @abstractmethod
+    def max_reminder_id(self):
+        """Наибольший id напоминания или 0"""
+
+    # Задачи
+
+    @abstractmethod
+    def add_task(self, user_id, description, day_iso, created_iso, chat_id=None):
+        """Сохраняет задачу на день в чат chat_id (по умолчанию личный); возвращает её id"""
+
+    @abstractmethod
+    def get_today_tasks(self, chat_id, day_iso):
+        """Задачи чата на день: [(id, description, status, original_day_iso)],
+        перенесённые с прошлых дней первыми"""
+
+    @abstractmethod
+    def rollover(self, through_day_iso, to_day_iso):
+        """Переносит невыполненные задачи с дней не позже through_day_iso на to_day_iso;
+        возвращает число перенесённых"""
+
+    # Пользователи
+
+    @abstractmethod
+    def count_users(self):
+        """Число пользователей с напоминаниями или задачами"""
+
+    @abstractmethod
+    def users_page(self, after_user_id, limit):
+        """Следующие пользователи по возрастанию id: [(user_id, чат недоступен)]"""
+
+    # Участники групп
+
+    @abstractmethod
+    def save_member(self, chat_id, user_id, username, first_name, joined_iso):
+        """Добавляет участника группы или обновляет его имя; username — без @"""
+
+    @abstractmethod
+    def remove_member(self, chat_id, user_id):
+        """Убирает участника, покинувшего группу"""
+
+    @abstractmethod
+    def members_by_username(self, chat_id, usernames):
+        """Участники группы по @username без учёта регистра: {username в нижнем регистре: user_id}"""
+
+class SQLiteStorage(Storage):
+    # Получатели выбираются страницами по возрастанию user_id (keyset).
+    # LIMIT внутри каждой ветки позволяет SQLite пройти только начало индексов.
+    USERS_PAGE_SQL = """
+        SELECT u.user_id, d.chat_id IS NOT NULL FROM (
+            SELECT user_id FROM (
+                SELECT DISTINCT user_id FROM reminders WHERE user_id > :after ORDER BY user_id LIMIT :limit
+            )
+            UNION
+            SELECT user_id FROM (
+                SELECT DISTINCT user_id FROM tasks WHERE user_id > :after ORDER BY user_id LIMIT :limit
+            )
+            ORDER BY user_id LIMIT :limit
+        ) u
+        LEFT JOIN dead_letters d ON d.chat_id = u.user_id
+        ORDER BY u.user_id
+    """
+
+    def add_reminder(self, user_id, title, scheduled_iso, lead_minutes, created_iso, chat_id=None, assignees=()):
+        with get_connection() as con:
+            cur = con.execute(
+                "INSERT INTO reminders (user_id, chat_id, title, scheduled_iso, lead_minutes, created_iso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, user_id if chat_id is None else chat_id, title, scheduled_iso, lead_minutes, created_iso)
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO reminder_assignees (reminder_id, user_id) VALUES (?, ?)",
+                [(cur.lastrowid, assignee) for assignee in assignees]
+            )
+            con.commit()
+            return cur.lastrowid
+
+    def upcoming_reminders(self, chat_id, after_iso):
+        with get_connection() as con:
+            return con.execute("""
+                SELECT title, scheduled_iso, lead_minutes
+                FROM reminders
+                WHERE chat_id=? AND sent=0 AND scheduled_iso > ?
+                ORDER BY scheduled_iso
+            """, (chat_id, after_iso)).fetchall()
+
+    def reminder_assignees(self, reminder_id):
+        with get_connection() as con:
+            return con.execute("""
+                SELECT a.user_id, COALESCE(m.first_name, ''), m.username
+                FROM reminder_assignees a
+                JOIN reminders r ON r.id = a.reminder_id
+                LEFT JOIN chat_members m ON m.chat_id = r.chat_id AND m.user_id = a.user_id
+                WHERE a.reminder_id=?
+                ORDER BY a.user_id
+            """, (reminder_id,)).fetchall()
+
+    def _pending_page(self, condition, params, order, limit, shards, shard_count):
+        sql = (
+            "SELECT id, chat_id, title, scheduled_iso, lead_minutes, "
+            "delivery_state, next_attempt_at, claimed_at "
+            "FROM reminders WHERE sent=0 AND delivery_state <> 'dead' "
+            f"AND chat_id NOT IN (SELECT chat_id FROM dead_letters) AND {condition}"
+        )
+        params = list(params)
+        if shards is not None:
+            sql += f" AND abs(chat_id) % ? IN ({','.join('?' * len(shards))})"
+            params += [shard_count, *sorted(shards)]
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(limit)
+
+        with get_connection() as con:
+            return con.execute(sql, params).fetchall()
+
+    def pending_reminders_page(self, after, limit, shards=None, shard_count=1):
+        # Индекс (sent, scheduled_iso, id)
+        return self._pending_page("(scheduled_iso, id) > (?, ?)", after, "scheduled_iso, id",
+                                  limit, shards, shard_count)
+
+    def new_reminders_page(self, min_id, limit, shards=None, shard_count=1):
+        # Индекс (sent, id): поиск начинается сразу с min_id
+        return self._pending_page("id > ?", (min_id,), "id", limit, shards, shard_count)
+
+    def mark_sent_many(self, reminder_ids):
+        with get_connection() as con:
+            cur = con.executemany(
+                "UPDATE reminders SET sent=1 WHERE id=? AND sent=0", [(i,) for i in reminder_ids]
+            )
+            con.commit()
+            return cur.rowcount
+
+    def max_reminder_id(self):
+        with get_connection() as con:
+            return con.execute("SELECT COALESCE(MAX(id), 0) FROM reminders").fetchone()[0]
+
+    def add_task(self, user_id, description, day_iso, created_iso, chat_id=None):
+        with get_connection() as con:
+            cur = con.execute(
+                "INSERT INTO tasks (user_id, chat_id, description, day_iso, created_iso, original_day_iso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, user_id if chat_id is None else chat_id, description, day_iso, created_iso, day_iso)
+            )
+            con.commit()
+            return cur.lastrowid
+
+    def get_today_tasks(self, chat_id, day_iso):
+        with get_connection() as con:
+            return con.execute("""
+                SELECT id, description, status, original_day_iso
+                FROM tasks
+                WHERE chat_id=? AND day_iso=?
+                ORDER BY
+                    CASE WHEN original_day_iso < ? THEN 0 ELSE 1 END,
+                    original_day_iso ASC, id ASC
+            """, (chat_id, day_iso, day_iso)).fetchall()
+
+    def rollover(self, through_day_iso, to_day_iso):
+        condition = "day_iso<=? AND status='pending'"
+        with get_connection() as con:
+            # Для задач, у которых original_day_iso не установлен (старые задачи)
+            con.execute(
+                "UPDATE tasks SET original_day_iso = day_iso WHERE original_day_iso = '' AND status='pending'"
+            )
+            # Учитываем перенос в дневных сводках пользователей
+            history.record_rollover(con, condition, (through_day_iso,))
+            cur = con.execute(f"UPDATE tasks SET day_iso=? WHERE {condition}", (to_day_iso, through_day_iso))
+            stats.bump_daily(con, through_day_iso, "tasks_rolled_over", cur.rowcount)
+            con.commit()
+            return cur.rowcount
+
+    def count_users(self):
+        with get_connection() as con:
+            return con.execute(
+                "SELECT COUNT(*) FROM (SELECT user_id FROM reminders UNION SELECT user_id FROM tasks)"
+            ).fetchone()[0]
+
+    def users_page(self, after_user_id, limit):
+        with get_connection() as con:
+            return con.execute(self.USERS_PAGE_SQL, {"after": after_user_id, "limit": limit}).fetchall()
+
+    def save_member(self, chat_id, user_id, username, first_name, joined_iso):
+        with get_connection() as con:
+            con.execute("""
+                INSERT INTO chat_members (chat_id, user_id, username, first_name, joined_iso)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chat_id, user_id) DO UPDATE SET
+                    username = excluded.username, first_name = excluded.first_name
+            """, (chat_id, user_id, username.lower() if username else None, first_name or "", joined_iso))
+            con.commit()
+
+    def remove_member(self, chat_id, user_id):
+        with get_connection() as con:
+            con.execute("DELETE FROM chat_members WHERE chat_id=? AND user_id=?", (chat_id, user_id))
+            con.commit()
+
+    def members_by_username(self, chat_id, usernames):
+        names = sorted({name.lower() for name in usernames})
+        if not names:
+            return {}
+        with get_connection() as con:
+            return dict(con.execute(
+                f"SELECT username, user_id FROM chat_members "
+                f"WHERE chat_id=? AND username IN ({','.join('?' * len(names))})",
+                (chat_id, *names)
+            ).fetchall())
+
+class MemoryStorage(Storage):
+    """Хранилище в памяти процесса.
+
+    Индексы: задачи по (chat_id, day_iso) и невыполненные по дню — для выборки дня
+    и переноса; напоминания по чату и общий отсортированный список неотправленных —
+    для загрузки планировщиком. dead_chats играет роль dead_letters.
+    """
+
+    def __init__(self):
+        self._reminder_ids = itertools.count(1)
+        self._task_ids = itertools.count(1)
+        # id -> [chat_id, title, scheduled_iso, lead_minutes, sent, delivery_state, next_attempt_at, claimed_at]
+        self.reminders = {}
+        # chat_id -> отсортированный список (scheduled_iso, id) неотправленных
+        self._chat_reminders = defaultdict(list)
+        # id напоминания -> отсортированные id исполнителей
+        self._assignees = {}
+        # Отсортированный список (scheduled_iso, id) всех неотправленных
+        self._pending = []
+        # id -> [chat_id, description, day_iso, status, original_day_iso]
+        self.tasks = {}
+        # (chat_id, day_iso) -> id задач в порядке добавления
+        self._day_tasks = defaultdict(list)
+        # day_iso -> id невыполненных задач
+        self._pending_by_day = defaultdict(set)
+        self._users = set()
+        # chat_id -> {user_id: (username, first_name)}
+        self._members = defaultdict(dict)
+        self.dead_chats = set()
+
+    def add_reminder(self, user_id, title, scheduled_iso, lead_minutes, created_iso, chat_id=None, assignees=()):
+        reminder_id = next(self._reminder_ids)
+        chat_id = user_id if chat_id is None else chat_id
+        self.reminders[reminder_id] = [chat_id, title, scheduled_iso, lead_minutes, 0, "pending", None, None]
+        key = (scheduled_iso, reminder_id)
+        bisect.insort(self._chat_reminders[chat_id], key)
+        bisect.insort(self._pending, key)
+        if assignees:
+            self._assignees[reminder_id] = sorted(set(assignees))
+        self._users.add(user_id)
+        return reminder_id
+
+    def upcoming_reminders(self, chat_id, after_iso):
+        keys = self._chat_reminders.get(chat_id, ())
+        start = bisect.bisect_right(keys, (after_iso, float("inf")))
+        result = []
+        for _, reminder_id in keys[start:]:
+            _, title, scheduled_iso, lead_minutes, *_ = self.reminders[reminder_id]
+            result.append((title, scheduled_iso, lead_minutes))
+        return result
+
+    def reminder_assignees(self, reminder_id):
+        chat_id = self.reminders[reminder_id][0] if reminder_id in self.reminders else None
+        result = []
+        for user_id in self._assignees.get(reminder_id, ()):
+            username, first_name = self._members[chat_id].get(user_id, (None, ""))
+            result.append((user_id, first_name, username))
+        return result
+
+    def _pending_page(self, reminder_ids, limit, shards, shard_count):
+        page = []
+        for reminder_id in reminder_ids:
+            chat_id, title, scheduled_iso, lead_minutes, sent, state, next_attempt_at, claimed_at = \
+                self.reminders[reminder_id]
+            if sent or state == "dead" or chat_id in self.dead_chats:
+                continue
+            if shards is not None and abs(chat_id) % shard_count not in shards:
+                continue
+            page.append((reminder_id, chat_id, title, scheduled_iso, lead_minutes, state, next_attempt_at, claimed_at))
+            if len(page) >= limit:
+                break
+        return page
+
+    def pending_reminders_page(self, after, limit, shards=None, shard_count=1):
+        start = bisect.bisect_right(self._pending, tuple(after))
+        return self._pending_page(
+            (reminder_id for _, reminder_id in itertools.islice(self._pending, start, None)), limit, shards, shard_count
+        )
+
+    def new_reminders_page(self, min_id, limit, shards=None, shard_count=1):
+        return self._pending_page(
+            sorted(reminder_id for _, reminder_id in self._pending if reminder_id > min_id), limit, shards, shard_count
+        )
+
+    def mark_sent_many(self, reminder_ids):
+        changed = 0
+        for reminder_id in reminder_ids:
+            row = self.reminders.get(reminder_id)
+            if not row or row[4]:
+                continue
+            row[4] = 1
+            key = (row[2], reminder_id)
+            for keys in (self._pending, self._chat_reminders[row[0]]):
+                index = bisect.bisect_left(keys, key)
+                if index < len(keys) and keys[index] == key:
+                    del keys[index]
+            changed += 1
+        return changed
+
+    def max_reminder_id(self):
+        return max(self.reminders, default=0)
+
+    def add_task(self, user_id, description, day_iso, created_iso, chat_id=None):
+        task_id = next(self._task_ids)
+        chat_id = user_id if chat_id is None else chat_id
+        self.tasks[task_id] = [chat_id, description, day_iso, "pending", day_iso]
+        self._day_tasks[(chat_id, day_iso)].append(task_id)
+        self._pending_by_day[day_iso].add(task_id)
+        self._users.add(user_id)
+        return task_id
+
+    def get_today_tasks(self, chat_id, day_iso):
+        rows = []
+        for task_id in self._day_tasks.get((chat_id, day_iso), ()):
+            _, description, _, status, original_day_iso = self.tasks[task_id]
+            rows.append((task_id, description, status, original_day_iso))
+        rows.sort(key=lambda row: (row[3] >= day_iso, row[3], row[0]))
+        return rows
+
+    def rollover(self, through_day_iso, to_day_iso):
+        moved = 0
+        for day_iso in [day for day in self._pending_by_day if day <= through_day_iso]:
+            for task_id in self._pending_by_day.pop(day_iso):
+                task = self.tasks[task_id]
+                self._day_tasks[(task[0], day_iso)].remove(task_id)
+                task[2] = to_day_iso
+                self._day_tasks[(task[0], to_day_iso)].append(task_id)
+                self._pending_by_day[to_day_iso].add(task_id)
+                moved += 1
+        return moved
+
+    def count_users(self):
+        return len(self._users)
+
+    def users_page(self, after_user_id, limit):
+        users = sorted(user_id for user_id in self._users if user_id > after_user_id)[:limit]
+        return [(user_id, user_id in self.dead_chats) for user_id in users]
+
+    def save_member(self, chat_id, user_id, username, first_name, joined_iso):
+        self._members[chat_id][user_id] = (username.lower() if username else None, first_name or "")
+
+    def remove_member(self, chat_id, user_id):
+        self._members[chat_id].pop(user_id, None)
+
+    def members_by_username(self, chat_id, usernames):
+        names = {name.lower() for name in usernames}
+        return {
+            username: user_id for user_id, (username, _) in self._members.get(chat_id, {}).items()
+            if username in names
+        }
+
+_backend = SQLiteStorage()
+
+def install(backend):
+    """Подменяет хранилище; возвращает прежнее"""
+    global _backend
+    previous, _backend = _backend, backend
+    return previous
+
+def current():
+    return _backend
+
+def _check_conformance(backend):
+    """Сценарии, которые обе реализации обязаны проходить одинаково"""
+    # Напоминания: выборка пользователя, порядок, отметка отправки
+    first = backend.add_reminder(1, "b", "2030-01-01T10:00:00+03:00", 5, "2030-01-01T00:00:00+03:00")
+    second = backend.add_reminder(1, "a", "2030-01-01T09:00:00+03:00", 0, "2030-01-01T00:00:00+03:00")
+    third = backend.add_reminder(2, "c", "2030-01-02T09:00:00+03:00", 10, "2030-01-01T00:00:00+03:00")
+    assert backend.max_reminder_id() == third
+    assert backend.upcoming_reminders(1, "2030-01-01T08:00:00+03:00") == [
+        ("a", "2030-01-01T09:00:00+03:00", 0), ("b", "2030-01-01T10:00:00+03:00", 5)
+    ]
+    assert backend.upcoming_reminders(1, "2030-01-01T09:00:00+03:00") == [("b", "2030-01-01T10:00:00+03:00", 5)]
+    assert backend.upcoming_reminders(3, "") == []
+
+    page = backend.pending_reminders_page(("", 0), 2)
+    assert [row[0] for row in page] == [second, first]
+    assert [row[0] for row in backend.pending_reminders_page((page[-1][3], page[-1][0]), 2)] == [third]
+    assert [row[0] for row in backend.new_reminders_page(first, 10)] == [second, third]
+    assert [row[0] for row in backend.new_reminders_page(first, 1)] == [second]
+    assert [row[0] for row in backend.new_reminders_page(second, 10, shards={0}, shard_count=2)] == [third]
+    assert [row[0] for row in backend.pending_reminders_page(("", 0), 10, shards={0}, shard_count=2)] == [third]
+    assert page[0][5] == "pending"
+
+    assert backend.mark_sent_many([second, second, 999]) == 1
+    assert backend.mark_sent_many([second]) == 0
+    assert [row[0] for row in backend.pending_reminders_page(("", 0), 10)] == [first, third]
+    assert backend.upcoming_reminders(1, "") == [("b", "2030-01-01T10:00:00+03:00", 5)]
+
+    # Задачи: выборка дня с перенесёнными первыми, перенос
+    old = backend.add_task(1, "old", "2030-01-01", "2030-01-01T08:00:00+03:00")
+    today = backend.add_task(1, "today", "2030-01-03", "2030-01-03T08:00:00+03:00")
+    backend.add_task(2, "other", "2030-01-02", "2030-01-02T08:00:00+03:00")
+    backend.add_task(1, "later", "2030-01-05", "2030-01-05T08:00:00+03:00")
+    assert backend.rollover("2030-01-02", "2030-01-03") == 2
+    assert backend.rollover("2030-01-02", "2030-01-03") == 0
+    assert backend.get_today_tasks(1, "2030-01-03") == [
+        (old, "old", "pending", "2030-01-01"), (today, "today", "pending", "2030-01-03")
+    ]
+    assert backend.get_today_tasks(1, "2030-01-01") == []
+    assert [row[1] for row in backend.get_today_tasks(2, "2030-01-03")] == ["other"]
+    assert [row[1] for row in backend.get_today_tasks(1, "2030-01-05")] == ["later"]
+
+    # Группы: общий список чата, напоминание с исполнителями, участники
+    group = -100
+    shared = backend.add_task(1, "shared", "2030-01-03", "2030-01-03T08:00:00+03:00", chat_id=group)
+    assert backend.get_today_tasks(group, "2030-01-03") == [(shared, "shared", "pending", "2030-01-03")]
+    assert shared not in [row[0] for row in backend.get_today_tasks(1, "2030-01-03")]
+    backend.save_member(group, 1, "Alice", "Алиса", "2030-01-01T00:00:00+03:00")
+    backend.save_member(group, 2, None, "Боб", "2030-01-01T00:00:00+03:00")
+    backend.save_member(group, 1, "alice", "Алиса", "2030-01-01T00:00:00+03:00")
+    assert backend.members_by_username(group, ["ALICE", "bob"]) == {"alice": 1}
+    meeting = backend.add_reminder(
+        1, "meeting", "2030-01-04T09:00:00+03:00", 0, "2030-01-01T00:00:00+03:00", chat_id=group, assignees=[2, 1, 2]
+    )
+    assert backend.upcoming_reminders(group, "") == [("meeting", "2030-01-04T09:00:00+03:00", 0)]
+    assert [row[:2] for row in backend.pending_reminders_page(("2030-01-04", 0), 10)] == [(meeting, group)]
+    assert [row[0] for row in backend.pending_reminders_page(("2030-01-04", 0), 10, shards={0}, shard_count=2)] == [meeting]
+    assert backend.reminder_assignees(meeting) == [(1, "Алиса", "alice"), (2, "Боб", None)]
+    backend.remove_member(group, 2)
+    assert backend.reminder_assignees(meeting) == [(1, "Алиса", "alice"), (2, "", None)]
+    assert backend.reminder_assignees(first) == []
+
+    # Пользователи
+    assert backend.count_users() == 2
+    assert backend.users_page(0, 1) == [(1, False)]
+    assert backend.users_page(1, 10) == [(2, False)]
+    assert backend.users_page(2, 10) == []
+
+def _benchmark(backend, users=10_000, per_user=10):
+    """Операции в секунду для основных путей хранилища"""
+    import time
+    import random
+
+    rng = random.Random(1)
+    results = {}
+
+    def timed(name, count, func):
+        started = time.perf_counter()
+        func()
+        results[name] = count / (time.perf_counter() - started)
+
+    reminders = [
+        (rng.randint(1, users), f"r{i}", f"2030-01-{rng.randint(1, 28):02d}T{rng.randint(0, 23):02d}:00:00+03:00")
+        for i in range(users * per_user // 10)
+    ]
+    tasks = [(rng.randint(1, users), f"t{i}", f"2030-01-{rng.randint(1, 7):02d}") for i in range(users * per_user)]
+
+    timed("add_reminder", len(reminders), lambda: [
+        backend.add_reminder(user_id, title, scheduled_iso, 0, "2030-01-01T00:00:00+03:00")
+        for user_id, title, scheduled_iso in reminders
+    ])
+    if isinstance(backend, SQLiteStorage):
+        # Задачи в SQLite добавляются через writer.py пачками; здесь нужен только объём
+        with get_connection() as con:
+            con.executemany(
+                "INSERT INTO tasks (user_id, description, day_iso, created_iso, original_day_iso) "
+                "VALUES (?, ?, ?, '', ?)",
+                [(user_id, description, day_iso, day_iso) for user_id, description, day_iso in tasks]
+            )
+            con.commit()
+    else:
+        timed("add_task", len(tasks), lambda: [backend.add_task(*task, "") for task in tasks])
+
+    lookups = [rng.randint(1, users) for _ in range(5000)]
+    timed("get_today_tasks", len(lookups), lambda: [backend.get_today_tasks(u, "2030-01-07") for u in lookups])
+    timed("upcoming_reminders", len(lookups), lambda: [backend.upcoming_reminders(u, "2030-01-15") for u in lookups])
+
+    def load_all():
+        after = ("", 0)
+        while True:
+            page = backend.pending_reminders_page(after, 1000)
+            if not page:
+                break
+            after = (page[-1][3], page[-1][0])
+    timed("pending_reminders_page (rows)", len(reminders), load_all)
+
+    sent = list(range(1, len(reminders) + 1, 2))
+    timed("mark_sent_many (rows)", len(sent), lambda: backend.mark_sent_many(sent))
+    started = time.perf_counter()
+    moved = backend.rollover("2030-01-06", "2030-01-07")
+    results[f"rollover ({moved} rows, seconds)"] = time.perf_counter() - started
+    return results
+
+def main():
+    import os
+    import tempfile
+    from config import Config
+    from database import init_db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = {"memory": lambda: MemoryStorage()}
+
+        def sqlite_backend():
+            # Для каждого прогона — чистая база
+            Config.DB_PATH = os.path.join(tmp, f"storage-{len(os.listdir(tmp))}.db")
+            init_db()
+            return SQLiteStorage()
+        backends["sqlite"] = sqlite_backend
+
+        for name, make in backends.items():
+            _check_conformance(make())
+            print(f"{name}: conformance passed")
+        for name, make in backends.items():
+            for operation, value in _benchmark(make()).items():
+                print(f"{name:7} {operation:34} {value:12.3f}" if "seconds" in operation else
+                      f"{name:7} {operation:34} {value:12.0f}/s")
+
+if __name__ == "__main__":
+    main()
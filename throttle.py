@@ -0,0 +1,180 @@
+# throttle.py
+"""
+Ограничение частоты обновлений от одного пользователя и сброс нагрузки.
+
+guard стоит в группе -50, до статистики и остальных обработчиков:
+  * у каждого пользователя своя корзина токенов (ratelimit.TokenBucket,
+    Config.USER_RATE в секунду со всплеском до Config.USER_BURST); лишние
+    обновления отбрасываются, кнопкам отвечается без работы с базой;
+  * переключение месяца в календаре сглаживается: первое нажатие рисуется сразу,
+    следующие в пределах Config.DEBOUNCE_MS копятся, и рисуется только последнее;
+  * при перегрузке (очередь обновлений или задержка цикла событий выше порога)
+    отбрасываются обновления низкого приоритета.
+
+Доставка напоминаний идёт задачами планировщика, а не обновлениями, и через guard
+не проходит — её перегрузка не задерживает. Администратор не ограничивается.
+Метрики: throttle.limited, throttle.debounced, throttle.shed.
+"""
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+from config import Config
+from ratelimit import TokenBucket
+import callbacks
+import metrics
+import watchdog
+
+logger = logging.getLogger(__name__)
+
+class _UserState:
+    __slots__ = ("bucket", "warned")
+
+    def __init__(self):
+        self.bucket = TokenBucket(Config.USER_RATE, capacity=Config.USER_BURST)
+        # Предупреждение об ограничении отправляется один раз до восстановления корзины
+        self.warned = False
+
+class _Render:
+    """Отрисовка календаря одного сообщения: время последней и отложенное нажатие"""
+    __slots__ = ("rendered_at", "pending", "task")
+
+    def __init__(self):
+        self.rendered_at = 0.0
+        self.pending = None
+        self.task = None
+
+# user_id -> _UserState; самые давние вытесняются после Config.USER_BUCKETS_MAX
+_users = OrderedDict()
+# (chat_id, message_id) -> _Render
+_renders = {}
+
+# Задаются в install: обработчик кнопок и признаки низкого приоритета
+_render_callback = None
+_low_priority_texts = frozenset()
+_low_priority_actions = frozenset()
+
+def install(render_callback, low_priority_texts=(), low_priority_actions=()):
+    """render_callback рисует отложенное переключение месяца (маршрутизатор кнопок)"""
+    global _render_callback, _low_priority_texts, _low_priority_actions
+    _render_callback = render_callback
+    _low_priority_texts = frozenset(low_priority_texts)
+    _low_priority_actions = frozenset(low_priority_actions)
+
+def _user_state(user_id):
+    state = _users.get(user_id)
+    if state is None:
+        state = _users[user_id] = _UserState()
+        if len(_users) > Config.USER_BUCKETS_MAX:
+            _users.popitem(last=False)
+    else:
+        _users.move_to_end(user_id)
+    return state
+
+def overloaded(app):
+    """Очередь необработанных обновлений или задержка цикла событий выше порога"""
+    return (
+        app.update_queue.qsize() >= Config.SHED_QUEUE_DEPTH
+        or watchdog.last_lag * 1000 >= Config.SHED_LAG_MS
+    )
+
+def _callback_action(query):
+    try:
+        return callbacks.decode(query.data or "")[0]
+    except callbacks.CallbackError:
+        # Устаревшую кнопку разберёт маршрутизатор
+        return None
+
+def _is_low_priority(update, action):
+    if update.callback_query:
+        return action in _low_priority_actions
+    message = update.effective_message
+    if message and message.text:
+        return message.text.split(maxsplit=1)[0] in _low_priority_texts
+    return False
+
+async def _answer(query, text=None):
+    try:
+        await query.answer(text)
+    except Exception as e:
+        # Запрос кнопки мог устареть, пока обновление ждало в очереди
+        logger.debug(f"Failed to answer throttled callback: {e}")
+
+async def _render_later(key, render):
+    try:
+        await asyncio.sleep(max(render.rendered_at + Config.DEBOUNCE_MS / 1000 - time.monotonic(), 0))
+        update, context = render.pending
+        render.pending = None
+        render.rendered_at = time.monotonic()
+        await _render_callback(update, context)
+    except Exception as e:
+        logger.error(f"Debounced render failed: {e}")
+    finally:
+        render.task = None
+
+async def _debounce(update, context):
+    """True, если нажатие отложено или заменено более поздним"""
+    message = update.callback_query.message
+    if message is None or _render_callback is None:
+        return False
+    key = (message.chat_id, message.message_id)
+    now = time.monotonic()
+    window = Config.DEBOUNCE_MS / 1000
+
+    render = _renders.get(key)
+    if render is None:
+        if len(_renders) >= 1024:
+            # Сообщения, календарь которых давно не трогали, больше не нужны
+            for stale in [k for k, r in _renders.items() if r.task is None and now - r.rendered_at > window]:
+                del _renders[stale]
+        render = _renders[key] = _Render()
+    if render.task is None and now - render.rendered_at >= window:
+        render.rendered_at = now
+        return False
+
+    if render.pending:
+        # Более раннее отложенное нажатие уже не нужно рисовать
+        metrics.inc("throttle.debounced")
+        await _answer(render.pending[0].callback_query)
+    render.pending = (update, context)
+    if render.task is None:
+        render.task = asyncio.create_task(_render_later(key, render))
+    return True
+
+async def flush():
+    """Дожидается отложенных отрисовок календаря"""
+    tasks = [render.task for render in _renders.values() if render.task]
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик группы -50: отбрасывает лишние обновления через ApplicationHandlerStop"""
+    user = update.effective_user
+    if user is None or user.id == Config.ADMIN_ID:
+        return
+    query = update.callback_query
+    action = _callback_action(query) if query else None
+
+    if _is_low_priority(update, action) and overloaded(context.application):
+        metrics.inc("throttle.shed")
+        if query:
+            await _answer(query, "⏳ Бот перегружен, попробуйте чуть позже.")
+        raise ApplicationHandlerStop
+
+    state = _user_state(user.id)
+    if not state.bucket.try_acquire():
+        metrics.inc("throttle.limited")
+        if query:
+            await _answer(query, "⏳ Слишком часто, подождите немного.")
+        elif not state.warned and update.effective_message:
+            state.warned = True
+            try:
+                await update.effective_message.reply_text("⏳ Слишком много сообщений подряд, подождите немного.")
+            except Exception as e:
+                logger.debug(f"Failed to warn throttled user: {e}")
+        raise ApplicationHandlerStop
+    state.warned = False
+
+    if action == callbacks.CHANGE_MONTH and await _debounce(update, context):
+        raise ApplicationHandlerStop
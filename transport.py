@@ -0,0 +1,138 @@
+# transport.py
+"""
+Соединения с Bot API: размер пула, keep-alive, тайм-ауты и версия HTTP из Config.
+
+Исходящие вызовы и getUpdates идут через разные объекты запросов: долгий опрос
+занимает своё соединение и не ждёт в очереди за отправками, а отправки не ждут
+за ним. Время каждого исходящего вызова пишется в метрику api.<метод>, ошибки —
+в счётчик api.<метод>.errors (видно в /stats).
+
+Замер пропускной способности отправки при разных размерах пула: python transport.py
+"""
+import time
+import socket
+import httpx
+from telegram.request import HTTPXRequest
+from config import Config
+import metrics
+
+class MeteredRequest(HTTPXRequest):
+    """HTTPXRequest с настраиваемым keep-alive и замером времени по методам API"""
+
+    def __init__(self, connection_pool_size, keepalive_connections=None, keepalive_expiry=None,
+                 metered=True, **kwargs):
+        # Устанавливается до super().__init__: клиент создаётся уже там
+        self._limits = httpx.Limits(
+            max_connections=connection_pool_size,
+            max_keepalive_connections=(
+                connection_pool_size if keepalive_connections is None else keepalive_connections
+            ),
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._metered = metered
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    def _build_client(self):
+        self._client_kwargs["limits"] = self._limits
+        return super()._build_client()
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        if not self._metered:
+            return await super().do_request(url, method, request_data, **kwargs)
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, request_data, **kwargs)
+        except Exception:
+            metrics.inc(f"api.{api_method}.errors")
+            raise
+        finally:
+            metrics.observe(f"api.{api_method}", time.perf_counter() - started)
+
+def _timeouts():
+    return {
+        "connect_timeout": Config.API_CONNECT_TIMEOUT,
+        "read_timeout": Config.API_READ_TIMEOUT,
+        "write_timeout": Config.API_WRITE_TIMEOUT,
+        "pool_timeout": Config.API_POOL_TIMEOUT,
+    }
+
+def build_request():
+    """Запросы для исходящих вызовов: отправки, правки, ответы на кнопки"""
+    return MeteredRequest(
+        Config.API_POOL_SIZE,
+        keepalive_connections=Config.API_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=Config.API_KEEPALIVE_EXPIRY,
+        http_version=Config.API_HTTP_VERSION,
+        **_timeouts(),
+    )
+
+def build_updates_request():
+    """Запрос getUpdates: одно соединение; время долгого опроса в метрики не пишется"""
+    return MeteredRequest(
+        1,
+        keepalive_expiry=Config.API_KEEPALIVE_EXPIRY,
+        http_version=Config.API_HTTP_VERSION,
+        metered=False,
+        **_timeouts(),
+    )
+
+def _benchmark():
+    """Отправка сообщений через имитацию Bot API (50 мс на ответ) при разных пулах.
+
+    Имитация запускается отдельным процессом, чтобы её потоки не делили GIL с
+    клиентом. Отправителей столько же, сколько одновременных отправок у бота
+    (рассылка, сводка, доставка), а не тысячи: при очереди ожидающих запросов
+    пул httpcore тратит процессор на перебор соединений.
+    """
+    import os
+    import sys
+    import asyncio
+    import subprocess
+    from telegram import Bot
+
+    latency = 0.05
+    messages = 320
+    senders = 16
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_api.py"),
+         "--port", str(port), "--latency", str(latency)],
+        stdout=subprocess.DEVNULL,
+    )
+
+    async def run(pool_size, keepalive):
+        request = MeteredRequest(pool_size, keepalive_connections=pool_size if keepalive else 0, pool_timeout=60)
+        semaphore = asyncio.Semaphore(senders)
+
+        async def send(chat_id):
+            async with semaphore:
+                await bot.send_message(chat_id=chat_id, text="x")
+
+        bot = Bot("123456:bench", base_url=f"http://127.0.0.1:{port}/bot", request=request)
+        async with bot:
+            started = time.perf_counter()
+            cpu = time.process_time()
+            await asyncio.gather(*(send(i) for i in range(messages)))
+            return messages / (time.perf_counter() - started), (time.process_time() - cpu) / messages
+
+    try:
+        for _ in range(50):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        print(f"{messages} sendMessage, {senders} senders, fake API latency {latency * 1000:.0f} ms")
+        for pool_size in (1, 4, 8, 16, 32):
+            for keepalive in (True, False):
+                rate, cpu = asyncio.run(run(pool_size, keepalive))
+                print(f"pool {pool_size:3}, keep-alive {'on ' if keepalive else 'off'}: "
+                      f"{rate:6.1f} msg/s, client CPU {cpu * 1000:.2f} ms/msg")
+    finally:
+        server.terminate()
+
+if __name__ == "__main__":
+    _benchmark()
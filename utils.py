@@ -1,12 +1,14 @@
 # utils.py
 import os
+import hashlib
 import logging
-from datetime import datetime, date
-from zoneinfo import ZoneInfo
-from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.error import BadRequest
 from config import Config
+import callbacks
+import clock
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +16,9 @@ def ensure_profile_image():
     if os.path.exists(Config.PROFILE_PNG): 
         return
     
+    # Pillow нужен только для первой генерации картинки, поэтому не замедляет запуск
+    from PIL import Image, ImageDraw, ImageFont
+    
     img = Image.new("RGB", (512, 512), (40, 120, 200))
     draw = ImageDraw.Draw(img)
     
@@ -37,50 +42,127 @@ def ensure_profile_image():
     logger.info("Generated profile image at %s", Config.PROFILE_PNG)
 
 def user_now():
-    return datetime.now(ZoneInfo(Config.TZ))
+    return clock.now()
 
-async def safe_edit_message(message, text=None, reply_markup=None):
-    try:
+# Подпись к медиа ограничена 1024 символами, длинный текст отправляется новым сообщением
+CAPTION_LIMIT = 1024
+
+# Длиннее Telegram не принимает: отчёт делится на несколько сообщений
+MESSAGE_LIMIT = 4096
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Делит текст на части не длиннее limit, по возможности по границам строк"""
+    parts = []
+    current = ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+KIND_TEXT = "text"
+KIND_MEDIA = "media"
+
+def _digest(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+
+def _markup_digest(reply_markup):
+    return _digest(reply_markup.to_json() if reply_markup else "")
+
+class MessageCache:
+    """LRU сообщений бота: (chat_id, message_id) -> (вид, хэш текста, хэш клавиатуры).
+
+    Вид сообщения определяет метод правки без пробных запросов, а хэши последней
+    отрисовки позволяют не отправлять правку, которая ничего не меняет.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+    
+    def get(self, message):
+        key = (message.chat_id, message.message_id)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            return entry
+        # Сообщение из callback-запроса несёт своё текущее содержимое
         has_media = bool(
-            getattr(message, "photo", None) or 
-            getattr(message, "video", None) or 
-            getattr(message, "document", None)
+            getattr(message, "photo", None) or
+            getattr(message, "video", None) or
+            getattr(message, "document", None) or
+            getattr(message, "animation", None)
         )
-        
-        if text is None:
-            try:
-                await message.edit_reply_markup(reply_markup=reply_markup)
-                return
-            except BadRequest as e:
-                if "Message is not modified" in str(e): 
-                    return
+        text = (message.caption if has_media else message.text) or ""
+        return (KIND_MEDIA if has_media else KIND_TEXT, _digest(text), _markup_digest(message.reply_markup))
+    
+    def put(self, message, kind, text_digest, markup_digest):
+        key = (message.chat_id, message.message_id)
+        self._entries[key] = (kind, text_digest, markup_digest)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def remember(self, message, text, reply_markup):
+        """Запоминает только что отправленное текстовое сообщение"""
+        if message is not None:
+            self.put(message, KIND_TEXT, _digest(text), _markup_digest(reply_markup))
+
+message_cache = MessageCache(Config.MESSAGE_CACHE_SIZE)
+
+async def safe_edit_message(message, text=None, reply_markup=None):
+    """Правит сообщение подходящим методом, пропуская правки без изменений.
+
+    Если правка невозможна (подпись слишком длинная, сообщение удалено), отправляет новое.
+    """
+    kind, text_digest, markup_digest = message_cache.get(message)
+    new_markup_digest = _markup_digest(reply_markup)
+    new_text_digest = text_digest if text is None else _digest(text)
+    
+    if new_text_digest == text_digest and new_markup_digest == markup_digest:
+        metrics.inc("edit.skipped")
+        return
+    
+    try:
+        if text is None or new_text_digest == text_digest:
+            await message.edit_reply_markup(reply_markup=reply_markup)
+        elif kind == KIND_MEDIA and len(text) <= CAPTION_LIMIT:
+            await message.edit_caption(caption=text, reply_markup=reply_markup)
+        elif kind == KIND_TEXT:
+            await message.edit_text(text, reply_markup=reply_markup)
         else:
-            if has_media:
-                try:
-                    await message.edit_caption(caption=text, reply_markup=reply_markup)
-                    return
-                except BadRequest as e:
-                    if "There is no text in the message to edit" in str(e):
-                        await message.reply_text(text, reply_markup=reply_markup)
-                        return
-                    if "Message is not modified" in str(e): 
-                        return
-            else:
-                try:
-                    await message.edit_text(text, reply_markup=reply_markup)
-                    return
-                except BadRequest as e:
-                    if "Message is not modified" in str(e): 
-                        return
-        
-        # Fallback: send new message
-        await message.reply_text(text or "", reply_markup=reply_markup)
+            sent = await message.reply_text(text, reply_markup=reply_markup)
+            message_cache.remember(sent, text, reply_markup)
+            return
+        message_cache.put(message, kind, new_text_digest, new_markup_digest)
+        return
+    except BadRequest as e:
+        if "not modified" in str(e):
+            # Кэш отстал от сообщения (например, после перезапуска), содержимое уже совпадает
+            message_cache.put(message, kind, new_text_digest, new_markup_digest)
+            return
+        logger.warning(f"safe_edit_message: edit failed, sending new message: {e}")
+    except Exception:
+        logger.exception("safe_edit_message edit failed")
+    
+    if text is None:
+        return
+    
+    # Fallback: send new message
+    try:
+        sent = await message.reply_text(text, reply_markup=reply_markup)
+        message_cache.remember(sent, text, reply_markup)
     except Exception:
         logger.exception("safe_edit_message fallback failed")
-        try: 
-            await message.reply_text(text or "", reply_markup=reply_markup)
-        except Exception: 
-            logger.exception("safe_edit_message double fallback failed")
 
 def build_hours_keyboard():
     """Создает клавиатуру со всеми 24 часами на одной странице (4x6)"""
@@ -88,10 +170,10 @@ def build_hours_keyboard():
     # Создаем 6 строк по 4 часа
     for i in range(0, 24, 4):
         row = [
-            InlineKeyboardButton(f"{h:02d}🕒", callback_data=f"hoursel:{h}")
+            InlineKeyboardButton(f"{h:02d}🕒", callback_data=callbacks.hour_select(h))
             for h in range(i, i + 4)
         ]
         buttons.append(row)
     
-    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="open_calendar:create_reminder")])
+    buttons.append([InlineKeyboardButton("🔙 Назад", callback_data=callbacks.open_calendar("create_reminder"))])
     return InlineKeyboardMarkup(buttons)
\ No newline at end of file
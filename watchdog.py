@@ -0,0 +1,164 @@
+# watchdog.py
+"""
+Контроль задержки цикла событий и профилирование по запросу администратора.
+
+Сердцебиение в цикле событий раз в Config.LOOP_LAG_INTERVAL_MS отмечает время и
+пишет задержку пробуждения в метрику loop.lag. Фоновый поток проверяет отметку:
+если цикл не отвечает дольше Config.LOOP_STALL_MS, снимается стек потока цикла —
+видно, какой синхронный вызов (sqlite, Pillow, логирование) его держит.
+
+/profile cpu N — cProfile потока цикла на N секунд, /profile mem N — разница
+снимков tracemalloc; результат возвращается документом.
+"""
+import io
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import logging
+import threading
+import traceback
+import tracemalloc
+from collections import deque
+from config import Config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Последние зависания: {"at", "duration", "stack"}
+stalls = deque(maxlen=20)
+
+_last_beat = 0.0
+# Задержка последнего пробуждения, секунды; по ней throttle.py определяет перегрузку
+last_lag = 0.0
+_loop_thread_id = None
+_heartbeat_task = None
+_stop_event = threading.Event()
+_thread = None
+_profiling = False
+
+async def _heartbeat():
+    global _last_beat, last_lag
+    interval = Config.LOOP_LAG_INTERVAL_MS / 1000
+    while True:
+        expected = time.monotonic() + interval
+        await asyncio.sleep(interval)
+        now = time.monotonic()
+        lag = max(now - expected, 0.0)
+        last_lag = lag
+        metrics.observe("loop.lag", lag)
+        if lag * 1000 >= Config.LOOP_STALL_MS and stalls and stalls[-1]["duration"] is None:
+            # Зависание закончилось: фиксируем его полную длительность
+            stalls[-1]["duration"] = lag
+            metrics.inc("loop.stalls")
+            logger.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+        _last_beat = now
+
+def _capture_stack():
+    frame = sys._current_frames().get(_loop_thread_id)
+    if frame is None:
+        return ""
+    return "".join(traceback.format_stack(frame))
+
+def _watch():
+    threshold = Config.LOOP_STALL_MS / 1000
+    captured_for = None
+    while not _stop_event.wait(min(threshold / 2, 0.5)):
+        beat = _last_beat
+        if time.monotonic() - beat < threshold or beat == captured_for:
+            continue
+        # Одно зависание — один снимок стека, снятый пока цикл ещё занят
+        captured_for = beat
+        stalls.append({"at": time.time(), "duration": None, "stack": _capture_stack()})
+
+def start():
+    """Запускает сердцебиение в текущем цикле событий и поток наблюдения"""
+    global _heartbeat_task, _thread, _loop_thread_id, _last_beat
+    if _thread:
+        return
+    _loop_thread_id = threading.get_ident()
+    _last_beat = time.monotonic()
+    _heartbeat_task = asyncio.get_running_loop().create_task(_heartbeat())
+    _stop_event.clear()
+    _thread = threading.Thread(target=_watch, name="loop-watchdog", daemon=True)
+    _thread.start()
+
+def stop():
+    global _heartbeat_task, _thread
+    if _heartbeat_task:
+        _heartbeat_task.cancel()
+        _heartbeat_task = None
+    if _thread:
+        _stop_event.set()
+        _thread.join(timeout=2)
+        _thread = None
+
+def format_lag(limit=3):
+    """Сводка для /lag: задержка цикла и стеки последних зависаний"""
+    timing = metrics.snapshot()["timings"].get("loop.lag")
+    lines = []
+    if timing:
+        lines.append(
+            f"Задержка цикла: p50 {timing['p50'] * 1000:.1f} мс, p95 {timing['p95'] * 1000:.1f} мс, "
+            f"макс. {timing['max'] * 1000:.0f} мс ({timing['count']} замеров)"
+        )
+    else:
+        lines.append("Замеров задержки ещё нет.")
+    lines.append(f"Зависаний дольше {Config.LOOP_STALL_MS:.0f} мс: {len(stalls)}")
+    for stall in list(stalls)[-limit:]:
+        duration = f"{stall['duration'] * 1000:.0f} мс" if stall["duration"] else "продолжается"
+        at = time.strftime("%d.%m %H:%M:%S", time.localtime(stall["at"]))
+        # Самые глубокие кадры — то, что выполнялось в момент зависания
+        frames = stall["stack"].strip().splitlines()[-6:]
+        lines.append(f"\n{at}, {duration}:\n" + "\n".join(frames))
+    return "\n".join(lines)
+
+class ProfileBusy(Exception):
+    pass
+
+async def profile_cpu(seconds, top=40):
+    """cProfile потока цикла событий на seconds секунд; текст отчёта"""
+    global _profiling
+    if _profiling:
+        raise ProfileBusy()
+    _profiling = True
+    profiler = cProfile.Profile()
+    try:
+        # Профилируется поток, в котором выполняются все обработчики и задачи цикла
+        profiler.enable()
+        await asyncio.sleep(seconds)
+        profiler.disable()
+    finally:
+        _profiling = False
+
+    out = io.StringIO()
+    out.write(f"cProfile, {seconds} s\n\n")
+    for sort in ("cumulative", "tottime"):
+        out.write(f"=== by {sort} ===\n")
+        pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(top)
+    return out.getvalue()
+
+async def profile_memory(seconds, top=30):
+    """Разница снимков tracemalloc за seconds секунд и крупнейшие текущие выделения"""
+    global _profiling
+    if _profiling:
+        raise ProfileBusy()
+    _profiling = True
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(10)
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _profiling = False
+
+    lines = [f"tracemalloc, {seconds} s", "", "=== growth ==="]
+    lines.extend(str(stat) for stat in after.compare_to(before, "lineno")[:top])
+    lines.extend(["", "=== largest ==="])
+    lines.extend(str(stat) for stat in after.statistics("lineno")[:top])
+    return "\n".join(lines)